@@ -0,0 +1,121 @@
+"""Measure the memory a parsed syntax tree holds on to.
+
+A large generated program is scanned once, then parsed with and without
+hash-consing. For each the bytes still traced once parsing finishes are
+reported, along with how many node references the tree holds and how many
+distinct nodes they point to.
+
+    uv run benchmarks/ast_memory.py [--megabytes N]
+"""
+
+import argparse
+import dataclasses
+import pathlib
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "lox"))
+
+import errors  # noqa: E402
+from parser import Parser  # noqa: E402
+from scanner import Scanner  # noqa: E402
+
+SNIPPETS = [
+    """
+fun areaNAME(w, h) {
+    var scale = 1.5;
+    if (w < 0 or h < 0) return nil;
+    return w * h * scale + (2 * 3.14159) * (2 * 3.14159);
+}
+""",
+    """
+class ShapeNAME {
+    init(sides) {
+        this.sides = sides;
+        this.label = "shape";
+        this.visible = true;
+    }
+
+    angle() {
+        return (this.sides - 2) * 180 / this.sides;
+    }
+}
+""",
+    """
+var totalNAME = 0;
+for (var i = 0; i < 100; i = i + 1) {
+    if (i == 0 or i == 1) totalNAME = totalNAME + 1; else totalNAME = totalNAME + i;
+}
+print totalNAME == nil or -1 * -1 == 1 and !false;
+""",
+]
+
+
+def generate(megabytes: float) -> str:
+    """Build a program of about this size from varied snippets."""
+    rng = random.Random(0)
+    size = int(megabytes * 1024 * 1024)
+    parts = []
+    total = 0
+    while total < size:
+        part = rng.choice(SNIPPETS).replace("NAME", str(rng.randrange(1_000_000)))
+        parts.append(part)
+        total += len(part)
+    return "".join(parts)
+
+
+def count(statements: list) -> tuple[int, int]:
+    """The node references below `statements`, and the distinct nodes."""
+    references = 0
+    seen = set()
+    pending = list(statements)
+    while pending:
+        node = pending.pop()
+        references += 1
+        seen.add(id(node))
+        for field in dataclasses.fields(node):
+            value = getattr(node, field.name)
+            if isinstance(value, list):
+                pending.extend(item for item in value if hasattr(item, "accept"))
+            elif hasattr(value, "accept"):
+                pending.append(value)
+    return references, len(seen)
+
+
+def measure(source: str, hash_cons: bool) -> tuple[float, int, int, int]:
+    tokens = Scanner(source).scan_tokens()
+    start = time.perf_counter()
+    Parser(tokens, hash_cons).parse()
+    elapsed = time.perf_counter() - start
+    # Tracing slows parsing down, so the tree is parsed again to be measured.
+    tracemalloc.start()
+    statements = Parser(tokens, hash_cons).parse()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if errors.is_error():
+        raise SystemExit("the generated program did not parse")
+    references, nodes = count(statements)
+    return elapsed, size, references, nodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megabytes", type=float, default=4)
+    args = parser.parse_args()
+
+    source = generate(args.megabytes)
+    print(f"{len(source) / 1024 / 1024:.1f} MB of source")
+    for label, hash_cons in (("plain", False), ("hash-consed", True)):
+        elapsed, size, references, nodes = measure(source, hash_cons)
+        print(
+            f"{label:>12}: {size / 1024 / 1024:7.1f} MB, "
+            f"{size / references:5.1f} bytes per node reference, "
+            f"{references:,} references to {nodes:,} nodes, "
+            f"parsed in {elapsed:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
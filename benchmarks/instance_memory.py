@@ -0,0 +1,106 @@
+"""Measure memory per instance and field access speed on each execution engine.
+
+The memory program keeps a binary tree of small objects alive and reports
+the bytes traced per node. The access program reads and writes fields in a
+loop.
+
+    uv run benchmarks/instance_memory.py [--depth N] [--iterations N]
+"""
+
+import argparse
+import contextlib
+import io
+import pathlib
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "lox"))
+
+import errors  # noqa: E402
+from main import ENGINES  # noqa: E402
+from parser import Parser  # noqa: E402
+from resolver import Resolver  # noqa: E402
+from scanner import Scanner  # noqa: E402
+
+TREE = """
+class Node {
+    init(left, right, item) {
+        this.left = left;
+        this.right = right;
+        this.item = item;
+    }
+}
+
+fun make(depth) {
+    if (depth == 0) return Node(nil, nil, 0);
+    return Node(make(depth - 1), make(depth - 1), depth);
+}
+
+var tree = make(DEPTH);
+"""
+
+ACCESS = """
+class Point {
+    init(x, y) {
+        this.x = x;
+        this.y = y;
+    }
+}
+
+var p = Point(0, 0);
+for (var i = 0; i < ITERATIONS; i = i + 1) {
+    p.x = p.x + p.y;
+    p.y = i;
+}
+"""
+
+
+def prepare(engine: str, source: str):
+    interpreter = ENGINES[engine]()
+    statements = Parser(Scanner(source).scan_tokens()).parse()
+    Resolver(interpreter)._resolve(statements)
+    if errors.is_error():
+        raise SystemExit("benchmark program failed to compile")
+    return interpreter, statements
+
+
+def bytes_per_node(engine: str, depth: int) -> float:
+    interpreter, statements = prepare(engine, TREE.replace("DEPTH", str(depth)))
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    interpreter.interpret(statements)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / (2 ** (depth + 1) - 1)
+
+
+def access_time(engine: str, iterations: int) -> float:
+    source = ACCESS.replace("ITERATIONS", str(iterations))
+    interpreter, statements = prepare(engine, source)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        interpreter.interpret(statements)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--depth", type=int, default=14)
+    parser.add_argument("--iterations", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--engine", choices=ENGINES.keys(), action="append")
+    args = parser.parse_args()
+
+    for engine in args.engine or ENGINES.keys():
+        memory = bytes_per_node(engine, args.depth)
+        best = min(access_time(engine, args.iterations) for _ in range(args.repeat))
+        per_iteration = best / args.iterations * 1e9
+        print(
+            f"{engine:8} {memory:8.0f} bytes/instance"
+            f"  {per_iteration:8.0f} ns/field loop iteration"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Measure scanner throughput on large generated programs.
+
+Each scanner reads the same few megabytes of source, and their tokens are
+checked to be identical before any timing is reported.
+
+    uv run benchmarks/scanner_throughput.py [--megabytes N] [--repeat N]
+"""
+
+import argparse
+import pathlib
+import random
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "lox"))
+
+import errors  # noqa: E402
+from scanner import CharacterScanner, Scanner  # noqa: E402
+
+SCANNERS = {
+    "regex": Scanner,
+    "character": CharacterScanner,
+}
+
+SNIPPETS = [
+    """
+// Sum the first NAME numbers.
+fun sumNAME(n) {
+    var total = 0;
+    for (var i = 0; i <= n; i = i + 1) {
+        total = total + i * 2.5 - (i / 3);
+    }
+    return total;
+}
+""",
+    """
+class PointNAME {
+    init(x, y) {
+        this.x = x;
+        this.y = y;
+    }
+
+    equals(other) {
+        return this.x == other.x and this.y == other.y or !true;
+    }
+}
+""",
+    """
+var messageNAME = "a string spanning
+two lines, NAME";
+if (messageNAME != nil and 12345.678 >= 0) print messageNAME; else print false;
+""",
+    """
+while (countNAME > 0) {
+    countNAME = countNAME - 1;  // Count down.
+    if (countNAME < 10) print "nearly done"; else { print countNAME; }
+}
+""",
+]
+
+
+def generate(megabytes: float) -> str:
+    """Build a program of about this size from varied snippets."""
+    rng = random.Random(0)
+    size = int(megabytes * 1024 * 1024)
+    parts = []
+    total = 0
+    while total < size:
+        part = rng.choice(SNIPPETS).replace("NAME", str(rng.randrange(1_000_000)))
+        parts.append(part)
+        total += len(part)
+    return "".join(parts)
+
+
+def scan(scanner: type, source: str) -> tuple[float, list[tuple]]:
+    start = time.perf_counter()
+    tokens = scanner(source).scan_tokens()
+    elapsed = time.perf_counter() - start
+    return elapsed, [
+        (token.type, token.lexeme, token.literal, token.line) for token in tokens
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megabytes", type=float, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    source = generate(args.megabytes)
+    megabytes = len(source) / (1024 * 1024)
+    reference = None
+    for name, scanner in SCANNERS.items():
+        times = []
+        for _ in range(args.repeat):
+            elapsed, tokens = scan(scanner, source)
+            times.append(elapsed)
+        if errors.is_error():
+            raise SystemExit("benchmark program failed to scan")
+        if reference is None:
+            reference = tokens
+        elif tokens != reference:
+            raise SystemExit(f"{name} scanner disagrees with the others")
+        best = min(times)
+        print(
+            f"{name:10} {best:8.3f}s  {megabytes / best:8.2f} MB/s  "
+            f"{len(tokens) / best / 1e6:6.2f} M tokens/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
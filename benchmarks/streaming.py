@@ -0,0 +1,105 @@
+"""Compare running a large generated script whole and with `--stream`.
+
+Each run is a separate process. Its peak memory is reported, along with how
+long it took to print its first line and to finish. The script declares a
+few functions and classes, then runs many short top-level statements.
+
+    uv run benchmarks/streaming.py [--megabytes N]
+"""
+
+import argparse
+import os
+import pathlib
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+MAIN = pathlib.Path(__file__).resolve().parent.parent / "lox" / "main.py"
+
+PRELUDE = """
+print "started";
+
+fun scale(n, factor) {
+    return n * factor + 1;
+}
+
+class Counter {
+    init() {
+        this.count = 0;
+    }
+
+    add(n) {
+        this.count = this.count + n;
+        return this;
+    }
+}
+
+var counter = Counter();
+var total = 0;
+"""
+
+SNIPPETS = [
+    "total = total + scale(NAME, 2);\n",
+    "counter.add(NAME);\n",
+    "{ var i = 0; while (i < 3) { i = i + 1; total = total + i; } }\n",
+    'var nameNAME = "item NAME";\n',
+    "if (total < 0) print total; else total = total - NAME;\n",
+]
+
+
+def generate(path: str, megabytes: float):
+    """Write a script of about this size, printing now and then."""
+    rng = random.Random(0)
+    size = int(megabytes * 1024 * 1024)
+    with open(path, "w") as f:
+        total = f.write(PRELUDE)
+        lines = 0
+        while total < size:
+            snippet = rng.choice(SNIPPETS).replace("NAME", str(rng.randrange(1000)))
+            total += f.write(snippet)
+            lines += 1
+            if lines % 100_000 == 0:
+                total += f.write(f'print "{lines} lines";\n')
+        f.write("print counter.count;\n")
+
+
+def run(path: str, *options: str) -> tuple[float, float, float]:
+    """Run the script: its peak memory in MB, and seconds to first output and exit."""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, str(MAIN), *options, path],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    process.stdout.readline()
+    first = time.perf_counter() - start
+    process.stdout.read()
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    if status:
+        raise SystemExit(f"the script failed with {' '.join(options)}")
+    # Linux reports the peak resident size in kilobytes.
+    return usage.ru_maxrss / 1024, first, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megabytes", type=float, nargs="+", default=[2, 8])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for megabytes in args.megabytes:
+            path = os.path.join(directory, "script.lox")
+            generate(path, megabytes)
+            for label, option in (("whole", "--no-cache"), ("--stream", "--stream")):
+                peak, first, elapsed = run(path, option)
+                print(
+                    f"{megabytes:5.1f} MB {label:>8}: peak {peak:7.1f} MB, "
+                    f"first output after {first:6.2f}s, done in {elapsed:6.2f}s"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Time variable-heavy loops on each execution engine.
+
+Every variable read and assignment in these programs goes through the
+resolver's side table, so they show the cost of a resolution lookup.
+
+    uv run benchmarks/variable_lookup.py [--iterations N] [--repeat N]
+"""
+
+import argparse
+import contextlib
+import io
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "lox"))
+
+import errors  # noqa: E402
+from main import ENGINES  # noqa: E402
+from parser import Parser  # noqa: E402
+from resolver import Resolver  # noqa: E402
+from scanner import Scanner  # noqa: E402
+
+PROGRAMS = {
+    "locals": """
+{
+    var a = 1;
+    var b = 2;
+    var c = 3;
+    var total = 0;
+    for (var i = 0; i < ITERATIONS; i = i + 1) {
+        total = total + a * b - c;
+        a = b;
+        b = c;
+        c = total - a;
+    }
+}
+""",
+    "closure": """
+fun run() {
+    var total = 0;
+    var step = 1;
+    fun add(n) {
+        total = total + n * step;
+    }
+    for (var i = 0; i < ITERATIONS; i = i + 1) {
+        add(i);
+    }
+    return total;
+}
+run();
+""",
+    "globals": """
+var a = 1;
+var b = 2;
+var total = 0;
+for (var i = 0; i < ITERATIONS; i = i + 1) {
+    total = total + a - b;
+}
+""",
+}
+
+
+def run(engine: str, source: str) -> float:
+    interpreter = ENGINES[engine]()
+    statements = Parser(Scanner(source).scan_tokens()).parse()
+    Resolver(interpreter)._resolve(statements)
+    if errors.is_error():
+        raise SystemExit("benchmark program failed to compile")
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        interpreter.interpret(statements)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--engine", choices=ENGINES.keys(), action="append")
+    args = parser.parse_args()
+
+    for engine in args.engine or ENGINES.keys():
+        for name, program in PROGRAMS.items():
+            source = program.replace("ITERATIONS", str(args.iterations))
+            best = min(run(engine, source) for _ in range(args.repeat))
+            per_iteration = best / args.iterations * 1e9
+            print(
+                f"{engine:8} {name:8} {best:8.3f}s  {per_iteration:8.0f} ns/iteration"
+            )
+
+
+if __name__ == "__main__":
+    main()
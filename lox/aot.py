@@ -0,0 +1,123 @@
+import math
+import os
+import typing
+
+import expr
+import interpreter
+import stmt
+import tokens
+import transpiler
+
+# Where the runtime modules that compiled programs import live.
+RUNTIME_PATH = os.path.dirname(os.path.abspath(__file__))
+
+_HEADER = '''\
+"""{source}, compiled by `lox compile`. Do not edit.
+
+Run it with `python {module}`, or import it and call `run()`.
+"""
+import sys
+
+if {runtime!r} not in sys.path:
+    sys.path.insert(0, {runtime!r})
+
+import errors
+import expr
+import interpreter
+import stmt
+import tiering
+from tokens import Token as _Token
+from tokens import TokenType as _TokenType
+
+_interpreter = interpreter.Interpreter()
+globals().update(tiering.namespace(_interpreter))
+'''
+
+_FOOTER = '''
+
+
+def run() -> int:
+    """Run the program, returning its exit status as `Lox.runFile` does."""
+    try:
+        lox_script()
+    except errors.RuntimeError as e:
+        errors.runtime_error(e)
+        return 70
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
+'''
+
+
+def module(
+    interpret: interpreter.Interpreter, statements: list[typing.Any], source: str
+) -> str:
+    """Translate a resolved program into the source of a standalone module.
+
+    Every function and method is translated up front and installed as if the
+    tiering had already picked it, so the module runs on the interpreter's
+    runtime (its call stack, classes, instances and inline caches) without
+    ever walking the tree. Declarations and nodes the runtime needs, such as
+    tokens for error messages, are rebuilt as stubs without their bodies.
+    """
+    translator = transpiler.Transpiler(interpret._locals)
+    script = translator.script(statements, "lox_script")
+
+    functions = []
+    installs = []
+    # Translating a function can declare more, so the list grows as it goes.
+    for index, (declaration, has_this) in enumerate(translator.declarations):
+        name = f"lox_{declaration.name.lexeme}_{index}"
+        functions.append(translator.function(declaration, has_this, name))
+        constant = translator._constant(declaration)
+        installs.append(f"tiering.install(_interpreter, {constant}, {name})")
+
+    names = translator._constant_names
+    constants = [
+        f"{name} = {_constant(value, names)}"
+        for name, value in translator.constants.items()
+    ]
+    header = _HEADER.format(
+        source=os.path.basename(source),
+        module=os.path.splitext(os.path.basename(source))[0] + ".py",
+        runtime=RUNTIME_PATH,
+    )
+    parts = [header, "\n".join(constants), *functions, "\n".join(installs), script]
+    return "\n\n\n".join(part.rstrip("\n") for part in parts if part) + _FOOTER
+
+
+def _constant(value: typing.Any, names: dict[int, str]) -> str:
+    """Python source that rebuilds what the runtime uses of a constant."""
+    match value:
+        case tokens.Token():
+            # The literal only matters to the parser.
+            return (
+                f"_Token(_TokenType.{value.type.name}, {value.lexeme!r}, None, "
+                f"{value.line})"
+            )
+        case float() if not math.isfinite(value):
+            return f"float({str(value)!r})"
+        case expr.Binary():
+            return f"expr.Binary(None, {_constant(value.operator, names)}, None)"
+        case expr.Get():
+            return f"expr.Get(None, {_constant(value.name, names)})"
+        case expr.Set():
+            return f"expr.Set(None, {_constant(value.name, names)}, None)"
+        case expr.Super():
+            keyword = _constant(value.keyword, names)
+            return f"expr.Super({keyword}, {_constant(value.method, names)})"
+        case stmt.Function():
+            params = ", ".join(_constant(param, names) for param in value.params)
+            return f"stmt.Function({_constant(value.name, names)}, [{params}], [])"
+        case stmt.Class():
+            superclass = "None"
+            if value.superclass is not None:
+                name = _constant(value.superclass.name, names)
+                superclass = f"expr.Variable({name})"
+            # The methods are constants of their own, installed with their code.
+            methods = ", ".join(names[id(method)] for method in value.methods)
+            name = _constant(value.name, names)
+            return f"stmt.Class({name}, {superclass}, [{methods}])"
+    raise TypeError(f"no source for {type(value).__name__}")
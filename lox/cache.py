@@ -0,0 +1,113 @@
+import contextlib
+import dataclasses
+import functools
+import hashlib
+import os
+import pickle
+import sys
+import typing
+
+import optimizer
+
+# Each program's cache entry goes in this directory, next to the program.
+CACHE_DIRECTORY = "__loxcache__"
+SUFFIX = ".loxc"
+
+
+@dataclasses.dataclass
+class Program:
+    """A program as the front end leaves it: parsed, resolved and optimized."""
+
+    # Identifies the source and the options the program was built with.
+    key: str
+    statements: list[typing.Any]
+    # The resolver's side table, for the nodes in `statements`.
+    resolutions: dict[typing.Any, tuple[int, int]]
+    # What the inliner reported, in case it is asked for.
+    inlining: list[tuple[int, str]]
+
+
+def key(source: str, **options: typing.Any) -> str:
+    """Identify a source and the front end options used on it."""
+    digest = hashlib.sha256(source.encode())
+    digest.update(repr(sorted(options.items())).encode())
+    return digest.hexdigest()
+
+
+def path(file: str) -> str:
+    """Where the cache entry for the program in `file` goes.
+
+    Like `__pycache__`, the name carries the version of the interpreter, so
+    entries written by another version are never read.
+    """
+    directory, name = os.path.split(os.path.abspath(file))
+    stem = os.path.splitext(name)[0]
+    return os.path.join(directory, CACHE_DIRECTORY, f"{stem}.{version()}{SUFFIX}")
+
+
+@functools.cache
+def version() -> str:
+    """The Python version and a digest of this interpreter's own source.
+
+    Any change to the interpreter, such as a new node field, makes a new
+    version, so no release number has to be bumped by hand.
+    """
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".py"):
+            with open(os.path.join(directory, name), "rb") as f:
+                digest.update(f.read())
+    return f"{sys.implementation.cache_tag}-{digest.hexdigest()[:16]}"
+
+
+def program(
+    key: str,
+    statements: list[typing.Any],
+    resolved: dict[typing.Any, tuple[int, int]],
+    inlining: list[tuple[int, str]],
+) -> Program:
+    """Gather what the front end produced for the program in `statements`."""
+    resolutions = {
+        node: resolved[node] for node in optimizer.walk(statements) if node in resolved
+    }
+    return Program(key, statements, resolutions, inlining)
+
+
+def load(file: str, key: str) -> Program | None:
+    """The cached program for `file`, or None if there is none for `key`.
+
+    An entry for an older source or other options is stale, and left for
+    `store` to replace.
+    """
+    try:
+        with open(path(file), "rb") as f:
+            program = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # A truncated or unreadable entry is rebuilt like a stale one.
+        return None
+    if not isinstance(program, Program) or program.key != key:
+        return None
+    return program
+
+
+def store(file: str, program: Program) -> bool:
+    """Write the cache entry for `file`, returning whether it could be.
+
+    The entry is written to a temporary file first, so that a concurrent run
+    of the same program never reads half of it.
+    """
+    target = path(file)
+    temporary = f"{target}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(temporary, "wb") as f:
+            pickle.dump(program, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, target)
+    except (OSError, RecursionError, pickle.PicklingError):
+        with contextlib.suppress(OSError):
+            os.remove(temporary)
+        return False
+    return True
@@ -0,0 +1,663 @@
+import operator
+import typing
+
+import completion
+import counted_loop
+import environment
+import errors
+import expr
+import interpreter
+import loxclass
+import loxfunction
+import loxinstance
+import memoize
+import stmt
+import tokens
+
+Closure = typing.Callable[[environment.Environment], typing.Any]
+
+# Statement closures return a completion.Return to unwind to the enclosing call.
+# Anything else they return, such as the value of an expression statement, is
+# ignored, so callers test the type rather than comparing with None.
+Return = completion.Return
+
+
+class ClosureInterpreter(interpreter.Interpreter):
+    """Execute programs by first compiling the resolved AST into Python closures.
+
+    Each node is visited once and turned into a closure that takes the current
+    environment, so running the program no longer pays for `accept` dispatch or
+    for matching on operator types.
+    """
+
+    def __init__(self, max_depth: int = interpreter.MAX_CALL_DEPTH):
+        super().__init__(max_depth)
+        self._bodies: dict[int, Closure] = {}
+        self._scope_depth = 0
+
+    def interpret(self, statements: list[typing.Any]):
+        compiled = [self._compile(statement) for statement in statements]
+        try:
+            for statement in compiled:
+                statement(self.globals)
+        except errors.RuntimeError as e:
+            errors.runtime_error(e)
+
+    def _forget(self, node: typing.Any):
+        super()._forget(node)
+        if isinstance(node, stmt.Block):
+            self._bodies.pop(id(node.statements), None)
+
+    def _execute_block(
+        self, statements: list[object], env: environment.Environment
+    ) -> completion.Return | None:
+        return self._bodies[id(statements)](env)
+
+    def _execute_body(
+        self, declaration: stmt.Function, env: environment.Environment
+    ) -> completion.Return | None:
+        # Closures are already compiled, so functions are never tiered up.
+        return self._bodies[id(declaration.body)](env)
+
+    def _compile(self, node: typing.Any) -> Closure:
+        return node.accept(self)
+
+    def _compile_scope(self, statements: list[typing.Any]) -> Closure:
+        self._scope_depth += 1
+        compiled = [self._compile(statement) for statement in statements]
+        self._scope_depth -= 1
+
+        def run(env):
+            for statement in compiled:
+                result = statement(env)
+                if type(result) is Return:
+                    return result
+            return None
+
+        return run
+
+    def visit_literal(self, expression: expr.Literal) -> Closure:
+        value = expression.value
+        return lambda env: value
+
+    def visit_grouping(self, expression: expr.Grouping) -> Closure:
+        return self._compile(expression.expression)
+
+    def visit_variable(self, variable: expr.Variable) -> Closure:
+        return self._compile_lookup(variable.name, variable)
+
+    def visit_this(self, this_expr: expr.This) -> Closure:
+        return self._compile_lookup(this_expr.keyword, this_expr)
+
+    def visit_assign(self, assignment: expr.Assign) -> Closure:
+        value = self._compile(assignment.value)
+        name = assignment.name
+        resolved = self._locals.get(assignment)
+        if resolved is None:
+            globals = self.globals
+
+            def assign_global(env):
+                result = value(env)
+                globals.assign(name, result)
+                return result
+
+            return assign_global
+
+        distance, slot = resolved
+        if distance == 0:
+
+            def assign_slot(env):
+                result = value(env)
+                env.values[slot] = result
+                return result
+
+            return assign_slot
+
+        def assign_local(env):
+            result = value(env)
+            env.assign_at(distance, slot, result)
+            return result
+
+        return assign_local
+
+    def visit_unary(self, expression: expr.Unary) -> Closure:
+        right = self._compile(expression.right)
+        token = expression.operator
+        is_truthy = interpreter.is_truthy
+
+        match token.type:
+            case tokens.TokenType.MINUS:
+
+                def negate(env):
+                    value = right(env)
+                    if isinstance(value, float):
+                        return -value
+                    raise errors.RuntimeError(token, "Operands must be numbers.")
+
+                return negate
+            case tokens.TokenType.BANG:
+                return lambda env: not is_truthy(right(env))
+
+        # Should be unreachable.
+        return lambda env: None
+
+    def visit_binary(self, expression: expr.Binary) -> Closure:
+        left = self._compile(expression.left)
+        right = self._compile(expression.right)
+        token = expression.operator
+
+        match token.type:
+            case tokens.TokenType.PLUS:
+
+                def add(env):
+                    a = left(env)
+                    b = right(env)
+                    if isinstance(a, float) and isinstance(b, float):
+                        return a + b
+                    elif isinstance(a, str) and isinstance(b, str):
+                        return a + b
+                    raise errors.RuntimeError(
+                        token, "Operands must be two numbers or two strings."
+                    )
+
+                return add
+            case (
+                tokens.TokenType.MINUS
+                | tokens.TokenType.SLASH
+                | tokens.TokenType.STAR
+                | tokens.TokenType.GREATER
+                | tokens.TokenType.GREATER_EQUAL
+                | tokens.TokenType.LESS
+                | tokens.TokenType.LESS_EQUAL
+            ):
+                operation = _NUMERIC_OPERATIONS[token.type]
+
+                def numeric(env):
+                    a = left(env)
+                    b = right(env)
+                    if isinstance(a, float) and isinstance(b, float):
+                        return operation(a, b)
+                    raise errors.RuntimeError(token, "Operands must be numbers.")
+
+                return numeric
+            case tokens.TokenType.BANG_EQUAL:
+                is_equal = interpreter.is_equal
+                return lambda env: not is_equal(left(env), right(env))
+            case tokens.TokenType.EQUAL_EQUAL:
+                is_equal = interpreter.is_equal
+                return lambda env: is_equal(left(env), right(env))
+
+        # Should be unreachable.
+        return lambda env: None
+
+    def visit_logical(self, logical: expr.Logical) -> Closure:
+        left = self._compile(logical.left)
+        right = self._compile(logical.right)
+        is_truthy = interpreter.is_truthy
+
+        if logical.operator.type == tokens.TokenType.OR:
+
+            def logical_or(env):
+                value = left(env)
+                if is_truthy(value):
+                    return value
+                return right(env)
+
+            return logical_or
+
+        def logical_and(env):
+            value = left(env)
+            if not is_truthy(value):
+                return value
+            return right(env)
+
+        return logical_and
+
+    def visit_get(self, expression: expr.Get) -> Closure:
+        instance = self._compile(expression.instance)
+        name = expression.name
+        cache = self._inline_caches[expression]
+
+        def get(env):
+            obj = instance(env)
+            if isinstance(obj, loxinstance.LoxInstance):
+                # Read a cached field slot directly; methods and misses go
+                # through the instance.
+                if obj._shape is cache._key:
+                    slot = cache._entry[0]
+                    if slot is not None:
+                        cache.hits += 1
+                        return obj._values[slot]
+                return obj.get(name, cache)
+            raise errors.RuntimeError(name, "Only instances have properties")
+
+        return get
+
+    def visit_set(self, set_expr: expr.Set) -> Closure:
+        instance = self._compile(set_expr.instance)
+        value = self._compile(set_expr.value)
+        name = set_expr.name
+        cache = self._inline_caches[set_expr]
+
+        def set(env):
+            obj = instance(env)
+            if not isinstance(obj, loxinstance.LoxInstance):
+                raise errors.RuntimeError(name, "Only instances have fields.")
+            result = value(env)
+            if obj._shape is cache._key:
+                slot, next_shape = cache._entry
+                if next_shape is cache._key:
+                    cache.hits += 1
+                    obj._values[slot] = result
+                    return result
+            obj.set(name, result, cache)
+            return result
+
+        return set
+
+    def visit_super(self, super_expr: expr.Super) -> Closure:
+        super_method = self._compile_super_method(super_expr)
+
+        def bind_super(env):
+            obj, method = super_method(env)
+            return method.bind(obj)
+
+        return bind_super
+
+    def visit_call(self, expression: expr.Call) -> Closure:
+        match expression.callee:
+            case expr.Get() as get_expr:
+                return self._compile_invoke(expression, get_expr)
+            case expr.Super() as super_expr:
+                return self._compile_super_invoke(expression, super_expr)
+
+        callee = self._compile(expression.callee)
+        arguments = [self._compile(argument) for argument in expression.arguments]
+        paren = expression.paren
+        call_value = self._call_value
+
+        def call(env):
+            function = callee(env)
+            values = [argument(env) for argument in arguments]
+            return call_value(paren, function, values)
+
+        return call
+
+    def visit_inlined(self, inlined: expr.Inlined) -> Closure:
+        call = self.visit_call(inlined.call)
+        arguments = [self._compile(argument) for argument in inlined.call.arguments]
+        body = self._compile(inlined.body)
+        declaration = inlined.function
+        name = inlined.call.callee.name.lexeme
+        globals = self.globals.values
+        LoxFunction = loxfunction.LoxFunction
+        Environment = environment.Environment
+
+        def inlined_call(env):
+            function = globals.get(name)
+            if type(function) is LoxFunction and function._declaration is declaration:
+                values = [argument(env) for argument in arguments]
+                return body(Environment(function._closure, values))
+            # The name is bound to something else, or not bound yet.
+            return call(env)
+
+        return inlined_call
+
+    def visit_hoisted(self, hoisted: expr.Hoisted) -> Closure:
+        expression = self._compile(hoisted.expression)
+        distance, slot = self._locals[hoisted.variable]
+        BoundMethod = loxfunction.BoundMethod
+
+        def hoisted_value(env):
+            scope = env._ancestor(distance).values
+            value = scope[slot]
+            if value is None:
+                value = expression(env)
+                if type(value) is not BoundMethod:
+                    scope[slot] = value
+            return value
+
+        return hoisted_value
+
+    def _compile_invoke(self, expression: expr.Call, get_expr: expr.Get) -> Closure:
+        """Compile `obj.name(...)` to call methods without binding them first."""
+        instance = self._compile(get_expr.instance)
+        arguments = [self._compile(argument) for argument in expression.arguments]
+        name = get_expr.name
+        paren = expression.paren
+        cache = self._inline_caches[get_expr]
+        call_value = self._call_value
+        check_arity = self._check_arity
+        frames = self._frames
+        max_depth = self._max_depth
+
+        def invoke(env):
+            obj = instance(env)
+            if not isinstance(obj, loxinstance.LoxInstance):
+                raise errors.RuntimeError(name, "Only instances have properties")
+            slot, method = cache.lookup(obj._shape)
+            if slot is None and method is not None:
+                values = [argument(env) for argument in arguments]
+                check_arity(paren, method, values)
+                # As in `_invoke`, which this inlines on the hottest path.
+                if len(frames) == max_depth:
+                    raise errors.RuntimeError(paren, "Stack overflow.")
+                frames.append(method)
+                try:
+                    return method.invoke(self, obj, values)
+                except RecursionError:
+                    raise errors.RuntimeError(paren, "Stack overflow.") from None
+                finally:
+                    frames.pop()
+
+            # A field holding something callable, or a missing property.
+            function = obj.get(name, cache)
+            values = [argument(env) for argument in arguments]
+            return call_value(paren, function, values)
+
+        return invoke
+
+    def _compile_super_invoke(
+        self, expression: expr.Call, super_expr: expr.Super
+    ) -> Closure:
+        super_method = self._compile_super_method(super_expr)
+        arguments = [self._compile(argument) for argument in expression.arguments]
+        paren = expression.paren
+        check_arity = self._check_arity
+        invoke_method = self._invoke
+
+        def invoke_super(env):
+            obj, method = super_method(env)
+            values = [argument(env) for argument in arguments]
+            check_arity(paren, method, values)
+            return invoke_method(paren, method, obj, values)
+
+        return invoke_super
+
+    def _compile_tail_call(self, expression: expr.Call) -> Closure:
+        """Compile the call in `return f(...)` to a `completion.TailCall`."""
+        arguments = [self._compile(argument) for argument in expression.arguments]
+        paren = expression.paren
+        check_arity = self._check_arity
+        TailCall = completion.TailCall
+
+        match expression.callee:
+            case expr.Get() as get_expr:
+                instance = self._compile(get_expr.instance)
+                name = get_expr.name
+                cache = self._inline_caches[get_expr]
+                check_callable = self._check_callable
+
+                def tail_invoke(env):
+                    obj = instance(env)
+                    if not isinstance(obj, loxinstance.LoxInstance):
+                        raise errors.RuntimeError(
+                            name, "Only instances have properties"
+                        )
+                    slot, method = cache.lookup(obj._shape)
+                    if slot is None and method is not None:
+                        values = [argument(env) for argument in arguments]
+                        check_arity(paren, method, values)
+                        return TailCall(method, obj, values)
+
+                    function = obj.get(name, cache)
+                    values = [argument(env) for argument in arguments]
+                    check_callable(paren, function, values)
+                    return TailCall(function, None, values)
+
+                return tail_invoke
+            case expr.Super() as super_expr:
+                super_method = self._compile_super_method(super_expr)
+
+                def tail_invoke_super(env):
+                    obj, method = super_method(env)
+                    values = [argument(env) for argument in arguments]
+                    check_arity(paren, method, values)
+                    return TailCall(method, obj, values)
+
+                return tail_invoke_super
+
+        callee = self._compile(expression.callee)
+        check_callable = self._check_callable
+
+        def tail_call(env):
+            function = callee(env)
+            values = [argument(env) for argument in arguments]
+            check_callable(paren, function, values)
+            return TailCall(function, None, values)
+
+        return tail_call
+
+    def _compile_super_method(
+        self, super_expr: expr.Super
+    ) -> typing.Callable[[environment.Environment], tuple[typing.Any, typing.Any]]:
+        distance, slot = self._locals.get(super_expr)
+        method_name = super_expr.method
+        cache = self._inline_caches[super_expr]
+
+        def super_method(env):
+            superclass = env.get_at(distance, slot)
+            obj = env.get_at(distance - 1, 0)
+            method = cache.lookup(superclass)
+            if not method:
+                raise errors.RuntimeError(
+                    method_name, f"Undefined property '{method_name.lexeme}'."
+                )
+            return obj, method
+
+        return super_method
+
+    def visit_print(self, print_statement: stmt.Print) -> Closure:
+        expression = self._compile(print_statement.expression)
+        stringify = self._stringify
+
+        def print_value(env):
+            print(stringify(expression(env)))
+
+        return print_value
+
+    def visit_expression(self, expr_statement: stmt.Expression) -> Closure:
+        return self._compile(expr_statement.expression)
+
+    def visit_var(self, var_statement: stmt.Var) -> Closure:
+        define = self._compile_define(var_statement.name)
+        if var_statement.initializer is None:
+            return lambda env: define(env, None)
+
+        initializer = self._compile(var_statement.initializer)
+        return lambda env: define(env, initializer(env))
+
+    def visit_block(self, block: stmt.Block) -> Closure:
+        body = self._compile_scope(block.statements)
+        return lambda env: body(environment.Environment(env))
+
+    def visit_if(self, if_statement: stmt.If) -> Closure:
+        condition = self._compile(if_statement.condition)
+        then_branch = self._compile(if_statement.then_branch)
+        is_truthy = interpreter.is_truthy
+        if if_statement.else_branch is None:
+
+            def if_then(env):
+                if is_truthy(condition(env)):
+                    return then_branch(env)
+                return None
+
+            return if_then
+
+        else_branch = self._compile(if_statement.else_branch)
+
+        def if_then_else(env):
+            if is_truthy(condition(env)):
+                return then_branch(env)
+            return else_branch(env)
+
+        return if_then_else
+
+    def visit_while(self, while_statement: stmt.While) -> Closure:
+        condition = self._compile(while_statement.condition)
+        body = self._compile(while_statement.body)
+        is_truthy = interpreter.is_truthy
+
+        def loop(env):
+            while is_truthy(condition(env)):
+                result = body(env)
+                if type(result) is Return:
+                    return result
+            return None
+
+        counted = self._counted_loops[while_statement]
+        if counted is None:
+            return loop
+        return self._compile_counted_loop(counted, loop)
+
+    def _compile_counted_loop(
+        self, loop: counted_loop.CountedLoop, generic: Closure
+    ) -> Closure:
+        """Compile a counted loop that compares and steps its counter directly.
+
+        `generic` takes over as soon as the counter or the bound is not a
+        number, so any error is reported as usual.
+        """
+        # The body and increment are compiled as members of the block the
+        # parser wrapped them in.
+        self._scope_depth += 1
+        body = self._compile(loop.body)
+        increment = self._compile(loop.increment)
+        updates = [self._compile(local.update) for local in loop.derived]
+        self._scope_depth -= 1
+        distance = loop.distance
+        slot = loop.slot
+        inclusive = loop.inclusive
+        step = loop.step
+        globals = self.globals
+
+        def counted(env):
+            loop.entries += 1
+            counter = env._ancestor(distance).values
+            read_bound = loop.bound_reader(env, globals)
+            derived = [
+                (env._ancestor(local.distance).values, local.slot, local.step, update)
+                for local, update in zip(loop.derived, updates)
+            ]
+            # That block never declares anything, so one environment can
+            # stand in for it on every iteration.
+            block = environment.Environment(env)
+            while True:
+                value = counter[slot]
+                limit = read_bound()
+                if type(value) is not float or type(limit) is not float:
+                    break
+                if not (value <= limit if inclusive else value < limit):
+                    return None
+
+                result = body(block)
+                if type(result) is Return:
+                    return result
+
+                value = counter[slot]
+                if type(value) is not float:
+                    increment(block)
+                    for update in updates:
+                        update(block)
+                    break
+                counter[slot] = value + step
+                for scope, index, derived_step, update in derived:
+                    total = scope[index]
+                    if type(total) is not float:
+                        # Only numbers can be stepped, so this reports the error.
+                        update(block)
+                    scope[index] = total + derived_step
+
+            loop.fallbacks += 1
+            return generic(env)
+
+        return counted
+
+    def visit_function(self, func_call: stmt.Function) -> Closure:
+        self._bodies[id(func_call.body)] = self._compile_scope(func_call.body)
+        define = self._compile_define(func_call.name)
+        memo = self._memos.get(func_call)
+
+        if memo is not None:
+
+            def define_memoized(env):
+                define(env, loxfunction.MemoizedFunction(func_call, env, memo))
+
+            return define_memoized
+
+        def define_function(env):
+            define(env, loxfunction.LoxFunction(func_call, env, False))
+
+        return define_function
+
+    def visit_return(self, statement: stmt.Return) -> Closure:
+        if statement.value is None:
+
+            return lambda env: Return(None)
+
+        if type(statement.value) is expr.Call:
+            value = self._compile_tail_call(statement.value)
+        else:
+            value = self._compile(statement.value)
+        return lambda env: Return(value(env))
+
+    def visit_class(self, klass: stmt.Class) -> Closure:
+        superclass_expr = None
+        if klass.superclass is not None:
+            superclass_expr = self._compile(klass.superclass)
+        for method in klass.methods:
+            self._bodies[id(method.body)] = self._compile_scope(method.body)
+        name = klass.name
+        define = self._compile_define(name)
+
+        def define_class(env):
+            superclass = None
+            if superclass_expr is not None:
+                superclass = superclass_expr(env)
+                if not isinstance(superclass, loxclass.LoxClass):
+                    raise errors.RuntimeError(
+                        klass.superclass.name, "Superclass must be a class."
+                    )
+
+            closure = env
+            if superclass is not None:
+                closure = environment.Environment(env, [superclass])
+            methods = {}
+            for method in klass.methods:
+                methods[method.name.lexeme] = loxfunction.LoxFunction(
+                    method, closure, method.name.lexeme == "init"
+                )
+            define(env, loxclass.LoxClass(name.lexeme, superclass, methods))
+
+        return define_class
+
+    def _compile_lookup(self, name: tokens.Token, expression: object) -> Closure:
+        resolved = self._locals.get(expression)
+        if resolved is None:
+            globals = self.globals
+            return lambda env: globals.get(name)
+
+        distance, slot = resolved
+        if distance == 0:
+            return lambda env: env.values[slot]
+        return lambda env: env.get_at(distance, slot)
+
+    def _compile_define(
+        self, name: tokens.Token
+    ) -> typing.Callable[[environment.Environment, typing.Any], None]:
+        if self._scope_depth == 0:
+            globals = self.globals
+            lexeme = name.lexeme
+            return lambda env, value: globals.define(lexeme, value)
+        return lambda env, value: env.define(value)
+
+
+_NUMERIC_OPERATIONS = {
+    tokens.TokenType.MINUS: operator.sub,
+    tokens.TokenType.SLASH: operator.truediv,
+    tokens.TokenType.STAR: operator.mul,
+    tokens.TokenType.GREATER: operator.gt,
+    tokens.TokenType.GREATER_EQUAL: operator.ge,
+    tokens.TokenType.LESS: operator.lt,
+    tokens.TokenType.LESS_EQUAL: operator.le,
+}
@@ -0,0 +1,508 @@
+import dataclasses
+import enum
+import typing
+
+import expr
+import inline_cache
+import resolver
+import stmt
+import tokens
+
+
+class OpCode(enum.IntEnum):
+    CONSTANT = 0
+    NIL = 1
+    TRUE = 2
+    FALSE = 3
+    POP = 4
+    GET_LOCAL = 5
+    SET_LOCAL = 6
+    GET_GLOBAL = 7
+    DEFINE_GLOBAL = 8
+    SET_GLOBAL = 9
+    GET_UPVALUE = 10
+    SET_UPVALUE = 11
+    GET_PROPERTY = 12
+    SET_PROPERTY = 13
+    GET_SUPER = 14
+    EQUAL = 15
+    NOT_EQUAL = 16
+    GREATER = 17
+    GREATER_EQUAL = 18
+    LESS = 19
+    LESS_EQUAL = 20
+    ADD = 21
+    SUBTRACT = 22
+    MULTIPLY = 23
+    DIVIDE = 24
+    NOT = 25
+    NEGATE = 26
+    PRINT = 27
+    JUMP = 28
+    JUMP_IF_FALSE = 29
+    LOOP = 30
+    CALL = 31
+    LOAD_METHOD = 32
+    LOAD_SUPER_METHOD = 33
+    CALL_METHOD = 34
+    CLOSURE = 35
+    CLOSE_UPVALUE = 36
+    RETURN = 37
+    CLASS = 38
+
+    def __str__(self) -> str:
+        return f"{self.name}"
+
+
+class Chunk:
+    """A flat instruction stream with its constant pool.
+
+    Operands are stored inline after their opcode. Every slot of `code` has a
+    matching entry in `tokens`, which is used for line numbers and errors.
+    """
+
+    def __init__(self):
+        self.code: list[int] = []
+        self.tokens: list[tokens.Token | None] = []
+        self.constants: list[typing.Any] = []
+        self._constant_indices: dict[tuple[type, typing.Any], int] = {}
+
+    def write(self, byte: int, token: tokens.Token | None):
+        self.code.append(byte)
+        self.tokens.append(token)
+
+    def add_constant(self, value: typing.Any) -> int:
+        # Key on the type as well so that 1.0 and true get separate entries.
+        key = (type(value), value)
+        if isinstance(value, (float, str)) and key in self._constant_indices:
+            return self._constant_indices[key]
+
+        self.constants.append(value)
+        index = len(self.constants) - 1
+        if isinstance(value, (float, str)):
+            self._constant_indices[key] = index
+        return index
+
+
+class FunctionProto:
+    def __init__(self, name: str, arity: int, type: resolver.FunctionType):
+        self.name = name
+        self.arity = arity
+        self.type = type
+        self.chunk = Chunk()
+        self.upvalue_count = 0
+
+    def __str__(self) -> str:
+        if self.type == resolver.FunctionType.NONE:
+            return "<script>"
+        return f"<fn {self.name}>"
+
+
+@dataclasses.dataclass(frozen=True)
+class ClassProto:
+    name: str
+    methods: tuple[str, ...]
+    has_superclass: bool
+
+    def __str__(self) -> str:
+        return f"<class {self.name}>"
+
+
+@dataclasses.dataclass
+class _Local:
+    name: str
+    depth: int
+    is_captured: bool = False
+
+
+class _FunctionState:
+    def __init__(
+        self,
+        enclosing: _FunctionState | None,
+        function: FunctionProto,
+    ):
+        self.enclosing = enclosing
+        self.function = function
+        self.scope_depth = 0
+        self.upvalues: list[tuple[bool, int]] = []
+
+        # Slot zero holds the callee, or the receiver for methods.
+        receiver = ""
+        if function.type in (
+            resolver.FunctionType.METHOD,
+            resolver.FunctionType.INITIALIZER,
+        ):
+            receiver = "this"
+        self.locals: list[_Local] = [_Local(receiver, 0)]
+
+
+class Compiler:
+    """Lower a resolved program into bytecode for the `vm` module.
+
+    The resolver has already reported static errors, and its side table tells
+    the compiler which variables are globals. Locals live in stack slots and
+    variables captured by closures are reached through upvalues.
+    """
+
+    def __init__(
+        self,
+        resolved: dict[object, tuple[int, int]],
+        inline_caches: list[inline_cache.InlineCache],
+    ):
+        self._resolved = resolved
+        self._inline_caches = inline_caches
+        self._state: _FunctionState | None = None
+
+    def compile(self, statements: list[typing.Any]) -> FunctionProto:
+        function = FunctionProto("script", 0, resolver.FunctionType.NONE)
+        self._state = _FunctionState(None, function)
+        for statement in statements:
+            self._compile(statement)
+        self._emit_return(None)
+        self._state = None
+        return function
+
+    def visit_expression(self, expr_statement: stmt.Expression):
+        self._compile(expr_statement.expression)
+        self._emit(OpCode.POP, None)
+
+    def visit_print(self, print_statement: stmt.Print):
+        self._compile(print_statement.expression)
+        self._emit(OpCode.PRINT, None)
+
+    def visit_var(self, var_statement: stmt.Var):
+        self._declare_variable(var_statement.name)
+        if var_statement.initializer is not None:
+            self._compile(var_statement.initializer)
+        else:
+            self._emit(OpCode.NIL, var_statement.name)
+
+        self._define_variable(var_statement.name)
+
+    def visit_block(self, block: stmt.Block):
+        self._begin_scope()
+        for statement in block.statements:
+            self._compile(statement)
+        self._end_scope()
+
+    def visit_if(self, if_statement: stmt.If):
+        self._compile(if_statement.condition)
+        then_jump = self._emit_jump(OpCode.JUMP_IF_FALSE)
+        self._emit(OpCode.POP, None)
+        self._compile(if_statement.then_branch)
+        else_jump = self._emit_jump(OpCode.JUMP)
+        self._patch_jump(then_jump)
+        self._emit(OpCode.POP, None)
+        if if_statement.else_branch is not None:
+            self._compile(if_statement.else_branch)
+        self._patch_jump(else_jump)
+
+    def visit_while(self, while_statement: stmt.While):
+        loop_start = len(self._chunk().code)
+        self._compile(while_statement.condition)
+        exit_jump = self._emit_jump(OpCode.JUMP_IF_FALSE)
+        self._emit(OpCode.POP, None)
+        self._compile(while_statement.body)
+        self._emit_loop(loop_start)
+        self._patch_jump(exit_jump)
+        self._emit(OpCode.POP, None)
+
+    def visit_function(self, function: stmt.Function):
+        self._declare_variable(function.name)
+        if self._state.scope_depth > 0:
+            # Mark initialized straight away so the function can recurse.
+            self._state.locals[-1].depth = self._state.scope_depth
+        self._function(function, resolver.FunctionType.FUNCTION)
+        self._define_variable(function.name)
+
+    def visit_return(self, statement: stmt.Return):
+        if statement.value is None:
+            self._emit_return(statement.keyword)
+        else:
+            self._compile(statement.value)
+            self._emit(OpCode.RETURN, statement.keyword)
+
+    def visit_class(self, klass: stmt.Class):
+        is_global = self._state.scope_depth == 0
+        self._declare_variable(klass.name)
+        self._emit(OpCode.NIL, klass.name)
+        self._define_variable(klass.name)
+
+        token = klass.name
+        if klass.superclass is not None:
+            self._begin_scope()
+            self._compile(klass.superclass)
+            self._add_local("super")
+            self._state.locals[-1].depth = self._state.scope_depth
+            self._named_variable(klass.superclass.name, None, "super")
+            token = klass.superclass.name
+
+        for method in klass.methods:
+            kind = resolver.FunctionType.METHOD
+            if method.name.lexeme == "init":
+                kind = resolver.FunctionType.INITIALIZER
+            self._function(method, kind)
+
+        proto = ClassProto(
+            klass.name.lexeme,
+            tuple(method.name.lexeme for method in klass.methods),
+            klass.superclass is not None,
+        )
+        self._emit(OpCode.CLASS, token, self._chunk().add_constant(proto))
+        self._set_variable(klass.name, is_global)
+        self._emit(OpCode.POP, None)
+
+        if klass.superclass is not None:
+            self._end_scope()
+
+    def visit_literal(self, expression: expr.Literal):
+        match expression.value:
+            case None:
+                self._emit(OpCode.NIL, None)
+            case True:
+                self._emit(OpCode.TRUE, None)
+            case False:
+                self._emit(OpCode.FALSE, None)
+            case value:
+                self._emit(OpCode.CONSTANT, None, self._chunk().add_constant(value))
+
+    def visit_grouping(self, expression: expr.Grouping):
+        self._compile(expression.expression)
+
+    def visit_unary(self, expression: expr.Unary):
+        self._compile(expression.right)
+        match expression.operator.type:
+            case tokens.TokenType.MINUS:
+                self._emit(OpCode.NEGATE, expression.operator)
+            case tokens.TokenType.BANG:
+                self._emit(OpCode.NOT, expression.operator)
+
+    def visit_binary(self, expression: expr.Binary):
+        self._compile(expression.left)
+        self._compile(expression.right)
+        self._emit(_BINARY_OPS[expression.operator.type], expression.operator)
+
+    def visit_logical(self, logical: expr.Logical):
+        self._compile(logical.left)
+        if logical.operator.type == tokens.TokenType.OR:
+            else_jump = self._emit_jump(OpCode.JUMP_IF_FALSE)
+            end_jump = self._emit_jump(OpCode.JUMP)
+            self._patch_jump(else_jump)
+            self._emit(OpCode.POP, None)
+            self._compile(logical.right)
+            self._patch_jump(end_jump)
+        else:
+            end_jump = self._emit_jump(OpCode.JUMP_IF_FALSE)
+            self._emit(OpCode.POP, None)
+            self._compile(logical.right)
+            self._patch_jump(end_jump)
+
+    def visit_variable(self, variable: expr.Variable):
+        self._named_variable(variable.name, variable, variable.name.lexeme)
+
+    def visit_assign(self, assignment: expr.Assign):
+        self._compile(assignment.value)
+        self._set_variable(assignment.name, assignment not in self._resolved)
+
+    def visit_this(self, this_expr: expr.This):
+        self._named_variable(this_expr.keyword, this_expr, "this")
+
+    def visit_get(self, expression: expr.Get):
+        self._compile(expression.instance)
+        cache = self._inline_cache(expression)
+        self._emit(OpCode.GET_PROPERTY, expression.name, cache)
+
+    def visit_set(self, set_expr: expr.Set):
+        self._compile(set_expr.instance)
+        self._compile(set_expr.value)
+        cache = self._inline_cache(set_expr)
+        self._emit(OpCode.SET_PROPERTY, set_expr.name, cache)
+
+    def visit_super(self, super_expr: expr.Super):
+        self._named_variable(super_expr.keyword, super_expr, "this")
+        self._named_variable(super_expr.keyword, super_expr, "super")
+        cache = self._inline_cache(super_expr)
+        self._emit(OpCode.GET_SUPER, super_expr.method, cache)
+
+    def visit_call(self, expression: expr.Call):
+        callee = expression.callee
+        if isinstance(callee, expr.Get):
+            # Look the method up before the arguments run, as the tree walker
+            # does, but without allocating a bound method.
+            self._compile(callee.instance)
+            cache = self._inline_cache(callee)
+            self._emit(OpCode.LOAD_METHOD, callee.name, cache)
+            opcode = OpCode.CALL_METHOD
+        elif isinstance(callee, expr.Super):
+            self._named_variable(callee.keyword, callee, "this")
+            self._named_variable(callee.keyword, callee, "super")
+            cache = self._inline_cache(callee)
+            self._emit(OpCode.LOAD_SUPER_METHOD, callee.method, cache)
+            opcode = OpCode.CALL_METHOD
+        else:
+            self._compile(callee)
+            opcode = OpCode.CALL
+
+        for argument in expression.arguments:
+            self._compile(argument)
+        self._emit(opcode, expression.paren, len(expression.arguments))
+
+    def visit_inlined(self, inlined: expr.Inlined):
+        # Locals here are found by name, which the copied body could get wrong
+        # where the caller shadows a global it uses, so make the call.
+        self.visit_call(inlined.call)
+
+    def visit_hoisted(self, hoisted: expr.Hoisted):
+        # Work the expression out every time, which is always correct.
+        self._compile(hoisted.expression)
+
+    def _compile(self, node: typing.Any):
+        node.accept(self)
+
+    def _function(self, function: stmt.Function, type: resolver.FunctionType):
+        proto = FunctionProto(function.name.lexeme, len(function.params), type)
+        self._state = _FunctionState(self._state, proto)
+        self._begin_scope()
+        for param in function.params:
+            self._add_local(param.lexeme)
+            self._state.locals[-1].depth = self._state.scope_depth
+        for statement in function.body:
+            self._compile(statement)
+        self._emit_return(function.name)
+
+        state = self._state
+        self._state = state.enclosing
+        proto.upvalue_count = len(state.upvalues)
+        self._emit(OpCode.CLOSURE, function.name, self._chunk().add_constant(proto))
+        for is_local, index in state.upvalues:
+            self._emit(int(is_local), function.name)
+            self._emit(index, function.name)
+
+    def _named_variable(self, name: tokens.Token, node: object | None, lexeme: str):
+        if node is not None and node not in self._resolved:
+            global_name = self._chunk().add_constant(lexeme)
+            self._emit(OpCode.GET_GLOBAL, name, global_name)
+            return
+
+        slot = self._resolve_local(self._state, lexeme)
+        if slot is not None:
+            self._emit(OpCode.GET_LOCAL, name, slot)
+            return
+
+        self._emit(OpCode.GET_UPVALUE, name, self._resolve_upvalue(self._state, lexeme))
+
+    def _set_variable(self, name: tokens.Token, is_global: bool):
+        if is_global:
+            global_name = self._chunk().add_constant(name.lexeme)
+            self._emit(OpCode.SET_GLOBAL, name, global_name)
+            return
+
+        slot = self._resolve_local(self._state, name.lexeme)
+        if slot is not None:
+            self._emit(OpCode.SET_LOCAL, name, slot)
+            return
+
+        upvalue = self._resolve_upvalue(self._state, name.lexeme)
+        self._emit(OpCode.SET_UPVALUE, name, upvalue)
+
+    def _resolve_local(self, state: _FunctionState, name: str) -> int | None:
+        for slot in range(len(state.locals) - 1, -1, -1):
+            local = state.locals[slot]
+            if local.name == name and local.depth != -1:
+                return slot
+        return None
+
+    def _resolve_upvalue(self, state: _FunctionState, name: str) -> int:
+        enclosing = state.enclosing
+        slot = self._resolve_local(enclosing, name)
+        if slot is not None:
+            enclosing.locals[slot].is_captured = True
+            return self._add_upvalue(state, True, slot)
+
+        return self._add_upvalue(state, False, self._resolve_upvalue(enclosing, name))
+
+    def _add_upvalue(self, state: _FunctionState, is_local: bool, index: int) -> int:
+        upvalue = (is_local, index)
+        if upvalue in state.upvalues:
+            return state.upvalues.index(upvalue)
+        state.upvalues.append(upvalue)
+        return len(state.upvalues) - 1
+
+    def _declare_variable(self, name: tokens.Token):
+        if self._state.scope_depth == 0:
+            return
+        self._add_local(name.lexeme)
+
+    def _define_variable(self, name: tokens.Token):
+        if self._state.scope_depth > 0:
+            self._state.locals[-1].depth = self._state.scope_depth
+            return
+
+        global_name = self._chunk().add_constant(name.lexeme)
+        self._emit(OpCode.DEFINE_GLOBAL, name, global_name)
+
+    def _add_local(self, name: str):
+        # A depth of -1 marks a declared but not yet initialized local.
+        self._state.locals.append(_Local(name, -1))
+
+    def _begin_scope(self):
+        self._state.scope_depth += 1
+
+    def _end_scope(self):
+        state = self._state
+        state.scope_depth -= 1
+        while state.locals and state.locals[-1].depth > state.scope_depth:
+            if state.locals[-1].is_captured:
+                self._emit(OpCode.CLOSE_UPVALUE, None)
+            else:
+                self._emit(OpCode.POP, None)
+            state.locals.pop()
+
+    def _inline_cache(self, site: expr.Get | expr.Set | expr.Super) -> int:
+        """Add a cache for one property access site to the constant pool."""
+        cache = inline_cache.for_site(site)
+        self._inline_caches.append(cache)
+        return self._chunk().add_constant(cache)
+
+    def _chunk(self) -> Chunk:
+        return self._state.function.chunk
+
+    def _emit(self, op: int, token: tokens.Token | None, *operands: int):
+        chunk = self._chunk()
+        chunk.write(int(op), token)
+        for operand in operands:
+            chunk.write(operand, token)
+
+    def _emit_return(self, token: tokens.Token | None):
+        if self._state.function.type == resolver.FunctionType.INITIALIZER:
+            self._emit(OpCode.GET_LOCAL, token, 0)
+        else:
+            self._emit(OpCode.NIL, token)
+        self._emit(OpCode.RETURN, token)
+
+    def _emit_jump(self, op: OpCode) -> int:
+        self._emit(op, None, 0)
+        return len(self._chunk().code) - 1
+
+    def _patch_jump(self, operand: int):
+        code = self._chunk().code
+        code[operand] = len(code) - operand - 1
+
+    def _emit_loop(self, loop_start: int):
+        self._emit(OpCode.LOOP, None, 0)
+        code = self._chunk().code
+        code[-1] = len(code) - loop_start
+
+
+_BINARY_OPS = {
+    tokens.TokenType.PLUS: OpCode.ADD,
+    tokens.TokenType.MINUS: OpCode.SUBTRACT,
+    tokens.TokenType.STAR: OpCode.MULTIPLY,
+    tokens.TokenType.SLASH: OpCode.DIVIDE,
+    tokens.TokenType.GREATER: OpCode.GREATER,
+    tokens.TokenType.GREATER_EQUAL: OpCode.GREATER_EQUAL,
+    tokens.TokenType.LESS: OpCode.LESS,
+    tokens.TokenType.LESS_EQUAL: OpCode.LESS_EQUAL,
+    tokens.TokenType.EQUAL_EQUAL: OpCode.EQUAL,
+    tokens.TokenType.BANG_EQUAL: OpCode.NOT_EQUAL,
+}
@@ -0,0 +1,30 @@
+class Return:
+    """Completion record produced by executing a `return` statement.
+
+    Executing a statement yields None when it completes normally. A Return is
+    handed back through enclosing blocks and loops to the function call, which
+    avoids raising and unwinding a Python exception for every Lox return.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class TailCall:
+    """The call that a `return f(...)` statement ends its function with.
+
+    The callee and arguments are evaluated and checked where the `return` is,
+    then handed back as the function's return value. `loxfunction` makes the
+    call in place of the frame that is returning, so a chain of tail calls runs
+    in constant stack space however long it is.
+    """
+
+    __slots__ = ("callee", "receiver", "arguments")
+
+    def __init__(self, callee, receiver, arguments):
+        self.callee = callee
+        # The instance a method is called on, or None for any other callee.
+        self.receiver = receiver
+        self.arguments = arguments
@@ -0,0 +1,193 @@
+import dataclasses
+import typing
+
+import environment
+import expr
+import stmt
+import tokens
+
+
+@dataclasses.dataclass(eq=False)
+class Derived:
+    """A local stepped along with the counter by `t = t + step` in the block."""
+
+    update: stmt.Expression
+    distance: int
+    slot: int
+    step: float
+
+
+@dataclasses.dataclass(eq=False)
+class CountedLoop:
+    """A `while` that counts a local up to a bound in constant steps.
+
+    This is the shape `for (var i = a; i < b; i = i + step) body` desugars to:
+
+        While(i < b, Block([body, Expression(i = i + step)]))
+
+    The counter is at `(distance, slot)` from the environment the `while` runs
+    in. The bound is either a float literal (`limit`) or a variable read again
+    on every iteration (`bound`), so a body that changes it is still honoured.
+    A local bound is found at `bound_resolution`; otherwise it is a global.
+
+    Statements after the increment that step other locals by a constant, such
+    as the running products `loop_optimizer` introduces, are `derived`.
+    """
+
+    node: stmt.While
+    distance: int
+    slot: int
+    inclusive: bool
+    limit: float | None
+    bound: expr.Variable | None
+    bound_resolution: tuple[int, int] | None
+    step: float
+    body: typing.Any
+    increment: stmt.Expression
+    derived: list[Derived]
+    entries: int = 0
+    fallbacks: int = 0
+
+    def bound_reader(
+        self, env: environment.Environment, globals: environment.GlobalEnvironment
+    ) -> typing.Callable[[], typing.Any]:
+        """Return a function that reads the bound as seen from `env`.
+
+        A global that is not defined reads as None, which sends the loop back
+        to the generic path to report the error.
+        """
+        if self.bound is None:
+            limit = self.limit
+            return lambda: limit
+
+        if self.bound_resolution is None:
+            values = globals.values
+            name = self.bound.name.lexeme
+            return lambda: values.get(name)
+
+        distance, slot = self.bound_resolution
+        scope = env._ancestor(distance).values
+        return lambda: scope[slot]
+
+
+def match(
+    node: stmt.While, resolved: dict[object, tuple[int, int]]
+) -> CountedLoop | None:
+    """Recognise a counted loop, or return None if `node` has another shape."""
+    condition = node.condition
+    if not (
+        isinstance(condition, expr.Binary)
+        and condition.operator.type
+        in (tokens.TokenType.LESS, tokens.TokenType.LESS_EQUAL)
+        and isinstance(condition.left, expr.Variable)
+        and condition.left in resolved
+    ):
+        return None
+    distance, slot = resolved[condition.left]
+
+    limit = None
+    bound = None
+    if isinstance(condition.right, expr.Literal):
+        if type(condition.right.value) is not float:
+            return None
+        limit = condition.right.value
+    elif isinstance(condition.right, expr.Variable):
+        bound = condition.right
+    else:
+        return None
+
+    block = node.body
+    if not (isinstance(block, stmt.Block) and len(block.statements) >= 2):
+        return None
+    body, increment, *updates = block.statements
+    step = _step(increment, (distance + 1, slot), resolved)
+    if step is None:
+        return None
+
+    derived = []
+    stepped = {(distance + 1, slot)}
+    for update in updates:
+        if not isinstance(update, stmt.Expression):
+            return None
+        variable = resolved.get(update.expression)
+        if variable is None or variable in stepped:
+            return None
+        derived_step = _step(update, variable, resolved)
+        if derived_step is None:
+            return None
+        stepped.add(variable)
+        derived.append(Derived(update, variable[0] - 1, variable[1], derived_step))
+
+    return CountedLoop(
+        node,
+        distance,
+        slot,
+        condition.operator.type == tokens.TokenType.LESS_EQUAL,
+        limit,
+        bound,
+        resolved.get(bound),
+        step,
+        body,
+        increment,
+        derived,
+    )
+
+
+def _step(
+    increment: typing.Any,
+    counter: tuple[int, int],
+    resolved: dict[object, tuple[int, int]],
+) -> float | None:
+    """Return the step of `i = i + step` or `i = i - step` on `counter`."""
+    if not isinstance(increment, stmt.Expression):
+        return None
+    assignment = increment.expression
+    if not (
+        isinstance(assignment, expr.Assign) and resolved.get(assignment) == counter
+    ):
+        return None
+
+    value = assignment.value
+    if not (
+        isinstance(value, expr.Binary)
+        and isinstance(value.left, expr.Variable)
+        and resolved.get(value.left) == counter
+        and isinstance(value.right, expr.Literal)
+        and type(value.right.value) is float
+    ):
+        return None
+
+    match value.operator.type:
+        case tokens.TokenType.PLUS:
+            return value.right.value
+        case tokens.TokenType.MINUS:
+            return -value.right.value
+    return None
+
+
+class LoopTable(dict):
+    """The counted loop for each `while` node, or None, worked out on first use."""
+
+    def __init__(self, resolved: dict[object, tuple[int, int]]):
+        super().__init__()
+        self._resolved = resolved
+
+    def __missing__(self, node: stmt.While) -> CountedLoop | None:
+        loop = self[node] = match(node, self._resolved)
+        return loop
+
+
+def stats(loops: typing.Iterable[CountedLoop | None]) -> dict[str, int]:
+    """Count how often counted loops ran fast and how often they fell back."""
+    summary = {
+        "counted loops": 0,
+        "counted loop runs": 0,
+        "counted loop fallbacks": 0,
+    }
+    for loop in loops:
+        if loop is None:
+            continue
+        summary["counted loops"] += 1
+        summary["counted loop runs"] += loop.entries
+        summary["counted loop fallbacks"] += loop.fallbacks
+    return summary
@@ -0,0 +1,93 @@
+import compiler
+from compiler import OpCode
+
+_CONSTANT_OPS = {
+    OpCode.CONSTANT,
+    OpCode.GET_GLOBAL,
+    OpCode.DEFINE_GLOBAL,
+    OpCode.SET_GLOBAL,
+    OpCode.GET_PROPERTY,
+    OpCode.SET_PROPERTY,
+    OpCode.GET_SUPER,
+    OpCode.LOAD_METHOD,
+    OpCode.LOAD_SUPER_METHOD,
+    OpCode.CLASS,
+}
+
+_BYTE_OPS = {
+    OpCode.GET_LOCAL,
+    OpCode.SET_LOCAL,
+    OpCode.GET_UPVALUE,
+    OpCode.SET_UPVALUE,
+    OpCode.CALL,
+    OpCode.CALL_METHOD,
+}
+
+_JUMP_OPS = {
+    OpCode.JUMP: 1,
+    OpCode.JUMP_IF_FALSE: 1,
+    OpCode.LOOP: -1,
+}
+
+
+def disassemble(function: compiler.FunctionProto) -> str:
+    """Render a compiled function, and every function nested in it, as text."""
+    lines = []
+    pending = [function]
+    while pending:
+        function = pending.pop(0)
+        lines.append(f"== {function} ==")
+        chunk = function.chunk
+        offset = 0
+        line = None
+        while offset < len(chunk.code):
+            text, offset, line = _instruction(chunk, offset, line)
+            lines.append(text)
+        lines.append("")
+        pending.extend(
+            constant
+            for constant in chunk.constants
+            if isinstance(constant, compiler.FunctionProto)
+        )
+
+    return "\n".join(lines)
+
+
+def _instruction(
+    chunk: compiler.Chunk, offset: int, previous_line: int | None
+) -> tuple[str, int, int | None]:
+    """Format one instruction, returning the text, next offset and its line."""
+    token = chunk.tokens[offset]
+    line = previous_line if token is None else token.line
+    column = "   |" if line == previous_line else f"{line:4}"
+    op = OpCode(chunk.code[offset])
+    prefix = f"{offset:04} {column} {op.name:<18}"
+
+    if op in _CONSTANT_OPS:
+        index = chunk.code[offset + 1]
+        text = f"{prefix} {index:4} '{_constant(chunk.constants[index])}'"
+        return text, offset + 2, line
+    elif op in _BYTE_OPS:
+        return f"{prefix} {chunk.code[offset + 1]:4}", offset + 2, line
+    elif op in _JUMP_OPS:
+        jump = chunk.code[offset + 1]
+        target = offset + 2 + _JUMP_OPS[op] * jump
+        return f"{prefix} {offset:4} -> {target}", offset + 2, line
+    elif op == OpCode.CLOSURE:
+        function = chunk.constants[chunk.code[offset + 1]]
+        text = [f"{prefix} {chunk.code[offset + 1]:4} {function}"]
+        offset += 2
+        for _ in range(function.upvalue_count):
+            kind = "local" if chunk.code[offset] else "upvalue"
+            text.append(f"{offset:04}    |{'':19}{kind} {chunk.code[offset + 1]}")
+            offset += 2
+        return "\n".join(text), offset, line
+
+    return prefix.rstrip(), offset + 1, line
+
+
+def _constant(value: object) -> str:
+    if isinstance(value, float):
+        text = str(value)
+        return text[:-2] if text.endswith(".0") else text
+    return str(value)
@@ -5,9 +5,42 @@ import tokens
 
 
 class Environment:
-    def __init__(self, enclosing: Environment | None = None):
+    """A local scope whose variables live in the slots the resolver assigned.
+
+    Slots are handed out in declaration order, so defining a variable is an
+    append and every read or write is a list index.
+    """
+
+    def __init__(
+        self,
+        enclosing: Environment | GlobalEnvironment,
+        values: list[typing.Any] | None = None,
+    ):
+        self.values: list[typing.Any] = values if values is not None else []
+        self._enclosing = enclosing
+
+    def define(self, value: typing.Any):
+        self.values.append(value)
+
+    def get_at(self, distance: int, slot: int) -> object:
+        return self._ancestor(distance).values[slot]
+
+    def _ancestor(self, distance: int) -> Environment:
+        env = self
+        for _ in range(distance):
+            env = env._enclosing
+
+        return env
+
+    def assign_at(self, distance: int, slot: int, value: object):
+        self._ancestor(distance).values[slot] = value
+
+
+class GlobalEnvironment:
+    """The outermost scope, which is looked up by name at runtime."""
+
+    def __init__(self):
         self.values: dict[str, typing.Any] = {}
-        self._enclosing: Environment | None = enclosing
 
     def define(self, name: str, value: typing.Any):
         self.values[name] = value
@@ -16,9 +49,6 @@ class Environment:
         if name.lexeme in self.values:
             return self.values[name.lexeme]
 
-        if self._enclosing:
-            return self._enclosing.get(name)
-
         raise errors.RuntimeError(name, f"Undefined variable '{name.lexeme}'.")
 
     def assign(self, name: tokens.Token, value: typing.Any):
@@ -26,21 +56,4 @@ class Environment:
             self.values[name.lexeme] = value
             return
 
-        if self._enclosing:
-            return self._enclosing.assign(name, value)
-
         raise errors.RuntimeError(name, f"Undefined variable '{name.lexeme}'.")
-
-    def get_at(self, distance: int, name: str) -> object:
-        return self._ancestor(distance).values.get(name)
-
-    def _ancestor(self, distance: int) -> Environment:
-        env = self
-        for _ in range(distance):
-            env = env._enclosing
-
-        return env
-
-    def assign_at(self, distance: int, name: tokens.Token, value: object):
-        env = self._ancestor(distance)
-        env.values[name.lexeme] = value
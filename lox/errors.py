@@ -36,9 +36,12 @@ def is_runtime_error() -> bool:
 
 
 def reset():
+    global _has_error, _has_runtime_error
     _has_error = False
+    _has_runtime_error = False
 
 
 def runtime_error(error: RuntimeError):
+    global _has_runtime_error
     print(f"{error}: \n[line {error.token.line}]")
     _has_runtime_error = True
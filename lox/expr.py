@@ -4,7 +4,7 @@ import typing
 import tokens
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class Assign:
     name: tokens.Token
     value: object
@@ -13,7 +13,7 @@ class Assign:
         return visitor.visit_assign(self)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class Binary:
     left: object
     operator: tokens.Token
@@ -23,7 +23,7 @@ class Binary:
         return visitor.visit_binary(self)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class Call:
     callee: object
     paren: tokens.Token
@@ -33,7 +33,7 @@ class Call:
         return visitor.visit_call(self)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class Get:
     instance: object
     name: tokens.Token
@@ -42,7 +42,7 @@ class Get:
         return visitor.visit_get(self)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class Grouping:
     expression: object
 
@@ -50,7 +50,30 @@ class Grouping:
         return visitor.visit_grouping(self)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
+class Hoisted:
+    """A loop-invariant expression kept in `variable`; see `loop_optimizer`."""
+
+    variable: Variable
+    expression: object
+
+    def accept(self, visitor: typing.Any) -> object | None:
+        return visitor.visit_hoisted(self)
+
+
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
+class Inlined:
+    """A call whose callee's body has been copied in; see `inliner`."""
+
+    call: Call
+    function: object
+    body: object
+
+    def accept(self, visitor: typing.Any) -> object | None:
+        return visitor.visit_inlined(self)
+
+
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class Literal:
     value: object
 
@@ -58,7 +81,7 @@ class Literal:
         return visitor.visit_literal(self)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class Logical:
     left: object
     operator: tokens.Token
@@ -68,7 +91,7 @@ class Logical:
         return visitor.visit_logical(self)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class Set:
     instance: object
     name: tokens.Token
@@ -78,7 +101,7 @@ class Set:
         return visitor.visit_set(self)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class Super:
     keyword: tokens.Token
     method: tokens.Token
@@ -87,7 +110,7 @@ class Super:
         return visitor.visit_super(self)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class This:
     keyword: tokens.Token
 
@@ -95,7 +118,7 @@ class This:
         return visitor.visit_this(self)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class Unary:
     operator: tokens.Token
     right: object
@@ -104,9 +127,16 @@ class Unary:
         return visitor.visit_unary(self)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class Variable:
     name: tokens.Token
 
     def accept(self, visitor: typing.Any) -> object | None:
         return visitor.visit_variable(self)
+
+
+# Literals are never changed or used to key a side table, so one node can
+# stand for every occurrence of a value.
+NIL = Literal(None)
+TRUE = Literal(True)
+FALSE = Literal(False)
@@ -0,0 +1,140 @@
+import typing
+
+import expr
+import loxclass
+import shape
+
+# A site that has seen more receiver layouts than this stops caching and goes
+# back to the full lookup on every miss.
+POLYMORPHIC_LIMIT = 4
+
+
+class InlineCache:
+    """Lookups remembered at a single property access site.
+
+    The first key seen is checked before anything else, so a monomorphic site
+    costs one identity comparison. Further keys go into a small table until
+    `POLYMORPHIC_LIMIT` is reached. Subclasses say what the key is and how to
+    resolve it on a miss.
+
+    Entries never need invalidating: shapes and classes are fixed when they are
+    created, and redefining a class creates a new `LoxClass` with new shapes.
+    The cache holds the key object itself rather than its id, so a new one can
+    never be mistaken for a collected one and simply misses.
+    """
+
+    __slots__ = (
+        "name",
+        "hits",
+        "misses",
+        "megamorphic",
+        "_key",
+        "_entry",
+        "_entries",
+    )
+
+    def __init__(self, name: str):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.megamorphic = False
+        self._key: object = None
+        self._entry: typing.Any = None
+        self._entries: dict[object, typing.Any] = {}
+
+    def __str__(self) -> str:
+        return self.name
+
+    def lookup(self, key: object) -> typing.Any:
+        if key is self._key:
+            self.hits += 1
+            return self._entry
+
+        entries = self._entries
+        if key in entries:
+            self.hits += 1
+            return entries[key]
+
+        self.misses += 1
+        entry = self._resolve(key)
+        if self._key is None:
+            self._key = key
+            self._entry = entry
+        elif len(entries) < POLYMORPHIC_LIMIT - 1:
+            entries[key] = entry
+        else:
+            self.megamorphic = True
+        return entry
+
+    def _resolve(self, key: typing.Any) -> typing.Any:
+        raise NotImplementedError
+
+
+class PropertyCache(InlineCache):
+    """Cache `shape.lookup` for `obj.name` reads, keyed on the receiver's shape."""
+
+    __slots__ = ()
+
+    def _resolve(self, key: shape.Shape) -> typing.Any:
+        return key.lookup(self.name)
+
+
+class FieldCache(InlineCache):
+    """Cache `shape.transition` for `obj.name = value`, keyed on the shape."""
+
+    __slots__ = ()
+
+    def _resolve(self, key: shape.Shape) -> typing.Any:
+        return key.transition(self.name)
+
+
+class MethodCache(InlineCache):
+    """Cache `find_method` for `super.name`, keyed on the superclass."""
+
+    __slots__ = ()
+
+    def _resolve(self, key: loxclass.LoxClass) -> typing.Any:
+        return key.find_method(self.name)
+
+
+def for_site(site: expr.Get | expr.Set | expr.Super) -> InlineCache:
+    """Create the kind of cache that a property access node needs."""
+    match site:
+        case expr.Get(name=name):
+            return PropertyCache(name.lexeme)
+        case expr.Set(name=name):
+            return FieldCache(name.lexeme)
+        case expr.Super(method=method):
+            return MethodCache(method.lexeme)
+    raise TypeError(f"no inline cache for {type(site).__name__}")
+
+
+class SiteTable(dict):
+    """Inline caches keyed on the node of their site, created on first use."""
+
+    def __missing__(self, site: expr.Get | expr.Set | expr.Super) -> InlineCache:
+        cache = self[site] = for_site(site)
+        return cache
+
+
+def stats(caches: typing.Iterable[InlineCache]) -> dict[str, int]:
+    """Summarise how the given sites have behaved so far."""
+    summary = {
+        "inline cache sites": 0,
+        "inline cache monomorphic": 0,
+        "inline cache polymorphic": 0,
+        "inline cache megamorphic": 0,
+        "inline cache hits": 0,
+        "inline cache misses": 0,
+    }
+    for cache in caches:
+        summary["inline cache sites"] += 1
+        if cache.megamorphic:
+            summary["inline cache megamorphic"] += 1
+        elif cache._entries:
+            summary["inline cache polymorphic"] += 1
+        elif cache._key is not None:
+            summary["inline cache monomorphic"] += 1
+        summary["inline cache hits"] += cache.hits
+        summary["inline cache misses"] += cache.misses
+    return summary
@@ -0,0 +1,189 @@
+import dataclasses
+import typing
+
+import expr
+import interpreter
+import optimizer
+import stmt
+
+# The largest function body, counted in expression nodes, that is copied into
+# its callers. Bigger bodies gain little, as the call is then a small part of
+# the work.
+INLINE_MAX_SIZE = 24
+
+
+class Inliner:
+    """Replace calls to small global functions with the functions' bodies.
+
+    A function is inlined if it is declared once at the top level, is never
+    assigned to, consists of a single `return`, is no larger than
+    `INLINE_MAX_SIZE`, and cannot reach itself through other inlined calls.
+    A top-level function can only capture globals, so its body means the same
+    wherever it is copied. Each call to it by its global name with the right
+    number of arguments becomes an `expr.Inlined`, except a tail call to a
+    function that itself ends in a tail call, which would then no longer be
+    one.
+
+    The engine guards an inlined call on the global still holding the very
+    function that was inlined and otherwise makes the original call, which
+    also covers a call made before the function is declared.
+
+    `inline` can be called again on more of a program, as a REPL session
+    does: functions found earlier are inlined into the new statements, and
+    the guard covers any the new statements reassign.
+    """
+
+    def __init__(self, interpret: interpreter.Interpreter):
+        self._interpreter = interpret
+        self._locals: dict[object, tuple[int, int]] = interpret._locals
+        self._candidates: dict[str, stmt.Function] = {}
+        self._rejected: dict[str, str] = {}
+        # Candidates with their bodies inlined in turn, by name.
+        self._inlined: dict[str, stmt.Function] = {}
+        # What happened at each call to a global function, in source order.
+        self.report: list[tuple[int, str]] = []
+
+    def inline(self, statements: list[typing.Any]) -> list[typing.Any]:
+        self._find_candidates(statements)
+        inlined = [self._statement(statement) for statement in statements]
+        # Candidates are rewritten when first called, so sort back into order.
+        self.report.sort(key=lambda entry: entry[0])
+        return inlined
+
+    def _find_candidates(self, statements: list[typing.Any]):
+        declared: dict[str, int] = {}
+        for statement in statements:
+            if isinstance(statement, (stmt.Var, stmt.Function, stmt.Class)):
+                name = statement.name.lexeme
+                declared[name] = declared.get(name, 0) + 1
+        assigned = {
+            node.name.lexeme
+            for node in optimizer.walk(statements)
+            if isinstance(node, expr.Assign) and node not in self._locals
+        }
+
+        found = []
+        for statement in statements:
+            if not isinstance(statement, stmt.Function):
+                continue
+            name = statement.name.lexeme
+            body = statement.body
+            # An entry in a REPL session can declare a function again.
+            self._candidates.pop(name, None)
+            self._rejected.pop(name, None)
+            self._inlined.pop(name, None)
+            if declared[name] > 1 or name in assigned:
+                self._rejected[name] = "it is reassigned"
+            elif len(body) > 1 or (body and not isinstance(body[0], stmt.Return)):
+                self._rejected[name] = "its body is not a single return"
+            elif _size(body) > INLINE_MAX_SIZE:
+                self._rejected[name] = f"its body is over {INLINE_MAX_SIZE} nodes"
+            else:
+                self._candidates[name] = statement
+                found.append(name)
+
+        # Candidates from earlier calls were acyclic, so any new cycle passes
+        # through one found now.
+        recursive = [name for name in found if self._reaches(name, name, set())]
+        for name in recursive:
+            self._rejected[name] = "it is recursive"
+            del self._candidates[name]
+
+    def _reaches(self, start: str, target: str, seen: set[str]) -> bool:
+        """Whether `start` calls `target`, directly or through candidates."""
+        for callee in self._global_callees(self._candidates[start]):
+            if callee == target:
+                return True
+            if callee in self._candidates and callee not in seen:
+                seen.add(callee)
+                if self._reaches(callee, target, seen):
+                    return True
+        return False
+
+    def _global_callees(self, function: stmt.Function) -> set[str]:
+        return {
+            node.callee.name.lexeme
+            for node in optimizer.walk(function.body)
+            if isinstance(node, expr.Call)
+            and isinstance(node.callee, expr.Variable)
+            and node.callee not in self._locals
+        }
+
+    def _statement(self, statement: typing.Any) -> typing.Any:
+        if isinstance(statement, stmt.Function):
+            name = statement.name.lexeme
+            if self._candidates.get(name) is statement:
+                return self._inlined_function(name)
+        return self._rewrite(statement)
+
+    def _inlined_function(self, name: str) -> stmt.Function:
+        """Rewrite a candidate once, so callers can guard on the result."""
+        function = self._inlined.get(name)
+        if function is None:
+            function = self._rewrite(self._candidates[name])
+            self._inlined[name] = function
+        return function
+
+    def _rewrite(self, node: typing.Any, tail: bool = False) -> typing.Any:
+        """Return `node` with calls inlined below it, rebuilt if anything changed.
+
+        `tail` is whether `node` is the value of a `return`.
+        """
+        fields = {}
+        for field in dataclasses.fields(node):
+            value = getattr(node, field.name)
+            if isinstance(value, list):
+                rewritten = [
+                    self._rewrite(item) if hasattr(item, "accept") else item
+                    for item in value
+                ]
+                if any(new is not old for new, old in zip(rewritten, value)):
+                    fields[field.name] = rewritten
+            elif hasattr(value, "accept"):
+                rewritten = self._rewrite(value, isinstance(node, stmt.Return))
+                if rewritten is not value:
+                    fields[field.name] = rewritten
+
+        if fields:
+            rebuilt = dataclasses.replace(node, **fields)
+            resolved = self._locals.get(node)
+            if resolved is not None:
+                self._interpreter.resolve(rebuilt, *resolved)
+            node = rebuilt
+
+        if isinstance(node, expr.Call):
+            return self._call(node, tail)
+        return node
+
+    def _call(self, call: expr.Call, tail: bool) -> expr.Call | expr.Inlined:
+        callee = call.callee
+        if not isinstance(callee, expr.Variable) or callee in self._locals:
+            return call
+
+        name = callee.name.lexeme
+        line = call.paren.line
+        if name in self._rejected:
+            self.report.append((line, f"not inlined '{name}': {self._rejected[name]}"))
+            return call
+        if name not in self._candidates:
+            return call
+
+        function = self._inlined_function(name)
+        if len(call.arguments) != len(function.params):
+            self.report.append((line, f"not inlined '{name}': wrong argument count"))
+            return call
+
+        body = expr.NIL
+        if function.body and function.body[0].value is not None:
+            body = function.body[0].value
+        if tail and type(body) is expr.Call:
+            # The call would run inside the caller's frame instead of replacing
+            # it, so a loop of such calls could overflow the stack.
+            self.report.append((line, f"not inlined '{name}': it ends in a tail call"))
+            return call
+        self.report.append((line, f"inlined '{name}'"))
+        return expr.Inlined(call, function, body)
+
+
+def _size(statements: list[typing.Any]) -> int:
+    return sum(1 for _ in optimizer.walk(statements))
@@ -1,23 +1,58 @@
+import dataclasses
+import sys
 import typing
 
+import completion
+import counted_loop
 import environment
 import errors
 import expr
+import inline_cache
 import loxclass
 import loxfunction
 import loxinstance
+import memoize
 import natives
-import return_exception
+import quickening
 import stmt
+import tiering
 import tokens
 
+# How deeply Lox calls may nest before a call fails with "Stack overflow.".
+# Tail calls take over their caller's frame and so do not count.
+MAX_CALL_DEPTH = 1 << 16
+
+# Python frames that one Lox call may need in the tree walkers, with room for
+# the statements and expressions nested inside it.
+_PYTHON_FRAMES_PER_CALL = 32
+
 
 class Interpreter:
-    def __init__(self):
-        self.globals = environment.Environment()
+    def __init__(self, max_depth: int = MAX_CALL_DEPTH):
+        self.globals = environment.GlobalEnvironment()
         self._environment = self.globals
         self.globals.define("clock", natives.Clock())
-        self._locals = {}
+        # Resolved (depth, slot) pairs. AST nodes hash by identity, so a lookup
+        # never walks the node's subtree and equal-looking nodes stay distinct.
+        self._locals: dict[object, tuple[int, int]] = {}
+        self._inline_caches = inline_cache.SiteTable()
+        self._binary_sites = quickening.SiteTable(self._binary)
+        self._counted_loops = counted_loop.LoopTable(self._locals)
+        # The Lox call stack: the callee of each call in progress, innermost
+        # last. Its limit is checked before Python's own, which is raised to
+        # fit so that deep recursion ends in a Lox error.
+        self._frames: list[typing.Any] = []
+        self._max_depth = max_depth
+        # Results of the functions chosen by `memoize`, keyed on declaration.
+        self._memos: dict[stmt.Function, memoize.Memo] = {}
+        # How often each function has run, and its Python translation once
+        # hot; see `tiering`. `_profile` is that of the innermost call.
+        self._profiles = tiering.ProfileTable()
+        self._profile: tiering.Profile | None = None
+        self._tier_threshold = tiering.TIER_THRESHOLD
+        sys.setrecursionlimit(
+            max(sys.getrecursionlimit(), max_depth * _PYTHON_FRAMES_PER_CALL)
+        )
 
     def interpret(self, statements: list[typing.Any]):
         try:
@@ -26,13 +61,39 @@ class Interpreter:
         except errors.RuntimeError as e:
             errors.runtime_error(e)
 
+    def memoize(self, functions: typing.Iterable[stmt.Function]):
+        """Remember the results of these functions, which must be pure.
+
+        See `purity.Purity`. Every closure created from one declaration shares
+        its memo, as a pure function reads nothing the closures could differ in.
+        """
+        for function in functions:
+            self._memos[function] = memoize.Memo(function.name.lexeme)
+
+    def tier(self, threshold: int):
+        """Translate functions to Python once they have run `threshold` times.
+
+        Calls and loop iterations in the function's own body both count. A
+        threshold of 0 leaves every function interpreted.
+        """
+        self._tier_threshold = threshold
+
+    def stats(self) -> dict[str, typing.Any]:
+        return {
+            **inline_cache.stats(self._inline_caches.values()),
+            **quickening.stats(self._binary_sites.values()),
+            **counted_loop.stats(self._counted_loops.values()),
+            **memoize.stats(self._memos.values()),
+            **tiering.stats(self._profiles.values()),
+        }
+
     def visit_literal(self, expression: expr.Literal) -> typing.Any:
         return expression.value
 
     def visit_get(self, expression: expr.Get) -> typing.Any:
         instance = self._evaluate(expression.instance)
         if isinstance(instance, loxinstance.LoxInstance):
-            return instance.get(expression.name)
+            return instance.get(expression.name, self._inline_caches[expression])
 
         raise errors.RuntimeError(expression.name, "Only instances have properties")
 
@@ -45,11 +106,11 @@ class Interpreter:
             raise errors.RuntimeError(set_expr.name, "Only instances have fields.")
 
         value = self._evaluate(set_expr.value)
-        instance.set(set_expr.name, value)
+        instance.set(set_expr.name, value, self._inline_caches[set_expr])
         return value
 
     def visit_unary(self, expression: expr.Unary) -> typing.Any:
-        right = self._evaluate(expression)
+        right = self._evaluate(expression.right)
 
         match expression.operator.type:
             case tokens.TokenType.MINUS:
@@ -64,7 +125,12 @@ class Interpreter:
     def visit_binary(self, expression: expr.Binary) -> typing.Any:
         left = self._evaluate(expression.left)
         right = self._evaluate(expression.right)
+        return self._binary_sites[expression].evaluate(left, right)
 
+    def _binary(
+        self, expression: expr.Binary, left: typing.Any, right: typing.Any
+    ) -> typing.Any:
+        """Apply a binary operator with full type checks; see `quickening`."""
         match expression.operator.type:
             case tokens.TokenType.MINUS:
                 self._check_number_operands(expression.operator, left, right)
@@ -117,22 +183,23 @@ class Interpreter:
         if var_statement.initializer is not None:
             value = self._evaluate(var_statement.initializer)
 
-        self._environment.define(var_statement.name.lexeme, value)
+        self._define(var_statement.name, value)
 
     def visit_variable(self, variable: expr.Variable) -> object:
         return self._lookup_variable(variable.name, variable)
 
     def visit_assign(self, assignment: expr.Assign) -> object:
         value = self._evaluate(assignment.value)
-        distance = self._locals.get(assignment)
-        if distance is not None:
-            self._environment.assign_at(distance, assignment.name, value)
+        resolved = self._locals.get(assignment)
+        if resolved is not None:
+            distance, slot = resolved
+            self._environment.assign_at(distance, slot, value)
         else:
             self.globals.assign(assignment.name, value)
         return value
 
-    def visit_block(self, block: stmt.Block) -> None:
-        self._execute_block(
+    def visit_block(self, block: stmt.Block) -> completion.Return | None:
+        return self._execute_block(
             block.statements, environment.Environment(self._environment)
         )
 
@@ -145,10 +212,10 @@ class Interpreter:
                     klass.superclass.name, "Superclass must be a class."
                 )
 
-        self._environment.define(klass.name.lexeme, None)
         if klass.superclass is not None:
-            self._environment = environment.Environment(self._environment)
-            self._environment.define("super", superclass)
+            self._environment = environment.Environment(
+                self._environment, [superclass]
+            )
         methods = {}
         for method in klass.methods:
             function = loxfunction.LoxFunction(
@@ -158,28 +225,37 @@ class Interpreter:
         class_obj = loxclass.LoxClass(klass.name.lexeme, superclass, methods)
         if superclass is not None:
             self._environment = self._environment._enclosing
-        self._environment.assign(klass.name, class_obj)
+        self._define(klass.name, class_obj)
 
     def visit_super(self, super_expr: expr.Super):
-        distance = self._locals.get(super_expr)
-        superclass = self._environment.get_at(distance, "super")
-        obj = self._environment.get_at(distance - 1, "this")
-        method = superclass.find_method(super_expr.method.lexeme)
-        if not method:
-            raise errors.RuntimeError(
-                super_expr.method, f"Undefined property '{super_expr.method.lexeme}'."
-            )
+        obj, method = self._super_method(super_expr)
         return method.bind(obj)
 
-    def visit_if(self, if_statement: stmt.If):
+    def visit_if(self, if_statement: stmt.If) -> completion.Return | None:
         if self._is_truthy(self._evaluate(if_statement.condition)):
-            self._execute(if_statement.then_branch)
+            return self._execute(if_statement.then_branch)
         elif if_statement.else_branch is not None:
-            self._execute(if_statement.else_branch)
+            return self._execute(if_statement.else_branch)
+        return None
 
-    def visit_while(self, while_statement: stmt.While):
-        while self._is_truthy(self._evaluate(while_statement.condition)):
-            self._execute(while_statement.body)
+    def visit_while(self, while_statement: stmt.While) -> completion.Return | None:
+        loop = self._counted_loops[while_statement]
+        if loop is not None:
+            return self._counted_loop(loop)
+        return self._while(while_statement)
+
+    def _while(self, while_statement: stmt.While) -> completion.Return | None:
+        iterations = 0
+        try:
+            while self._is_truthy(self._evaluate(while_statement.condition)):
+                iterations += 1
+                result = self._execute(while_statement.body)
+                if result is not None:
+                    return result
+            return None
+        finally:
+            if self._profile is not None:
+                self._profile.backedges += iterations
 
     def visit_logical(self, logical: expr.Logical):
         left = self._evaluate(logical.left)
@@ -194,56 +270,180 @@ class Interpreter:
         return self._evaluate(logical.right)
 
     def visit_call(self, expression: expr.Call):
-        callee = self._evaluate(expression.callee)
-
-        arguments = []
-        for argument in expression.arguments:
-            arguments.append(self._evaluate(argument))
-
-        if not callable(getattr(callee, "call", None)):
-            raise errors.RuntimeError(
-                expression.paren, "Can only call functions and classes."
-            )
-
-        if callable(getattr(callee, "arity", None)):
-            if len(arguments) != callee.arity():
-                raise errors.RuntimeError(
-                    expression.paren,
-                    f"Expected {callee.arity()} arguments but got {len(arguments)}.",
-                )
-        else:
-            raise errors.RuntimeError(expression.paren, "Callable does not have arity.")
+        # Method calls pass the receiver straight into the method's frame
+        # rather than allocating a bound method only to call it.
+        match expression.callee:
+            case expr.Get() as get_expr:
+                instance = self._evaluate(get_expr.instance)
+                if not isinstance(instance, loxinstance.LoxInstance):
+                    raise errors.RuntimeError(
+                        get_expr.name, "Only instances have properties"
+                    )
+                cache = self._inline_caches[get_expr]
+                slot, method = cache.lookup(instance._shape)
+                if slot is None and method is not None:
+                    arguments = self._evaluate_arguments(expression)
+                    self._check_arity(expression.paren, method, arguments)
+                    return self._invoke(expression.paren, method, instance, arguments)
+                # A field holding something callable, or a missing property.
+                callee = instance.get(get_expr.name, cache)
+            case expr.Super() as super_expr:
+                obj, method = self._super_method(super_expr)
+                arguments = self._evaluate_arguments(expression)
+                self._check_arity(expression.paren, method, arguments)
+                return self._invoke(expression.paren, method, obj, arguments)
+            case _:
+                callee = self._evaluate(expression.callee)
+
+        arguments = self._evaluate_arguments(expression)
+        return self._call_value(expression.paren, callee, arguments)
+
+    def _tail_call(self, expression: expr.Call) -> completion.TailCall:
+        """Evaluate and check the call in `return f(...)` without making it."""
+        match expression.callee:
+            case expr.Get() as get_expr:
+                instance = self._evaluate(get_expr.instance)
+                if not isinstance(instance, loxinstance.LoxInstance):
+                    raise errors.RuntimeError(
+                        get_expr.name, "Only instances have properties"
+                    )
+                cache = self._inline_caches[get_expr]
+                slot, method = cache.lookup(instance._shape)
+                if slot is None and method is not None:
+                    arguments = self._evaluate_arguments(expression)
+                    self._check_arity(expression.paren, method, arguments)
+                    return completion.TailCall(method, instance, arguments)
+                callee = instance.get(get_expr.name, cache)
+            case expr.Super() as super_expr:
+                obj, method = self._super_method(super_expr)
+                arguments = self._evaluate_arguments(expression)
+                self._check_arity(expression.paren, method, arguments)
+                return completion.TailCall(method, obj, arguments)
+            case _:
+                callee = self._evaluate(expression.callee)
+
+        arguments = self._evaluate_arguments(expression)
+        self._check_callable(expression.paren, callee, arguments)
+        return completion.TailCall(callee, None, arguments)
+
+    def visit_inlined(self, inlined: expr.Inlined) -> typing.Any:
+        function = self.globals.values.get(inlined.call.callee.name.lexeme)
+        if (
+            type(function) is not loxfunction.LoxFunction
+            or function._declaration is not inlined.function
+        ):
+            # The name is bound to something else, or not bound yet.
+            return self.visit_call(inlined.call)
+
+        arguments = self._evaluate_arguments(inlined.call)
+        previous = self._environment
+        try:
+            self._environment = environment.Environment(function._closure, arguments)
+            return self._evaluate(inlined.body)
+        finally:
+            self._environment = previous
 
-        return callee.call(self, arguments)
+    def visit_hoisted(self, hoisted: expr.Hoisted) -> typing.Any:
+        distance, slot = self._locals[hoisted.variable]
+        scope = self._environment._ancestor(distance).values
+        value = scope[slot]
+        if value is None:
+            # First use in this run of the loop, or a nil result, which is
+            # just worked out again.
+            value = self._evaluate(hoisted.expression)
+            if type(value) is not loxfunction.BoundMethod:
+                scope[slot] = value
+        return value
 
     def visit_function(self, func_call: stmt.Function):
-        function = loxfunction.LoxFunction(func_call, self._environment, False)
-        self._environment.define(func_call.name.lexeme, function)
+        memo = self._memos.get(func_call)
+        if memo is None:
+            function = loxfunction.LoxFunction(func_call, self._environment, False)
+        else:
+            function = loxfunction.MemoizedFunction(func_call, self._environment, memo)
+        self._define(func_call.name, function)
 
-    def visit_return(self, statement: stmt.Return):
+    def visit_return(self, statement: stmt.Return) -> completion.Return:
         value = None
-        if statement.value is not None:
+        if type(statement.value) is expr.Call:
+            value = self._tail_call(statement.value)
+        elif statement.value is not None:
             value = self._evaluate(statement.value)
 
-        raise return_exception.Return(value)
+        return completion.Return(value)
 
     def visit_this(self, this_expr: expr.This):
         return self._lookup_variable(this_expr.keyword, this_expr)
 
-    def resolve(self, expression: object, depth: int):
-        self._locals[expression] = depth
+    def resolve(self, expression: object, depth: int, slot: int):
+        self._locals[expression] = (depth, slot)
+
+    def release(self, statement: typing.Any):
+        """Forget what is kept for a top-level statement that has finished running.
+
+        Functions and classes it declared can still be called, so what is kept
+        for their nodes stays.
+        """
+        for node in transient_nodes(statement):
+            self._forget(node)
 
-    def _execute(self, statement: typing.Any):
-        statement.accept(self)
+    def _forget(self, node: typing.Any):
+        self._locals.pop(node, None)
+        self._inline_caches.pop(node, None)
+        self._binary_sites.pop(node, None)
+        self._counted_loops.pop(node, None)
 
-    def _execute_block(self, statements: list[object], env: environment.Environment):
+    def _execute(self, statement: typing.Any) -> completion.Return | None:
+        return statement.accept(self)
+
+    def _define(self, name: tokens.Token, value: typing.Any):
+        if self._environment is self.globals:
+            self.globals.define(name.lexeme, value)
+        else:
+            self._environment.define(value)
+
+    def _execute_body(
+        self, declaration: stmt.Function, env: environment.Environment
+    ) -> completion.Return | None:
+        """Run a function's body in its new frame `env`, tiering it up if hot."""
+        profile = self._profiles[declaration]
+        code = profile.code
+        if code is not None:
+            return code(env)
+
+        profile.calls += 1
+        threshold = self._tier_threshold
+        if (
+            threshold
+            and profile.calls + profile.backedges >= threshold
+            and profile.unsupported is None
+        ):
+            # Methods find `this` in the slot ahead of their parameters.
+            has_this = len(env.values) > len(declaration.params)
+            code = tiering.tier_up(self, profile, has_this)
+            if code is not None:
+                return code(env)
+
+        caller = self._profile
+        try:
+            self._profile = profile
+            return self._execute_block(declaration.body, env)
+        finally:
+            self._profile = caller
+
+    def _execute_block(
+        self, statements: list[object], env: environment.Environment
+    ) -> completion.Return | None:
         prev_env = self._environment
         try:
             self._environment = env
 
             for statement in statements:
-                self._execute(statement)
+                result = self._execute(statement)
+                if result is not None:
+                    return result
 
+            return None
         finally:
             self._environment = prev_env
 
@@ -251,19 +451,10 @@ class Interpreter:
         return expression.accept(self)
 
     def _is_truthy(self, object: typing.Any) -> bool:
-        if object is None:
-            return False
-        if isinstance(object, bool):
-            return object
-
-        return True
+        return is_truthy(object)
 
     def _is_equal(self, left: typing.Any, right: typing.Any) -> bool:
-        if left is None and right is None:
-            return True
-        if left is None:
-            return False
-        return left == right
+        return is_equal(left, right)
 
     def _check_number_operands(self, operator: tokens.Token, *operands: typing.Any):
         if all(isinstance(operand, float) for operand in operands):
@@ -271,26 +462,196 @@ class Interpreter:
         raise errors.RuntimeError(operator, "Operands must be numbers.")
 
     def _stringify(self, value: typing.Any) -> str:
-        if value is None:
-            return "nil"
+        return stringify(value)
+
+    def _counted_loop(self, loop: counted_loop.CountedLoop) -> completion.Return | None:
+        """Run a counted loop, comparing and stepping the counter directly.
+
+        The loop falls back to the generic `_while` as soon as the counter or
+        the bound is not a number, so any error is reported as usual.
+        """
+        loop.entries += 1
+        env = self._environment
+        counter = env._ancestor(loop.distance).values
+        slot = loop.slot
+        read_bound = loop.bound_reader(env, self.globals)
+        inclusive = loop.inclusive
+        step = loop.step
+        body = loop.body
+        derived = [
+            (env._ancestor(local.distance).values, local.slot, local.step, local.update)
+            for local in loop.derived
+        ]
+        # The block around the body and increment never declares anything, so
+        # one environment can stand in for it on every iteration.
+        block = environment.Environment(env)
+        iterations = 0
+        try:
+            self._environment = block
+            while True:
+                value = counter[slot]
+                limit = read_bound()
+                if type(value) is not float or type(limit) is not float:
+                    break
+                if not (value <= limit if inclusive else value < limit):
+                    return None
+
+                iterations += 1
+                result = self._execute(body)
+                if result is not None:
+                    return result
+
+                value = counter[slot]
+                if type(value) is not float:
+                    self._execute(loop.increment)
+                    for local in loop.derived:
+                        self._execute(local.update)
+                    break
+                counter[slot] = value + step
+                for scope, index, derived_step, update in derived:
+                    total = scope[index]
+                    if type(total) is not float:
+                        # Only numbers can be stepped, so this reports the error.
+                        self._execute(update)
+                    scope[index] = total + derived_step
+        finally:
+            self._environment = env
+            if self._profile is not None:
+                self._profile.backedges += iterations
+
+        loop.fallbacks += 1
+        return self._while(loop.node)
 
-        if isinstance(value, float):
-            text = str(value)
-            if text.endswith(".0"):
-                text = text[0:-2]
-            return text
+    def _evaluate_arguments(self, expression: expr.Call) -> list[typing.Any]:
+        return [self._evaluate(argument) for argument in expression.arguments]
 
-        if isinstance(value, bool):
-            if value:
-                return "true"
-            else:
-                return "false"
+    def _call_value(
+        self, paren: tokens.Token, callee: typing.Any, arguments: list[typing.Any]
+    ) -> typing.Any:
+        self._check_callable(paren, callee, arguments)
 
-        return str(value)
+        frames = self._frames
+        if len(frames) == self._max_depth:
+            raise errors.RuntimeError(paren, "Stack overflow.")
+        frames.append(callee)
+        try:
+            return callee.call(self, arguments)
+        except RecursionError:
+            raise errors.RuntimeError(paren, "Stack overflow.") from None
+        finally:
+            frames.pop()
+
+    def _invoke(
+        self,
+        paren: tokens.Token,
+        method: loxfunction.LoxFunction,
+        receiver: loxinstance.LoxInstance,
+        arguments: list[typing.Any],
+    ) -> typing.Any:
+        """Call a method found by a fused `obj.name(...)` or `super.name(...)`."""
+        frames = self._frames
+        if len(frames) == self._max_depth:
+            raise errors.RuntimeError(paren, "Stack overflow.")
+        frames.append(method)
+        try:
+            return method.invoke(self, receiver, arguments)
+        except RecursionError:
+            raise errors.RuntimeError(paren, "Stack overflow.") from None
+        finally:
+            frames.pop()
+
+    def _check_callable(
+        self, paren: tokens.Token, callee: typing.Any, arguments: list[typing.Any]
+    ):
+        if not callable(getattr(callee, "call", None)):
+            raise errors.RuntimeError(paren, "Can only call functions and classes.")
+
+        if not callable(getattr(callee, "arity", None)):
+            raise errors.RuntimeError(paren, "Callable does not have arity.")
+        self._check_arity(paren, callee, arguments)
+
+    def _check_arity(
+        self, paren: tokens.Token, callee: typing.Any, arguments: list[typing.Any]
+    ):
+        if len(arguments) != callee.arity():
+            raise errors.RuntimeError(
+                paren, f"Expected {callee.arity()} arguments but got {len(arguments)}."
+            )
+
+    def _super_method(
+        self, super_expr: expr.Super
+    ) -> tuple[loxinstance.LoxInstance, loxfunction.LoxFunction]:
+        """Find the instance and superclass method that `super.name` refers to."""
+        distance, slot = self._locals.get(super_expr)
+        superclass = self._environment.get_at(distance, slot)
+        obj = self._environment.get_at(distance - 1, 0)
+        method = self._inline_caches[super_expr].lookup(superclass)
+        if not method:
+            raise errors.RuntimeError(
+                super_expr.method, f"Undefined property '{super_expr.method.lexeme}'."
+            )
+        return obj, method
 
     def _lookup_variable(self, name: tokens.Token, expression: object):
-        distance = self._locals.get(expression)
-        if distance is not None:
-            return self._environment.get_at(distance, name.lexeme)
+        resolved = self._locals.get(expression)
+        if resolved is not None:
+            distance, slot = resolved
+            return self._environment.get_at(distance, slot)
         else:
             return self.globals.get(name)
+
+
+def is_truthy(object: typing.Any) -> bool:
+    if object is None:
+        return False
+    if isinstance(object, bool):
+        return object
+
+    return True
+
+
+def transient_nodes(statement: typing.Any) -> typing.Iterator[typing.Any]:
+    """Yield the nodes of `statement` outside the functions and classes it declares."""
+    pending = [statement]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, (stmt.Function, stmt.Class)):
+            continue
+        yield node
+        if isinstance(node, expr.Inlined):
+            # The body is the inlined function's own.
+            pending.append(node.call)
+            continue
+        for field in dataclasses.fields(node):
+            value = getattr(node, field.name)
+            if isinstance(value, list):
+                pending.extend(item for item in value if hasattr(item, "accept"))
+            elif hasattr(value, "accept"):
+                pending.append(value)
+
+
+def is_equal(left: typing.Any, right: typing.Any) -> bool:
+    if left is None and right is None:
+        return True
+    if left is None:
+        return False
+    return left == right
+
+
+def stringify(value: typing.Any) -> str:
+    if value is None:
+        return "nil"
+
+    if isinstance(value, float):
+        text = str(value)
+        if text.endswith(".0"):
+            text = text[0:-2]
+        return text
+
+    if isinstance(value, bool):
+        if value:
+            return "true"
+        else:
+            return "false"
+
+    return str(value)
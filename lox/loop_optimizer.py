@@ -0,0 +1,453 @@
+import dataclasses
+import typing
+
+import counted_loop
+import expr
+import interpreter
+import optimizer
+import stmt
+import tokens
+
+# Floats hold every integer up to this exactly, so sums of integer products
+# below it equal the products themselves.
+_EXACT_LIMIT = 2.0**53
+
+_DECLARATIONS = (stmt.Var, stmt.Function, stmt.Class)
+
+
+@dataclasses.dataclass(eq=False)
+class _Effects:
+    """What running a `while` loop may change."""
+
+    # Names of the variables assigned anywhere in the loop.
+    assigned: set[str]
+    # Names of the fields set anywhere in the loop.
+    fields: set[str]
+    # Whether the loop calls anything, which could assign or set anything.
+    calls: bool
+
+
+class LoopOptimizer:
+    """Take repeated work out of `while` loops.
+
+    An expression the loop cannot change, such as arithmetic on variables it
+    never assigns or a field it never sets on an instance it never assigns,
+    becomes an `expr.Hoisted` kept in a new local declared before the loop.
+    The engine works it out where it is first reached in each run of the loop
+    and reads the local after that, so an expression that fails still fails
+    at the same point, and one the loop never reaches is never evaluated.
+    Nothing that calls, assigns or sets is hoisted, and fields are only
+    hoisted from loops that make no calls.
+
+    In a counted loop, `for (var i = a; i < b; i = i + step)` with integer
+    literals for `a`, `b` and `step`, a product `i * k` of the counter and a
+    positive integer literal becomes a new local that starts at `a * k` and
+    grows by `step * k` with the counter. Every value involved is an integer
+    small enough for floats to hold exactly, so the sum is always the product.
+
+    The new locals are declared in the loop's own scope when nothing is
+    declared after the loop, so no slot moves; otherwise the loop is wrapped
+    in a block and the resolved distances inside it are adjusted.
+
+    Unless `whole_program` is set, the statements may call functions from
+    outside them, such as earlier REPL entries, so globals are only hoisted
+    from loops that make no calls.
+    """
+
+    def __init__(self, interpret: interpreter.Interpreter, whole_program: bool = True):
+        self._interpreter = interpret
+        self._whole_program = whole_program
+        self._locals: dict[object, tuple[int, int]] = interpret._locals
+        # Names assigned anywhere in the program.
+        self._assigned: set[str] = set()
+        self._temporaries = 0
+
+    def optimize(self, statements: list[typing.Any]) -> list[typing.Any]:
+        self._assigned = {
+            node.name.lexeme
+            for node in optimizer.walk(statements)
+            if isinstance(node, expr.Assign)
+        }
+        return self._statements(statements, None)
+
+    def _statements(
+        self, statements: list[typing.Any], slot: int | None
+    ) -> list[typing.Any]:
+        """Optimize the loops in a list of statements.
+
+        `slot` is the slot the list's next declaration takes, or None at the
+        top level, where there are no slots.
+        """
+        optimized = []
+        for index, statement in enumerate(statements):
+            if isinstance(statement, stmt.While):
+                free = slot
+                later = statements[index + 1 :]
+                if any(isinstance(other, _DECLARATIONS) for other in later):
+                    free = None
+                previous = statements[index - 1] if index else None
+                loop = self._loop(statement, free, previous)
+                optimized.extend(loop)
+                if free is not None:
+                    # The locals declared ahead of the loop take the next slots.
+                    slot += len(loop) - 1
+            else:
+                optimized.append(self._statement(statement))
+            if slot is not None and isinstance(statement, _DECLARATIONS):
+                slot += 1
+        return optimized
+
+    def _statement(self, statement: typing.Any) -> typing.Any:
+        match statement:
+            case stmt.Block():
+                statements = self._statements(statement.statements, 0)
+                return self._rebuild(statement, statements=statements)
+            case stmt.Function():
+                return self._function(statement, has_this=False)
+            case stmt.Class():
+                methods = [
+                    self._function(method, has_this=True)
+                    for method in statement.methods
+                ]
+                return self._rebuild(statement, methods=methods)
+            case stmt.If():
+                then_branch = self._statement(statement.then_branch)
+                else_branch = statement.else_branch
+                if else_branch is not None:
+                    else_branch = self._statement(else_branch)
+                return self._rebuild(
+                    statement, then_branch=then_branch, else_branch=else_branch
+                )
+            case stmt.While():
+                (loop,) = self._loop(statement, None, None)
+                return loop
+        return statement
+
+    def _function(self, function: stmt.Function, has_this: bool) -> stmt.Function:
+        # Methods find `this` in slot 0, ahead of the parameters.
+        slot = len(function.params) + has_this
+        return self._rebuild(function, body=self._statements(function.body, slot))
+
+    def _loop(
+        self, node: stmt.While, free: int | None, previous: typing.Any
+    ) -> list[typing.Any]:
+        """Optimize a loop, returning it along with any locals it now needs.
+
+        `free` is the slot a local declared just before the loop would take,
+        or None if the loop must be wrapped in a block to declare one.
+        `previous` is the statement before the loop, which may declare its
+        counter.
+        """
+        node = self._rebuild(node, body=self._statement(node.body))
+        effects = _effects(node)
+
+        products = {}
+        if free is not None and isinstance(previous, stmt.Var):
+            products = self._products(node, previous, free - 1)
+        invariants: list[tuple[typing.Any, int]] = []
+        self._find_invariants(node.condition, 0, effects, invariants)
+        self._find_invariants(node.body, 0, effects, invariants)
+        if not products and not invariants:
+            return [node]
+
+        wrap = free is None
+        if wrap:
+            # Everything the loop resolves outside itself is one block further.
+            self._shift(node, 0)
+            free = 0
+
+        declarations = []
+        replacements: dict[typing.Any, typing.Any] = {}
+        updates = []
+        if products:
+            start = previous.initializer.value
+            step = counted_loop.match(node, self._locals).step
+        for factor, occurrences in products.items():
+            name = self._temporary("product", occurrences[0][0])
+            declarations.append(stmt.Var(name, expr.Literal(start * factor)))
+            for occurrence, depth in occurrences:
+                replacements[occurrence] = self._variable(name, depth, free)
+            plus = tokens.Token(tokens.TokenType.PLUS, "+", None, name.line)
+            total = expr.Binary(
+                self._variable(name, 1, free), plus, expr.Literal(step * factor)
+            )
+            assignment = expr.Assign(name, total)
+            self._interpreter.resolve(assignment, 1, free)
+            updates.append(stmt.Expression(assignment))
+            free += 1
+
+        depths: dict[typing.Any, set[int]] = {}
+        for invariant, depth in invariants:
+            depths.setdefault(invariant, set()).add(depth)
+        for invariant, depth in invariants:
+            # A hash-consed subtree can be found more than once. It is hoisted
+            # once, and only if every occurrence is in the same scope.
+            if invariant in replacements or len(depths[invariant]) > 1:
+                continue
+            name = self._temporary("hoisted", invariant)
+            declarations.append(stmt.Var(name, None))
+            variable = self._variable(name, depth, free)
+            replacements[invariant] = expr.Hoisted(variable, invariant)
+            free += 1
+
+        node = self._replace(node, replacements)
+        if updates:
+            body = node.body
+            node = self._rebuild(node, body=stmt.Block([*body.statements, *updates]))
+        if wrap:
+            return [stmt.Block([*declarations, node])]
+        return [*declarations, node]
+
+    def _products(
+        self, node: stmt.While, counter: stmt.Var, slot: int
+    ) -> dict[float, list[tuple[expr.Binary, int]]]:
+        """Find the products to reduce in a counted loop, keyed on factor.
+
+        `counter` declares the local in `slot` just before the loop.
+        """
+        loop = counted_loop.match(node, self._locals)
+        if (
+            loop is None
+            or loop.distance != 0
+            or loop.slot != slot
+            or loop.limit is None
+            or loop.derived
+            or not _is_natural(loop.step)
+            or not isinstance(counter.initializer, expr.Literal)
+            or type(counter.initializer.value) is not float
+            or not counter.initializer.value.is_integer()
+        ):
+            return {}
+        # The increment must be the only assignment to the counter.
+        name = counter.name.lexeme
+        for assignment in optimizer.walk([node]):
+            if (
+                isinstance(assignment, expr.Assign)
+                and assignment.name.lexeme == name
+                and assignment is not loop.increment.expression
+            ):
+                return {}
+
+        largest = max(abs(counter.initializer.value), abs(loop.limit)) + loop.step
+        products: dict[float, list[tuple[expr.Binary, int]]] = {}
+        self._find_products(loop.body, 1, slot, products)
+        return {
+            factor: occurrences
+            for factor, occurrences in products.items()
+            if largest * factor < _EXACT_LIMIT
+        }
+
+    def _find_products(
+        self,
+        node: typing.Any,
+        depth: int,
+        slot: int,
+        products: dict[float, list[tuple[expr.Binary, int]]],
+    ):
+        """Collect `i * k` and `k * i` below `node`, which is `depth` scopes in."""
+        if (
+            isinstance(node, expr.Binary)
+            and node.operator.type == tokens.TokenType.STAR
+        ):
+            for counter, factor in ((node.left, node.right), (node.right, node.left)):
+                if (
+                    isinstance(counter, expr.Variable)
+                    and self._locals.get(counter) == (depth, slot)
+                    and isinstance(factor, expr.Literal)
+                    and type(factor.value) is float
+                    and _is_natural(factor.value)
+                ):
+                    products.setdefault(factor.value, []).append((node, depth))
+                    return
+
+        match node:
+            case stmt.Function() | stmt.Class():
+                # A function may run after the loop, or at any point in it.
+                return
+            case expr.Hoisted():
+                # Already worked out once per run of an inner loop.
+                return
+            case stmt.Block():
+                depth += 1
+        for child in _children(node):
+            self._find_products(child, depth, slot, products)
+
+    def _find_invariants(
+        self,
+        node: typing.Any,
+        depth: int,
+        effects: _Effects,
+        found: list[tuple[typing.Any, int]],
+    ):
+        """Collect the largest invariant expressions below `node` worth hoisting."""
+        if self._is_invariant(node, depth, effects):
+            if _has_operation(node):
+                found.append((node, depth))
+            return
+
+        match node:
+            case stmt.Function() | stmt.Class() | expr.Hoisted():
+                return
+            case expr.Call():
+                # A method is looked up with the call, so leave its callee be.
+                for argument in node.arguments:
+                    self._find_invariants(argument, depth, effects, found)
+                return
+            case stmt.Block():
+                depth += 1
+        for child in _children(node):
+            self._find_invariants(child, depth, effects, found)
+
+    def _is_invariant(self, node: typing.Any, depth: int, effects: _Effects) -> bool:
+        """Whether `node` gives the same value each time the loop reaches it."""
+        match node:
+            case expr.Literal() | expr.This():
+                return True
+            case expr.Variable():
+                return self._is_unchanged(node, depth, effects)
+            case expr.Grouping() | expr.Hoisted():
+                return self._is_invariant(node.expression, depth, effects)
+            case expr.Unary():
+                return self._is_invariant(node.right, depth, effects)
+            case expr.Binary() | expr.Logical():
+                return self._is_invariant(
+                    node.left, depth, effects
+                ) and self._is_invariant(node.right, depth, effects)
+            case expr.Get():
+                return (
+                    not effects.calls
+                    and node.name.lexeme not in effects.fields
+                    and self._is_invariant(node.instance, depth, effects)
+                )
+        return False
+
+    def _is_unchanged(
+        self, variable: expr.Variable, depth: int, effects: _Effects
+    ) -> bool:
+        resolved = self._locals.get(variable)
+        if resolved is not None and resolved[0] < depth:
+            # Declared inside the loop.
+            return False
+        name = variable.name.lexeme
+        if name in effects.assigned:
+            return False
+        if not effects.calls:
+            return True
+        if resolved is None and not self._whole_program:
+            # A function declared elsewhere may assign any global.
+            return False
+        # A called function can only assign a variable under a name assigned
+        # somewhere.
+        return name not in self._assigned
+
+    def _temporary(self, kind: str, node: typing.Any) -> tokens.Token:
+        """Name a new local, which no identifier in the source can clash with."""
+        name = f"{kind}#{self._temporaries}"
+        self._temporaries += 1
+        return tokens.Token(tokens.TokenType.IDENTIFIER, name, None, _line(node))
+
+    def _variable(self, name: tokens.Token, distance: int, slot: int) -> expr.Variable:
+        variable = expr.Variable(name)
+        self._interpreter.resolve(variable, distance, slot)
+        return variable
+
+    def _shift(self, node: typing.Any, depth: int):
+        """Move what `node` resolves outside the loop one scope further out.
+
+        `node` is `depth` scopes inside the loop.
+        """
+        resolved = self._locals.get(node)
+        if resolved is not None and resolved[0] >= depth:
+            self._interpreter.resolve(node, resolved[0] + 1, resolved[1])
+
+        match node:
+            case stmt.Class():
+                if node.superclass is not None:
+                    self._shift(node.superclass, depth)
+                    # The methods close over a scope holding `super`.
+                    depth += 1
+                for method in node.methods:
+                    self._shift(method, depth)
+                return
+            case stmt.Block() | stmt.Function():
+                depth += 1
+        for child in _children(node):
+            self._shift(child, depth)
+
+    def _replace(self, node: typing.Any, replacements: dict[typing.Any, typing.Any]):
+        """Return `node` with the given nodes below it replaced."""
+        replacement = replacements.get(node)
+        if replacement is not None:
+            return replacement
+
+        fields = {}
+        for field in dataclasses.fields(node):
+            value = getattr(node, field.name)
+            if isinstance(value, list):
+                fields[field.name] = [
+                    self._replace(item, replacements)
+                    if hasattr(item, "accept")
+                    else item
+                    for item in value
+                ]
+            elif hasattr(value, "accept"):
+                fields[field.name] = self._replace(value, replacements)
+        return self._rebuild(node, **fields)
+
+    def _rebuild(self, node: typing.Any, **fields: typing.Any) -> typing.Any:
+        """Return `node` with `fields` replaced, or `node` itself if unchanged."""
+        if all(_same(getattr(node, name), value) for name, value in fields.items()):
+            return node
+
+        rebuilt = dataclasses.replace(node, **fields)
+        resolved = self._locals.get(node)
+        if resolved is not None:
+            self._interpreter.resolve(rebuilt, *resolved)
+        return rebuilt
+
+
+def _effects(node: stmt.While) -> _Effects:
+    effects = _Effects(set(), set(), False)
+    for child in optimizer.walk([node]):
+        if isinstance(child, expr.Assign):
+            effects.assigned.add(child.name.lexeme)
+        elif isinstance(child, expr.Set):
+            effects.fields.add(child.name.lexeme)
+        elif isinstance(child, (expr.Call, expr.Inlined)):
+            effects.calls = True
+    return effects
+
+
+def _has_operation(node: typing.Any) -> bool:
+    while isinstance(node, expr.Grouping):
+        node = node.expression
+    return not isinstance(node, (expr.Literal, expr.Variable, expr.This))
+
+
+def _is_natural(value: float) -> bool:
+    return value > 0 and value.is_integer()
+
+
+def _children(node: typing.Any) -> typing.Iterator[typing.Any]:
+    for field in dataclasses.fields(node):
+        value = getattr(node, field.name)
+        if isinstance(value, list):
+            yield from (item for item in value if hasattr(item, "accept"))
+        elif hasattr(value, "accept"):
+            yield value
+
+
+def _line(node: typing.Any) -> int:
+    """The line of the first token found in `node`."""
+    for child in optimizer.walk([node]):
+        for field in dataclasses.fields(child):
+            value = getattr(child, field.name)
+            if isinstance(value, tokens.Token):
+                return value.line
+    return 0
+
+
+def _same(old: typing.Any, new: typing.Any) -> bool:
+    if isinstance(old, list) and isinstance(new, list):
+        return len(old) == len(new) and all(a is b for a, b in zip(old, new))
+    return old is new
@@ -1,6 +1,7 @@
 import interpreter
 import loxfunction
 import loxinstance
+import shape
 
 
 class LoxClass:
@@ -11,31 +12,29 @@ class LoxClass:
         methods: dict[str, loxfunction.LoxFunction],
     ):
         self._name = name
-        self._methods = methods
         self._superclass = superclass
+        # Inherited methods are merged in up front, so a lookup never walks the
+        # superclass chain. Classes cannot change once created, so the merged
+        # table and the initializer found in it stay valid.
+        self._methods = methods
+        if superclass is not None:
+            self._methods = {**superclass._methods, **methods}
+        self._initializer = self._methods.get("init")
+        self._arity = 0 if self._initializer is None else self._initializer.arity()
+        self._root_shape = shape.Shape(self)
 
     def __str__(self) -> str:
         return self._name
 
     def call(self, interpret: interpreter.Interpreter, arguments: list[object]):
         instance = loxinstance.LoxInstance(self)
-        initializer = self.find_method("init")
-        if initializer:
-            initializer.bind(instance).call(interpret, arguments)
+        if self._initializer is not None:
+            self._initializer.invoke(interpret, instance, arguments)
 
         return instance
 
     def arity(self) -> int:
-        initializer = self.find_method("init")
-        if not initializer:
-            return 0
-        return initializer.arity()
+        return self._arity
 
     def find_method(self, name: str) -> loxfunction.LoxFunction | None:
-        if name in self._methods:
-            return self._methods[name]
-
-        if self._superclass:
-            return self._superclass.find_method(name)
-
-        return None
+        return self._methods.get(name)
@@ -1,7 +1,8 @@
+import completion
 import environment
 import interpreter
 import loxinstance
-import return_exception
+import memoize
 import stmt
 
 
@@ -17,28 +18,128 @@ class LoxFunction:
         self._is_initializer = is_initializer
 
     def call(self, interpret: interpreter.Interpreter, arguments: list[object]):
-        env = environment.Environment(self._closure)
-        for dec, arg in zip(self._declaration.params, arguments):
-            env.define(dec.lexeme, arg)
+        # The frame takes ownership of the argument list: parameters occupy the
+        # first slots and the body's locals are appended after them.
+        env = environment.Environment(self._closure, arguments)
 
-        try:
-            interpret._execute_block(self._declaration.body, env)
-        except return_exception.Return as e:
-            if self._is_initializer:
-                return self._closure.get_at(0, "this")
-            return e._value
+        result = interpret._execute_body(self._declaration, env)
+
+        if result is None:
+            return None
+        value = result.value
+        if type(value) is completion.TailCall:
+            return _tail_calls(interpret, value)
+        return value
+
+    def invoke(
+        self,
+        interpret: interpreter.Interpreter,
+        receiver: loxinstance.LoxInstance,
+        arguments: list[object],
+    ):
+        """Call this function as a method of `receiver`.
+
+        Methods find `this` in slot 0 of their own frame, ahead of the
+        parameters, so no bound method or extra environment is needed.
+        """
+        env = environment.Environment(self._closure, [receiver, *arguments])
+
+        result = interpret._execute_body(self._declaration, env)
 
         if self._is_initializer:
-            return self._closure.get_at(0, "this")
-        return None
+            return receiver
+        if result is None:
+            return None
+        value = result.value
+        if type(value) is completion.TailCall:
+            return _tail_calls(interpret, value)
+        return value
 
     def arity(self) -> int:
         return len(self._declaration.params)
 
-    def bind(self, instance: loxinstance.LoxInstance) -> LoxFunction:
-        env = environment.Environment(self._closure)
-        env.define("this", instance)
-        return LoxFunction(self._declaration, env, self._is_initializer)
+    def bind(self, instance: loxinstance.LoxInstance) -> BoundMethod:
+        return BoundMethod(instance, self)
 
     def __str__(self) -> str:
         return f"<fn {self._declaration.name.lexeme}>"
+
+
+class BoundMethod:
+    """A method read off an instance without being called straight away."""
+
+    def __init__(self, receiver: loxinstance.LoxInstance, method: LoxFunction):
+        self._receiver = receiver
+        self._method = method
+
+    def call(self, interpret: interpreter.Interpreter, arguments: list[object]):
+        return self._method.invoke(interpret, self._receiver, arguments)
+
+    def arity(self) -> int:
+        return self._method.arity()
+
+    def __str__(self) -> str:
+        return str(self._method)
+
+
+class MemoizedFunction(LoxFunction):
+    """A function that `purity` found pure, which remembers its results.
+
+    Only calls whose arguments are all numbers, strings, booleans or nil are
+    remembered. Instances and functions are compared by identity in Lox, and
+    keeping them alive in the cache would be surprising. A call that raises
+    an error records nothing.
+    """
+
+    def __init__(
+        self,
+        declaration: stmt.Function,
+        closure: environment.Environment,
+        memo: memoize.Memo,
+    ):
+        super().__init__(declaration, closure, False)
+        self._memo = memo
+
+    def call(self, interpret: interpreter.Interpreter, arguments: list[object]):
+        key = memoize.key(arguments)
+        if key is None:
+            return super().call(interpret, arguments)
+
+        value = self._memo.lookup(key)
+        if value is memoize.MISSING:
+            value = super().call(interpret, arguments)
+            self._memo.store(key, value)
+        return value
+
+
+def _tail_calls(interpret: interpreter.Interpreter, call: completion.TailCall):
+    """Make the tail call a function returned, and any that it returns in turn.
+
+    Each call takes over the innermost entry of the Lox call stack and runs in
+    this loop rather than in a nested Python call, so neither stack grows.
+    """
+    frames = interpret._frames
+    while True:
+        callee = call.callee
+        receiver = call.receiver
+        if type(callee) is BoundMethod:
+            callee, receiver = callee._method, callee._receiver
+        frames[-1] = callee
+        # A memoized function is run here too, without its memo, so that its
+        # tail calls stay in constant space as well.
+        if not isinstance(callee, LoxFunction):
+            return callee.call(interpret, call.arguments)
+
+        arguments = call.arguments
+        if receiver is not None:
+            arguments = [receiver, *arguments]
+        env = environment.Environment(callee._closure, arguments)
+        result = interpret._execute_body(callee._declaration, env)
+
+        if callee._is_initializer:
+            return receiver
+        if result is None:
+            return None
+        if type(result.value) is not completion.TailCall:
+            return result.value
+        call = result.value
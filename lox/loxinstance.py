@@ -1,25 +1,62 @@
 import errors
+import inline_cache
 import loxclass
 import tokens
 
 
 class LoxInstance:
+    __slots__ = ("_shape", "_values")
+
     def __init__(self, klass: loxclass.LoxClass):
-        self._klass = klass
-        self._fields: dict[str, object] = {}
+        # Field values live in `_values` at the slots given by `_shape`.
+        self._shape = klass._root_shape
+        self._values: list[object] = []
 
     def __str__(self) -> str:
         return f"{self._klass} instance"
 
-    def get(self, name: tokens.Token):
-        if name.lexeme in self._fields:
-            return self._fields[name.lexeme]
+    @property
+    def _klass(self) -> loxclass.LoxClass:
+        return self._shape.klass
+
+    def get(
+        self, name: tokens.Token, cache: inline_cache.PropertyCache | None = None
+    ):
+        shape = self._shape
+        if cache is None:
+            slot, method = shape.lookup(name.lexeme)
+        elif shape is cache._key:
+            # The monomorphic case of `cache.lookup`, inlined.
+            cache.hits += 1
+            slot, method = cache._entry
+        else:
+            slot, method = cache.lookup(shape)
+
+        if slot is not None:
+            return self._values[slot]
 
-        method = self._klass.find_method(name.lexeme)
         if method:
             return method.bind(self)
 
         raise errors.RuntimeError(name, f"Undefined property '{name.lexeme}'")
 
-    def set(self, name: tokens.Token, value: object):
-        self._fields[name.lexeme] = value
+    def set(
+        self,
+        name: tokens.Token,
+        value: object,
+        cache: inline_cache.FieldCache | None = None,
+    ):
+        shape = self._shape
+        if cache is None:
+            slot, next_shape = shape.transition(name.lexeme)
+        elif shape is cache._key:
+            cache.hits += 1
+            slot, next_shape = cache._entry
+        else:
+            slot, next_shape = cache.lookup(shape)
+
+        if next_shape is shape:
+            self._values[slot] = value
+        else:
+            self._values.append(value)
+            self._shape = next_shape
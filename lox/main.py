@@ -1,27 +1,96 @@
 import argparse
+import functools
+import os
+import sys
+import typing
 
+import aot
+import cache
+import disassembler
 import errors
+import interpreter
+import profiler
+import repl
+import tiering
+from closure_interpreter import ClosureInterpreter
+from inliner import Inliner
 from interpreter import Interpreter
+from loop_optimizer import LoopOptimizer
+from optimizer import Optimizer
 from parser import Parser
+from purity import Purity
 from resolver import Resolver
-from scanner import Scanner
+from scanner import Scanner, scan_declarations
+from vm import VM
+
+# How much of a file `--stream` reads at a time.
+STREAM_CHUNK_SIZE = 1 << 16
+
+
+ENGINES = {
+    "tree": Interpreter,
+    "closure": ClosureInterpreter,
+    "vm": VM,
+}
 
 
 class Lox:
-    def __init__(self):
-        self._interpreter = Interpreter()
+    def __init__(
+        self,
+        engine: str = "tree",
+        disassemble: bool = False,
+        stats: bool = False,
+        optimize: bool = True,
+        max_depth: int = interpreter.MAX_CALL_DEPTH,
+        memoize: bool = False,
+        report_inlining: bool = False,
+        tier_threshold: int = tiering.TIER_THRESHOLD,
+        hash_cons: bool = False,
+        cache: bool = True,
+        profile: str | None = None,
+        profile_output: str | None = None,
+    ):
+        self._interpreter = ENGINES[engine](max_depth)
+        if engine == "tree":
+            self._interpreter.tier(tier_threshold)
+        self._disassemble = disassemble
+        self._stats = stats
+        self._optimize = optimize
+        self._memoize = memoize
+        self._report_inlining = report_inlining
+        self._hash_cons = hash_cons
+        self._cache = cache
+        self._profile = profile
+        self._profile_output = profile_output
+        # "hit" or "miss" once a file has been run with the cache on.
+        self._cache_status: str | None = None
+        # What the inliner reported on the last program, for the cache.
+        self._inlining: list[tuple[int, str]] = []
 
     def runPrompt(self):
+        """Read and run entries until the input ends; see `repl.Session`.
+
+        The prompts are only shown when a person is typing.
+        """
+        session = repl.Session(
+            self._interpreter, self._optimize, self._hash_cons, self._report_inlining
+        )
+        interactive = sys.stdin.isatty()
         while True:
-            line = input("> ")
-            if line:
-                self._run(line)
-                errors.reset()
+            prompt = "... " if session.continuing else "> "
+            try:
+                line = input(prompt if interactive else "")
+            except EOFError:
+                if session.finish():
+                    self._print_stats()
+                return
+            if session.enter(line):
+                self._print_stats()
 
     def runFile(self, file: str) -> int:
         with open(file, "r") as f:
             content = f.read()
-            self._run(content)
+            self._run(content, file)
             if errors.is_error():
                 return 65
             elif errors.is_runtime_error():
@@ -29,27 +98,296 @@ class Lox:
             else:
                 return 0
 
-    def _run(self, content):
+    def streamFile(self, file: str) -> int:
+        """Run a Lox program one top-level declaration at a time, as it is read.
+
+        Each declaration is parsed, resolved, optimized and run before the
+        next is read, and is then released, so memory does not grow with the
+        length of the program. After an error nothing more runs, but the rest
+        is still checked for syntax errors.
+        """
+        resolver = Resolver(self._interpreter)
+        with open(file, "r") as f:
+            chunks = iter(functools.partial(f.read, STREAM_CHUNK_SIZE), "")
+            for tokens in scan_declarations(chunks):
+                for statement in Parser(tokens, self._hash_cons).declarations():
+                    if errors.is_error() or errors.is_runtime_error():
+                        continue
+                    resolver._resolve([statement])
+                    if errors.is_error():
+                        continue
+                    statements = [statement]
+                    if self._optimize:
+                        statements = Optimizer(self._interpreter).optimize(statements)
+                        optimizer = LoopOptimizer(
+                            self._interpreter, whole_program=False
+                        )
+                        statements = optimizer.optimize(statements)
+                    self._interpreter.interpret(statements)
+                    for finished in statements:
+                        self._interpreter.release(finished)
+        self._print_stats()
+        if errors.is_error():
+            return 65
+        elif errors.is_runtime_error():
+            return 70
+        return 0
+
+    def compileFile(self, file: str, output: str) -> int:
+        """Compile a Lox program into a Python module; see `aot`."""
+        with open(file, "r") as f:
+            statements = self._front_end(f.read())
+        if statements is None:
+            return 65
+        source = aot.module(self._interpreter, statements, file)
+        with open(output, "w") as f:
+            f.write(source)
+        return 0
+
+    def _run(self, content, file: str | None = None):
         """Execute a Lox program"""
+        if file is not None and self._cache:
+            statements = self._cached_front_end(content, file)
+        else:
+            statements = self._front_end(content)
+        if statements is None:
+            return
+        if self._memoize:
+            self._interpreter.memoize(Purity(self._interpreter).analyze(statements))
+        if self._disassemble:
+            print(disassembler.disassemble(self._interpreter.compile(statements)))
+            return
+        if self._profile is not None:
+            self._run_profiled(statements, file)
+        else:
+            self._interpreter.interpret(statements)
+        self._print_stats()
+
+    def _run_profiled(self, statements: list[typing.Any], file: str | None):
+        """Run a program under `profiler.Profiler`, reporting on stderr."""
+        profile = profiler.Profiler(self._interpreter, self._profile)
+        profile.start()
+        try:
+            self._interpreter.interpret(statements)
+        finally:
+            profile.stop()
+        print(profile.report(), file=sys.stderr)
+        output = self._profile_output
+        if output is None:
+            stem = os.path.splitext(os.path.basename(file or "lox"))[0]
+            output = f"{stem}.collapsed"
+        with open(output, "w") as f:
+            f.writelines(f"{stack}\n" for stack in profile.collapsed())
+        print(f"collapsed stacks written to {output}", file=sys.stderr)
+
+    def _print_stats(self):
+        if self._stats:
+            if self._cache_status is not None:
+                print(f"front end cache: {self._cache_status}", file=sys.stderr)
+            for name, value in self._interpreter.stats().items():
+                print(f"{name}: {value}", file=sys.stderr)
+
+    def _cached_front_end(self, content: str, file: str) -> list[typing.Any] | None:
+        """Run `_front_end` on the program in `file`, unless it is cached."""
+        key = cache.key(content, optimize=self._optimize, hash_cons=self._hash_cons)
+        program = cache.load(file, key)
+        if program is not None:
+            self._cache_status = "hit"
+            for node, (depth, slot) in program.resolutions.items():
+                self._interpreter.resolve(node, depth, slot)
+            self._report(program.inlining)
+            return program.statements
+
+        self._cache_status = "miss"
+        statements = self._front_end(content)
+        if statements is not None:
+            resolved = self._interpreter._locals
+            program = cache.program(key, statements, resolved, self._inlining)
+            if not cache.store(file, program):
+                self._cache_status = "miss (could not write the cache)"
+        return statements
+
+    def _front_end(self, content: str) -> list[typing.Any] | None:
+        """Scan, parse, resolve and optimize a program, or None on an error."""
         scanner = Scanner(content)
         tokens = scanner.scan_tokens()
-        parser = Parser(tokens)
+        parser = Parser(tokens, self._hash_cons)
         statements = parser.parse()
         if errors.is_error():
-            return
+            return None
         resolver = Resolver(self._interpreter)
         resolver._resolve(statements)
         if errors.is_error():
-            return
-        self._interpreter.interpret(statements)
+            return None
+        if self._optimize:
+            statements = Optimizer(self._interpreter).optimize(statements)
+            statements = LoopOptimizer(self._interpreter).optimize(statements)
+            inliner = Inliner(self._interpreter)
+            statements = inliner.inline(statements)
+            self._inlining = inliner.report
+            self._report(inliner.report)
+        return statements
+
+    def _report(self, inlining: list[tuple[int, str]]):
+        if self._report_inlining:
+            for line, message in inlining:
+                print(f"[line {line}] {message}", file=sys.stderr)
+
+
+def compile_command(arguments: list[str]) -> int:
+    """`lox compile prog.lox -o prog.py`: translate a program to Python once."""
+    parser = argparse.ArgumentParser(
+        prog="lox compile",
+        description="Compile a Lox program to a standalone Python module",
+    )
+    parser.add_argument("file")
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="where to write the module (default: the file with a .py suffix)",
+    )
+    parser.add_argument(
+        "--no-optimize",
+        dest="optimize",
+        action="store_false",
+        help="compile the program without constant folding or dead-code removal",
+    )
+    args = parser.parse_args(arguments)
+    output = args.output or os.path.splitext(args.file)[0] + ".py"
+    return Lox(optimize=args.optimize).compileFile(args.file, output)
 
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["compile"]:
+        sys.exit(compile_command(sys.argv[2:]))
     parser = argparse.ArgumentParser(prog="lox", description="Lox interpreter")
     parser.add_argument("file", nargs="?", default=None)
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES.keys(),
+        default="tree",
+        help="execution engine (default: tree)",
+    )
+    parser.add_argument(
+        "--disassemble",
+        action="store_true",
+        help="print the compiled bytecode instead of running it (vm engine only)",
+    )
+    parser.add_argument(
+        "--no-optimize",
+        dest="optimize",
+        action="store_false",
+        help="run the program without constant folding or dead-code removal",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print runtime counters to stderr after running",
+    )
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        default=interpreter.MAX_CALL_DEPTH,
+        help="how deeply calls may nest before a stack overflow "
+        f"(default: {interpreter.MAX_CALL_DEPTH})",
+    )
+    parser.add_argument(
+        "--memoize",
+        action="store_true",
+        help="cache the results of pure functions (tree and closure engines only)",
+    )
+    parser.add_argument(
+        "--report-inlining",
+        action="store_true",
+        help="list which calls were inlined, and why others were not, on stderr",
+    )
+    parser.add_argument(
+        "--tier-threshold",
+        type=int,
+        default=None,
+        help="calls and loop iterations after which a function is translated to "
+        f"Python, or 0 for never (tree engine only, default: {tiering.TIER_THRESHOLD})",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="run the file one declaration at a time as it is read, "
+        "without inlining or the cache",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="cache",
+        action="store_false",
+        help=f"neither read nor write the parsed program in {cache.CACHE_DIRECTORY}",
+    )
+    parser.add_argument(
+        "--hash-cons",
+        action="store_true",
+        help="share one node between identical subtrees of literals and operators",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="report the time spent in each function and line on stderr "
+        "(tree and closure engines only)",
+    )
+    parser.add_argument(
+        "--profile-mode",
+        choices=profiler.MODES,
+        default="calls",
+        help="time every call, or sample the stack at a fraction of the cost "
+        "(default: calls)",
+    )
+    parser.add_argument(
+        "--profile-output",
+        default=None,
+        help="where --profile writes collapsed stacks for a flame graph "
+        "(default: the file's name with .collapsed, in the current directory)",
+    )
     args = parser.parse_args()
-    lox = Lox()
-    if args.file:
+    if args.disassemble and args.engine != "vm":
+        parser.error("--disassemble requires --engine=vm")
+    if args.memoize and args.engine == "vm":
+        parser.error("--memoize requires --engine=tree or --engine=closure")
+    if args.memoize and not args.file:
+        # Later lines could reassign a global an earlier function relies on.
+        parser.error("--memoize requires a file")
+    if args.max_depth < 1:
+        parser.error("--max-depth must be at least 1")
+    if args.tier_threshold is not None and args.engine != "tree":
+        parser.error("--tier-threshold requires --engine=tree")
+    if args.stream and not args.file:
+        parser.error("--stream requires a file")
+    if args.stream and (args.memoize or args.disassemble):
+        # Both need the whole program before anything runs.
+        parser.error("--stream cannot be combined with --memoize or --disassemble")
+    if args.profile and args.engine == "vm":
+        parser.error("--profile requires --engine=tree or --engine=closure")
+    if args.profile and (not args.file or args.stream):
+        parser.error("--profile requires a file, and cannot be combined with --stream")
+    if args.profile_output is not None and not args.profile:
+        parser.error("--profile-output requires --profile")
+    if args.tier_threshold is None:
+        args.tier_threshold = tiering.TIER_THRESHOLD
+    if args.tier_threshold < 0:
+        parser.error("--tier-threshold must not be negative")
+    lox = Lox(
+        args.engine,
+        args.disassemble,
+        args.stats,
+        args.optimize,
+        args.max_depth,
+        args.memoize,
+        args.report_inlining,
+        args.tier_threshold,
+        args.hash_cons,
+        args.cache,
+        args.profile_mode if args.profile else None,
+        args.profile_output,
+    )
+    if args.file and args.stream:
+        lox.streamFile(args.file)
+    elif args.file:
         lox.runFile(args.file)
     else:
         lox.runPrompt()
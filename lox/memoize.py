@@ -0,0 +1,85 @@
+import collections
+import typing
+
+# The most results a memoized function keeps. The least recently used one is
+# dropped to make room for another.
+MEMO_SIZE = 4096
+
+# Returned by `Memo.lookup` for arguments it has no result for.
+MISSING = object()
+
+
+class Memo:
+    """The results a pure function has returned, keyed on its arguments.
+
+    See `loxfunction.MemoizedFunction`, which fills it in.
+    """
+
+    __slots__ = ("name", "hits", "misses", "evictions", "_results")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._results: collections.OrderedDict[tuple, typing.Any] = (
+            collections.OrderedDict()
+        )
+
+    def lookup(self, key: tuple) -> typing.Any:
+        results = self._results
+        if key in results:
+            self.hits += 1
+            results.move_to_end(key)
+            return results[key]
+        self.misses += 1
+        return MISSING
+
+    def store(self, key: tuple, value: typing.Any):
+        results = self._results
+        results[key] = value
+        if len(results) > MEMO_SIZE:
+            results.popitem(last=False)
+            self.evictions += 1
+
+
+def key(arguments: list[object]) -> tuple | None:
+    """Build a key that tells any two different argument lists apart.
+
+    Returns None if an argument is not a number, string, boolean or nil.
+    Values are paired with their type, since Python treats `true` and `1` as
+    equal. A zero is keyed on its text, since `0` and `-0` are equal but give
+    different results when divided by.
+    """
+    parts = []
+    for argument in arguments:
+        kind = type(argument)
+        if kind is float:
+            parts.append(kind)
+            parts.append(argument if argument else str(argument))
+        elif kind is str or kind is bool or argument is None:
+            parts.append(kind)
+            parts.append(argument)
+        else:
+            return None
+    return tuple(parts)
+
+
+def stats(memos: typing.Iterable[Memo]) -> dict[str, typing.Any]:
+    """Count cache hits and misses over all memoized functions, and per name."""
+    summary: dict[str, typing.Any] = {
+        "memoized functions": 0,
+        "memo hits": 0,
+        "memo misses": 0,
+        "memo evictions": 0,
+    }
+    rates = {}
+    for memo in memos:
+        summary["memoized functions"] += 1
+        summary["memo hits"] += memo.hits
+        summary["memo misses"] += memo.misses
+        summary["memo evictions"] += memo.evictions
+        calls = memo.hits + memo.misses
+        if calls:
+            rates[f"memo hit rate {memo.name}"] = f"{memo.hits / calls:.1%}"
+    return {**summary, **rates}
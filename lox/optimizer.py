@@ -0,0 +1,286 @@
+import dataclasses
+import operator
+import typing
+
+import expr
+import interpreter
+import stmt
+import tokens
+
+# Marks a local slot whose value is not known at compile time.
+_UNKNOWN = object()
+
+
+class Optimizer:
+    """Simplify a resolved program before it runs.
+
+    Folds operators whose operands are literals, replaces reads of local
+    variables that are never assigned with their literal initializer, and
+    removes branches and loops whose conditions are constant along with
+    statements that follow a `return`.
+
+    Only operations that cannot fail are folded, so an expression such as
+    `"a" - 1` is left alone and still reports its error when it runs. Rebuilt
+    nodes take over the resolution of the nodes they replace, so the engine's
+    side table stays complete.
+    """
+
+    def __init__(self, interpret: interpreter.Interpreter):
+        self._interpreter = interpret
+        self._locals: dict[object, tuple[int, int]] = interpret._locals
+        # Mirrors the resolver's scopes: each slot holds the literal the local
+        # always has, or _UNKNOWN.
+        self._scopes: list[list[typing.Any]] = []
+        self._assigned: set[str] = set()
+
+    def optimize(self, statements: list[typing.Any]) -> list[typing.Any]:
+        # A local is only treated as constant if nothing anywhere assigns to a
+        # variable of that name, which is cheap to check and always safe.
+        self._assigned = {
+            node.name.lexeme
+            for node in walk(statements)
+            if isinstance(node, expr.Assign)
+        }
+        return self._statements(statements)
+
+    def visit_block(self, block: stmt.Block) -> stmt.Block:
+        self._scopes.append([])
+        statements = self._statements(block.statements)
+        self._scopes.pop()
+        return self._rebuild(block, statements=statements)
+
+    def visit_var(self, var: stmt.Var) -> stmt.Var:
+        initializer = var.initializer
+        if initializer is not None:
+            initializer = self._optimize(initializer)
+        if self._scopes:
+            constant = _UNKNOWN
+            if var.name.lexeme not in self._assigned:
+                if initializer is None:
+                    constant = expr.NIL
+                elif isinstance(initializer, expr.Literal):
+                    constant = initializer
+            self._scopes[-1].append(constant)
+        return self._rebuild(var, initializer=initializer)
+
+    def visit_function(self, function: stmt.Function) -> stmt.Function:
+        self._declare()
+        return self._function(function, has_this=False)
+
+    def visit_class(self, klass: stmt.Class) -> stmt.Class:
+        self._declare()
+        if klass.superclass is not None:
+            self._scopes.append([_UNKNOWN])
+        methods = [self._function(method, has_this=True) for method in klass.methods]
+        if klass.superclass is not None:
+            self._scopes.pop()
+        return self._rebuild(klass, methods=methods)
+
+    def visit_expression(self, statement: stmt.Expression) -> stmt.Expression | None:
+        expression = self._optimize(statement.expression)
+        if isinstance(expression, expr.Literal):
+            return None
+        return self._rebuild(statement, expression=expression)
+
+    def visit_print(self, statement: stmt.Print) -> stmt.Print:
+        return self._rebuild(statement, expression=self._optimize(statement.expression))
+
+    def visit_return(self, statement: stmt.Return) -> stmt.Return:
+        value = statement.value
+        if value is not None:
+            value = self._optimize(value)
+        return self._rebuild(statement, value=value)
+
+    def visit_if(self, statement: stmt.If) -> typing.Any:
+        condition = self._optimize(statement.condition)
+        then_branch = self._optimize(statement.then_branch)
+        else_branch = statement.else_branch
+        if else_branch is not None:
+            else_branch = self._optimize(else_branch)
+
+        if isinstance(condition, expr.Literal):
+            if interpreter.is_truthy(condition.value):
+                return then_branch
+            return else_branch
+        return self._rebuild(
+            statement,
+            condition=condition,
+            then_branch=self._statement(then_branch),
+            else_branch=else_branch,
+        )
+
+    def visit_while(self, statement: stmt.While) -> stmt.While | None:
+        condition = self._optimize(statement.condition)
+        if isinstance(condition, expr.Literal) and not interpreter.is_truthy(
+            condition.value
+        ):
+            return None
+        body = self._statement(self._optimize(statement.body))
+        return self._rebuild(statement, condition=condition, body=body)
+
+    def visit_literal(self, literal: expr.Literal) -> expr.Literal:
+        return literal
+
+    def visit_grouping(self, grouping: expr.Grouping) -> typing.Any:
+        # Parentheses only matter to the parser.
+        return self._optimize(grouping.expression)
+
+    def visit_variable(self, variable: expr.Variable) -> typing.Any:
+        resolved = self._locals.get(variable)
+        if resolved is None:
+            return variable
+
+        distance, slot = resolved
+        constant = self._scopes[-1 - distance][slot]
+        if constant is _UNKNOWN:
+            return variable
+        return constant
+
+    def visit_assign(self, assignment: expr.Assign) -> expr.Assign:
+        return self._rebuild(assignment, value=self._optimize(assignment.value))
+
+    def visit_this(self, this: expr.This) -> expr.This:
+        return this
+
+    def visit_super(self, super_expr: expr.Super) -> expr.Super:
+        return super_expr
+
+    def visit_unary(self, unary: expr.Unary) -> typing.Any:
+        right = self._optimize(unary.right)
+        if isinstance(right, expr.Literal):
+            value = right.value
+            match unary.operator.type:
+                case tokens.TokenType.BANG:
+                    return expr.Literal(not interpreter.is_truthy(value))
+                case tokens.TokenType.MINUS if type(value) is float:
+                    return expr.Literal(-value)
+        return self._rebuild(unary, right=right)
+
+    def visit_binary(self, binary: expr.Binary) -> typing.Any:
+        left = self._optimize(binary.left)
+        right = self._optimize(binary.right)
+        if isinstance(left, expr.Literal) and isinstance(right, expr.Literal):
+            folded = _fold(binary.operator.type, left.value, right.value)
+            if folded is not _UNKNOWN:
+                return expr.Literal(folded)
+        return self._rebuild(binary, left=left, right=right)
+
+    def visit_logical(self, logical: expr.Logical) -> typing.Any:
+        left = self._optimize(logical.left)
+        right = self._optimize(logical.right)
+        if isinstance(left, expr.Literal):
+            # `or` yields a truthy left operand and `and` a falsey one.
+            truthy = interpreter.is_truthy(left.value)
+            if truthy == (logical.operator.type == tokens.TokenType.OR):
+                return left
+            return right
+        return self._rebuild(logical, left=left, right=right)
+
+    def visit_call(self, call: expr.Call) -> expr.Call:
+        return self._rebuild(
+            call,
+            callee=self._optimize(call.callee),
+            arguments=[self._optimize(argument) for argument in call.arguments],
+        )
+
+    def visit_get(self, get: expr.Get) -> expr.Get:
+        return self._rebuild(get, instance=self._optimize(get.instance))
+
+    def visit_set(self, set_expr: expr.Set) -> expr.Set:
+        # Evaluated value-first to match the resolver; neither side declares.
+        value = self._optimize(set_expr.value)
+        instance = self._optimize(set_expr.instance)
+        return self._rebuild(set_expr, instance=instance, value=value)
+
+    def _optimize(self, node: typing.Any) -> typing.Any:
+        return node.accept(self)
+
+    def _statements(self, statements: list[typing.Any]) -> list[typing.Any]:
+        optimized = []
+        for statement in statements:
+            result = self._optimize(statement)
+            if result is not None:
+                optimized.append(result)
+            if isinstance(result, stmt.Return):
+                # Nothing after a return in the same list can run.
+                break
+        return optimized
+
+    def _statement(self, statement: typing.Any) -> typing.Any:
+        """Stand in an empty block where a statement was removed entirely."""
+        if statement is None:
+            return stmt.Block([])
+        return statement
+
+    def _function(self, function: stmt.Function, has_this: bool) -> stmt.Function:
+        # Methods find `this` in slot 0, ahead of the parameters.
+        scope = [_UNKNOWN] if has_this else []
+        scope.extend(_UNKNOWN for _ in function.params)
+        self._scopes.append(scope)
+        body = self._statements(function.body)
+        self._scopes.pop()
+        return self._rebuild(function, body=body)
+
+    def _declare(self):
+        if self._scopes:
+            self._scopes[-1].append(_UNKNOWN)
+
+    def _rebuild(self, node: typing.Any, **fields: typing.Any) -> typing.Any:
+        """Return `node` with `fields` replaced, or `node` itself if unchanged."""
+        if all(_same(getattr(node, name), value) for name, value in fields.items()):
+            return node
+
+        rebuilt = dataclasses.replace(node, **fields)
+        resolved = self._locals.get(node)
+        if resolved is not None:
+            self._interpreter.resolve(rebuilt, *resolved)
+        return rebuilt
+
+
+_NUMERIC_OPERATIONS = {
+    tokens.TokenType.PLUS: operator.add,
+    tokens.TokenType.MINUS: operator.sub,
+    tokens.TokenType.STAR: operator.mul,
+    tokens.TokenType.SLASH: operator.truediv,
+    tokens.TokenType.GREATER: operator.gt,
+    tokens.TokenType.GREATER_EQUAL: operator.ge,
+    tokens.TokenType.LESS: operator.lt,
+    tokens.TokenType.LESS_EQUAL: operator.le,
+}
+
+
+def _fold(kind: tokens.TokenType, left: typing.Any, right: typing.Any) -> typing.Any:
+    """Apply a binary operator to constants, or return _UNKNOWN if it could fail."""
+    match kind:
+        case tokens.TokenType.EQUAL_EQUAL:
+            return interpreter.is_equal(left, right)
+        case tokens.TokenType.BANG_EQUAL:
+            return not interpreter.is_equal(left, right)
+        case tokens.TokenType.PLUS if type(left) is str and type(right) is str:
+            return left + right
+
+    if type(left) is not float or type(right) is not float:
+        return _UNKNOWN
+    if kind == tokens.TokenType.SLASH and right == 0:
+        return _UNKNOWN
+    return _NUMERIC_OPERATIONS[kind](left, right)
+
+
+def _same(old: typing.Any, new: typing.Any) -> bool:
+    if isinstance(old, list) and isinstance(new, list):
+        return len(old) == len(new) and all(a is b for a, b in zip(old, new))
+    return old is new
+
+
+def walk(nodes: list[typing.Any]) -> typing.Iterator[typing.Any]:
+    """Yield every node in the given trees."""
+    pending = list(nodes)
+    while pending:
+        node = pending.pop()
+        yield node
+        for field in dataclasses.fields(node):
+            value = getattr(node, field.name)
+            if isinstance(value, list):
+                pending.extend(item for item in value if hasattr(item, "accept"))
+            elif hasattr(value, "accept"):
+                pending.append(value)
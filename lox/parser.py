@@ -5,18 +5,57 @@ import expr
 import stmt
 import tokens
 
+# How tightly each infix and postfix operator binds, loosest first.
+_ASSIGNMENT = 1
+_OR = 2
+_AND = 3
+_EQUALITY = 4
+_COMPARISON = 5
+_TERM = 6
+_FACTOR = 7
+_UNARY = 8
+_CALL = 9
+
+_INFIX = {
+    tokens.TokenType.EQUAL: _ASSIGNMENT,
+    tokens.TokenType.OR: _OR,
+    tokens.TokenType.AND: _AND,
+    tokens.TokenType.BANG_EQUAL: _EQUALITY,
+    tokens.TokenType.EQUAL_EQUAL: _EQUALITY,
+    tokens.TokenType.GREATER: _COMPARISON,
+    tokens.TokenType.GREATER_EQUAL: _COMPARISON,
+    tokens.TokenType.LESS: _COMPARISON,
+    tokens.TokenType.LESS_EQUAL: _COMPARISON,
+    tokens.TokenType.PLUS: _TERM,
+    tokens.TokenType.MINUS: _TERM,
+    tokens.TokenType.SLASH: _FACTOR,
+    tokens.TokenType.STAR: _FACTOR,
+    tokens.TokenType.LEFT_PARENTHESIS: _CALL,
+    tokens.TokenType.DOT: _CALL,
+}
+
 
 class Parser:
-    def __init__(self, tokens: list[tokens.Token]):
+    def __init__(self, tokens: tokens.TokenBuffer, hash_cons: bool = False):
         self._current = 0
         self._tokens = tokens
+        # Type codes are checked straight from the buffer; `Token` objects are
+        # only made for the tokens that end up in the AST or an error.
+        self._types = tokens.types
+        # One node for each number or string literal, keyed on its lexeme.
+        self._literals: dict[tuple[int, str], expr.Literal] = {}
+        # With hash-consing, one node for each distinct subtree of literals
+        # and operators; see `_cons`.
+        self._consed: dict[tuple, typing.Any] | None = {} if hash_cons else None
+        self._shared: set[int] = set()
 
     def parse(self) -> list[typing.Any]:
-        statements = []
-        while self._peek().type != tokens.TokenType.EOF:
-            statements.append(self._declaration())
+        return list(self.declarations())
 
-        return statements
+    def declarations(self) -> typing.Iterator[typing.Any]:
+        """Parse one top-level declaration at a time; None for each with an error."""
+        while not self._is_at_end():
+            yield self._declaration()
 
     def _declaration(self) -> typing.Any:
         try:
@@ -33,21 +72,20 @@ class Parser:
             return
 
     def _function(self, kind: str) -> stmt.Function:
-        name = self._consume(tokens.TokenType.IDENTIFIER, f"Expect {kind} name.")
+        self._consume(tokens.TokenType.IDENTIFIER, f"Expect {kind} name.")
+        name = self._previous()
         self._consume(
             tokens.TokenType.LEFT_PARENTHESIS, f"Expect '(' after {kind} name."
         )
         params = []
         if not self._check(tokens.TokenType.RIGHT_PARENTHESIS):
-            params.append(
-                self._consume(tokens.TokenType.IDENTIFIER, "Expect parameter name.")
-            )
+            self._consume(tokens.TokenType.IDENTIFIER, "Expect parameter name.")
+            params.append(self._previous())
             while self._match(tokens.TokenType.COMMA):
                 if len(params) >= 255:
                     self._error(self._peek(), "Can't have more than 255 parameters.")
-                params.append(
-                    self._consume(tokens.TokenType.IDENTIFIER, "Expect parameter name.")
-                )
+                self._consume(tokens.TokenType.IDENTIFIER, "Expect parameter name.")
+                params.append(self._previous())
 
         self._consume(
             tokens.TokenType.RIGHT_PARENTHESIS, "Expect ')' after parameters."
@@ -57,7 +95,8 @@ class Parser:
         return stmt.Function(name, params, body)
 
     def _class_declaration(self):
-        name = self._consume(tokens.TokenType.IDENTIFIER, "Expect class name")
+        self._consume(tokens.TokenType.IDENTIFIER, "Expect class name")
+        name = self._previous()
 
         superclass = None
         if self._match(tokens.TokenType.LESS):
@@ -65,17 +104,15 @@ class Parser:
             superclass = expr.Variable(self._previous())
         self._consume(tokens.TokenType.LEFT_BRACE, "Expect '{' before class body.")
         methods = []
-        while (
-            not self._check(tokens.TokenType.RIGHT_BRACE)
-            and self._peek().type != tokens.TokenType.EOF
-        ):
+        while not self._check(tokens.TokenType.RIGHT_BRACE) and not self._is_at_end():
             methods.append(self._function("method"))
 
         self._consume(tokens.TokenType.RIGHT_BRACE, "Expect '}' after class body.")
         return stmt.Class(name, superclass, methods)
 
     def _var_declaration(self) -> typing.Any:
-        name = self._consume(tokens.TokenType.IDENTIFIER, "Expect variable name")
+        self._consume(tokens.TokenType.IDENTIFIER, "Expect variable name")
+        name = self._previous()
 
         initializer = None
         if self._match(tokens.TokenType.EQUAL):
@@ -132,7 +169,7 @@ class Parser:
             body = stmt.Block([body, stmt.Expression(increment)])
 
         if not condition:
-            condition = expr.Literal(True)
+            condition = expr.TRUE
 
         body = stmt.While(condition, body)
 
@@ -181,10 +218,7 @@ class Parser:
 
     def _block(self) -> list[object]:
         statements = []
-        while (
-            not self._check(tokens.TokenType.RIGHT_BRACE)
-            and self._peek().type != tokens.TokenType.EOF
-        ):
+        while not self._check(tokens.TokenType.RIGHT_BRACE) and not self._is_at_end():
             statements.append(self._declaration())
 
         self._consume(tokens.TokenType.RIGHT_BRACE, "Expect '}' after block")
@@ -196,106 +230,93 @@ class Parser:
         return stmt.Expression(expression)
 
     def _expression(self) -> typing.Any:
-        return self._assignment()
-
-    def _assignment(self) -> typing.Any:
-        expression = self._or()
-
-        if self._match(tokens.TokenType.EQUAL):
-            equals = self._previous()
-            value = self._assignment()
-
-            if isinstance(expression, expr.Variable):
-                return expr.Assign(expression.name, value)
-            elif isinstance(expression, expr.Get):
-                return expr.Set(expression.instance, expression.name, value)
-
-            self._error(equals, "Invalid assignment target.")
-
-        return expression
-
-    def _or(self):
-        expression = self._and()
-        while self._match(tokens.TokenType.OR):
-            operator = self._previous()
-            right = self._and()
-            expression = expr.Logical(expression, operator, right)
-
-        return expression
-
-    def _and(self):
-        expression = self._equality()
-        while self._match(tokens.TokenType.AND):
-            operator = self._previous()
-            right = self._equality()
-            expression = expr.Logical(expression, operator, right)
-
-        return expression
-
-    def _equality(self):
-        expression = self._comparison()
-
-        while self._match(tokens.TokenType.BANG_EQUAL, tokens.TokenType.EQUAL_EQUAL):
-            operator = self._previous()
-            right = self._comparison()
-            expression = expr.Binary(expression, operator, right)
-
-        return expression
-
-    def _comparison(self) -> typing.Any:
-        expression = self._term()
-        while self._match(
-            tokens.TokenType.GREATER,
-            tokens.TokenType.GREATER_EQUAL,
-            tokens.TokenType.LESS,
-            tokens.TokenType.LESS_EQUAL,
-        ):
-            operator = self._previous()
-            right = self._term()
-            expression = expr.Binary(expression, operator, right)
-
-        return expression
-
-    def _term(self) -> typing.Any:
-        expression = self._factor()
-        while self._match(tokens.TokenType.PLUS, tokens.TokenType.MINUS):
-            operator = self._previous()
-            right = self._factor()
-            expression = expr.Binary(expression, operator, right)
-
-        return expression
-
-    def _factor(self) -> typing.Any:
-        expression = self._unary()
-        while self._match(tokens.TokenType.SLASH, tokens.TokenType.STAR):
-            operator = self._previous()
-            right = self._unary()
-            expression = expr.Binary(expression, operator, right)
-
-        return expression
+        return self._precedence(_ASSIGNMENT)
+
+    def _precedence(self, minimum: int) -> typing.Any:
+        """Parse an expression whose operators all bind at least this tightly.
+
+        Each infix or postfix operator found is applied to the expression so
+        far, with its right operand parsed one level tighter, or at the same
+        level for the right associative `=`. A literal therefore takes two
+        calls to parse rather than one per grammar rule.
+        """
+        expression = self._prefix()
+        types = self._types
+        while True:
+            type = types[self._current]
+            precedence = _INFIX.get(type)
+            if precedence is None or precedence < minimum:
+                return expression
 
-    def _unary(self) -> typing.Any:
+            self._current += 1
+            match type:
+                case tokens.TokenType.LEFT_PARENTHESIS:
+                    expression = self._finish_call(expression)
+                case tokens.TokenType.DOT:
+                    self._consume(
+                        tokens.TokenType.IDENTIFIER, "Expect property name after '.'."
+                    )
+                    expression = expr.Get(expression, self._previous())
+                case tokens.TokenType.EQUAL:
+                    return self._assignment(expression)
+                case tokens.TokenType.OR | tokens.TokenType.AND:
+                    operator = self._previous()
+                    right = self._precedence(precedence + 1)
+                    logical = expr.Logical(expression, operator, right)
+                    expression = self._cons(logical)
+                case _:
+                    operator = self._previous()
+                    right = self._precedence(precedence + 1)
+                    binary = expr.Binary(expression, operator, right)
+                    expression = self._cons(binary)
+
+    def _assignment(self, target: typing.Any) -> typing.Any:
+        equals = self._previous()
+        value = self._precedence(_ASSIGNMENT)
+
+        if isinstance(target, expr.Variable):
+            return expr.Assign(target.name, value)
+        elif isinstance(target, expr.Get):
+            return expr.Set(target.instance, target.name, value)
+
+        self._error(equals, "Invalid assignment target.")
+        return target
+
+    def _prefix(self) -> typing.Any:
         if self._match(tokens.TokenType.BANG, tokens.TokenType.MINUS):
             operator = self._previous()
-            right = self._unary()
-            return expr.Unary(operator, right)
-
-        return self._call()
-
-    def _call(self) -> typing.Any:
-        expression = self._primary()
-        while True:
-            if self._match(tokens.TokenType.LEFT_PARENTHESIS):
-                expression = self._finish_call(expression)
-            elif self._match(tokens.TokenType.DOT):
-                name = self._consume(
-                    tokens.TokenType.IDENTIFIER, "Expect property name after '.'."
-                )
-                expression = expr.Get(expression, name)
-            else:
-                break
-
-        return expression
+            right = self._precedence(_UNARY)
+            return self._cons(expr.Unary(operator, right))
+
+        return self._primary()
+
+    def _cons(self, node: typing.Any) -> typing.Any:
+        """Return the shared copy of `node` if hash-consing, or `node` itself.
+
+        Only groupings and operators over literals are shared: nothing in them
+        is resolved and no side table is keyed on them, so any copy will do.
+        Operator tokens must match down to their line, which errors report.
+        """
+        if self._consed is None:
+            return node
+        match node:
+            case expr.Grouping():
+                operator = None
+                operands = (node.expression,)
+            case expr.Unary():
+                operator = (node.operator.type, node.operator.line)
+                operands = (node.right,)
+            case _:
+                operator = (node.operator.type, node.operator.line)
+                operands = (node.left, node.right)
+        for operand in operands:
+            if not (isinstance(operand, expr.Literal) or id(operand) in self._shared):
+                return node
+
+        key = (type(node), operator, *map(id, operands))
+        shared = self._consed.setdefault(key, node)
+        self._shared.add(id(shared))
+        return shared
 
     def _finish_call(self, expression: typing.Any):
         arguments = []
@@ -306,55 +327,77 @@ class Parser:
                     self._error(self._peek(), "Can't have more than 255 arguments.")
                 arguments.append(self._expression())
 
-        paren = self._consume(
-            tokens.TokenType.RIGHT_PARENTHESIS, "Expect ')' after arguments."
-        )
+        self._consume(tokens.TokenType.RIGHT_PARENTHESIS, "Expect ')' after arguments.")
+        paren = self._previous()
         return expr.Call(expression, paren, arguments)
 
     def _primary(self) -> typing.Any:
-        if self._match(tokens.TokenType.FALSE):
-            return expr.Literal(False)
-        elif self._match(tokens.TokenType.TRUE):
-            return expr.Literal(True)
-        elif self._match(tokens.TokenType.NIL):
-            return expr.Literal(None)
-        elif self._match(tokens.TokenType.NUMBER, tokens.TokenType.STRING):
-            return expr.Literal(self._previous().literal)
-        elif self._match(tokens.TokenType.SUPER):
-            keyword = self._previous()
-            self._consume(tokens.TokenType.DOT, "Expect '.' after 'super.")
-            method = self._consume(
-                tokens.TokenType.IDENTIFIER, "Expect superclass method name."
-            )
-            return expr.Super(keyword, method)
-        elif self._match(tokens.TokenType.THIS):
-            return expr.This(self._previous())
-        elif self._match(tokens.TokenType.IDENTIFIER):
-            return expr.Variable(self._previous())
-        elif self._match(tokens.TokenType.LEFT_PARENTHESIS):
-            expression = self._expression()
-            self._consume(
-                tokens.TokenType.RIGHT_PARENTHESIS, "Expect ')' after expression"
-            )
-            return expr.Grouping(expression)
-        else:
-            raise self._error(self._peek(), "Expect expression.")
+        type = self._types[self._current]
+        match type:
+            case tokens.TokenType.IDENTIFIER:
+                self._current += 1
+                return expr.Variable(self._previous())
+            case tokens.TokenType.NUMBER | tokens.TokenType.STRING:
+                self._current += 1
+                return self._literal(type)
+            case tokens.TokenType.FALSE:
+                self._current += 1
+                return expr.FALSE
+            case tokens.TokenType.TRUE:
+                self._current += 1
+                return expr.TRUE
+            case tokens.TokenType.NIL:
+                self._current += 1
+                return expr.NIL
+            case tokens.TokenType.THIS:
+                self._current += 1
+                return expr.This(self._previous())
+            case tokens.TokenType.SUPER:
+                self._current += 1
+                keyword = self._previous()
+                self._consume(tokens.TokenType.DOT, "Expect '.' after 'super.")
+                self._consume(
+                    tokens.TokenType.IDENTIFIER, "Expect superclass method name."
+                )
+                return expr.Super(keyword, self._previous())
+            case tokens.TokenType.LEFT_PARENTHESIS:
+                self._current += 1
+                expression = self._expression()
+                self._consume(
+                    tokens.TokenType.RIGHT_PARENTHESIS, "Expect ')' after expression"
+                )
+                return self._cons(expr.Grouping(expression))
+
+        raise self._error(self._peek(), "Expect expression.")
+
+    def _literal(self, type: int) -> expr.Literal:
+        """The node for the number or string just consumed, shared by its equals."""
+        index = self._current - 1
+        source = self._tokens.source
+        key = (type, source[self._tokens.starts[index] : self._tokens.ends[index]])
+        literal = self._literals.get(key)
+        if literal is None:
+            literal = self._literals[key] = expr.Literal(self._previous().literal)
+        return literal
 
     def _match(self, *args) -> bool:
-        matches = any(self._check(type) for type in args)
-        if matches:
-            self._advance()
+        type = self._types[self._current]
+        if type in args and type != tokens.TokenType.EOF:
+            self._current += 1
+            return True
 
-        return matches
+        return False
 
     def _check(self, type: tokens.TokenType) -> bool:
-        token = self._peek()
-        return token.type == type and token.type is not tokens.TokenType.EOF
+        current = self._types[self._current]
+        return current == type and current != tokens.TokenType.EOF
 
-    def _advance(self) -> tokens.Token:
-        if self._peek().type is not tokens.TokenType.EOF:
+    def _is_at_end(self) -> bool:
+        return self._types[self._current] == tokens.TokenType.EOF
+
+    def _advance(self):
+        if not self._is_at_end():
             self._current += 1
-        return self._previous()
 
     def _previous(self) -> tokens.Token:
         return self._tokens[self._current - 1]
@@ -363,8 +406,10 @@ class Parser:
         return self._tokens[self._current]
 
     def _consume(self, type: tokens.TokenType, message: str):
+        """Step over a token of this type; `_previous` then returns it."""
         if self._check(type):
-            return self._advance()
+            self._current += 1
+            return
 
         raise self._error(self._peek(), message)
 
@@ -379,11 +424,11 @@ class Parser:
     def _synchronise(self):
         self._advance()
 
-        while self._peek().type is not tokens.TokenType.EOF:
-            if self._previous().type == tokens.TokenType.SEMICOLON:
+        while not self._is_at_end():
+            if self._types[self._current - 1] == tokens.TokenType.SEMICOLON:
                 return
 
-            if self._peek().type in {
+            if self._types[self._current] in {
                 tokens.TokenType.CLASS,
                 tokens.TokenType.FUN,
                 tokens.TokenType.VAR,
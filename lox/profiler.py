@@ -0,0 +1,289 @@
+import dataclasses
+import signal
+import time
+import typing
+
+import stmt
+import tokens
+
+# How `--profile` measures: by timing every call, or by sampling the stack.
+MODES = ("calls", "sample")
+
+# In "sample" mode, the stack is sampled this often, in seconds of CPU time.
+SAMPLE_INTERVAL = 0.001
+
+# How many functions and lines the report lists.
+REPORT_ROWS = 20
+
+
+@dataclasses.dataclass(eq=False)
+class _Node:
+    """A function in the call tree, as called by way of its ancestors."""
+
+    function: stmt.Function | None
+    children: dict[stmt.Function, "_Node"] = dataclasses.field(default_factory=dict)
+    # Seconds or samples spent in this function itself, and not its callees.
+    own: float = 0
+
+    def child(self, function: stmt.Function) -> "_Node":
+        node = self.children.get(function)
+        if node is None:
+            node = self.children[function] = _Node(function)
+        return node
+
+
+@dataclasses.dataclass
+class _Totals:
+    # Calls to a function, or statements run on a line.
+    count: int = 0
+    # Seconds or samples, including callees, counting a recursive call once.
+    total: float = 0
+    own: float = 0
+
+
+class Profiler:
+    """Measure where a program spends its time, by Lox function and line.
+
+    In "calls" mode every function body and statement is timed, by wrapping
+    the engine's `_execute_body` and `_execute` while the program runs. In
+    "sample" mode a timer signal interrupts the program instead, and the Lox
+    stack is read from the Python frames of those two methods, so the program
+    runs at nearly full speed but calls are not counted.
+
+    Only the tree engine runs statements one at a time. The closure engine,
+    and functions the tree engine has translated to Python, have their time
+    charged to the line the function is declared on. Inlined calls are part
+    of their caller.
+    """
+
+    def __init__(self, interpret: typing.Any, mode: str = "calls"):
+        self._interpreter = interpret
+        self._mode = mode
+        self._root = _Node(None)
+        self._functions: dict[stmt.Function, _Totals] = {}
+        self._lines: dict[int, _Totals] = {}
+        self._statement_lines: dict[typing.Any, int] = {}
+        self._elapsed = 0.0
+        self._samples = 0
+        self._start = 0.0
+        # In "calls" mode: the line running, when the clock was last read,
+        # and the calls in progress as [node, start time, time in callees].
+        self._line = 0
+        self._mark = 0.0
+        self._calls: list[list[typing.Any]] = []
+        # Recursive calls in progress to each function, in "calls" mode.
+        self._active: dict[stmt.Function, int] = {}
+        self._previous_handler: typing.Any = None
+
+    def start(self):
+        interpret = self._interpreter
+        self._start = self._mark = time.perf_counter()
+        if self._mode == "sample":
+            engine = type(interpret).__mro__
+            self._body_codes = _codes(engine, "_execute_body")
+            self._statement_codes = _codes(engine, "_execute")
+            self._previous_handler = signal.signal(signal.SIGPROF, self._sample)
+            signal.setitimer(signal.ITIMER_PROF, SAMPLE_INTERVAL, SAMPLE_INTERVAL)
+            return
+
+        self._calls = [[self._root, self._start, 0.0]]
+        execute_body = interpret._execute_body
+        execute = interpret._execute
+
+        def profiled_body(declaration, env):
+            self._enter(declaration)
+            try:
+                return execute_body(declaration, env)
+            finally:
+                self._leave(declaration)
+
+        def profiled_statement(statement):
+            line = self._statement_lines.get(statement)
+            if line is None:
+                line = self._statement_lines[statement] = _line(statement)
+            previous = self._enter_line(line, time.perf_counter())
+            try:
+                return execute(statement)
+            finally:
+                self._enter_line(previous, time.perf_counter(), counted=False)
+
+        # Instance attributes hide the methods, for this interpreter only.
+        interpret._execute_body = profiled_body
+        interpret._execute = profiled_statement
+
+    def stop(self):
+        now = time.perf_counter()
+        self._elapsed = now - self._start
+        if self._mode == "sample":
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, self._previous_handler)
+            return
+
+        del self._interpreter._execute_body
+        del self._interpreter._execute
+        self._enter_line(0, now, counted=False)
+        # A runtime error unwinds every call, so only the script is left.
+        root = self._calls.pop()
+        self._root.own += now - root[1] - root[2]
+
+    def report(self) -> str:
+        """The functions and lines that took longest, for a person to read."""
+        if self._mode == "sample":
+            unit = "samples"
+            heading = (
+                f"{self._samples} samples, one per {SAMPLE_INTERVAL * 1000:g} ms "
+                f"of CPU time, over {self._elapsed:.3f}s"
+            )
+        else:
+            unit = "milliseconds"
+            heading = f"{self._elapsed:.3f}s"
+        overall = (self._samples if self._mode == "sample" else self._elapsed) or 1
+        lines = [f"profile: {heading}", f"functions, by {unit} in their own code:"]
+        lines.append(f"{'own':>10} {'%':>6} {'total':>10} {'calls':>10}  function")
+        functions = sorted(
+            self._functions.items(), key=lambda item: item[1].own, reverse=True
+        )
+        for function, totals in functions[:REPORT_ROWS]:
+            lines.append(
+                f"{self._amount(totals.own)} {totals.own / overall:6.1%} "
+                f"{self._amount(totals.total)} {self._count(totals.count)}  "
+                f"{function.name.lexeme} (line {function.name.line})"
+            )
+        lines.append(f"lines, by {unit} in their own code:")
+        lines.append(f"{'own':>10} {'%':>6} {'runs':>10}  line")
+        rows = sorted(self._lines.items(), key=lambda item: item[1].own, reverse=True)
+        for line, totals in rows[:REPORT_ROWS]:
+            where = str(line) if line else "(unknown)"
+            lines.append(
+                f"{self._amount(totals.own)} {totals.own / overall:6.1%} "
+                f"{self._count(totals.count)}  {where}"
+            )
+        return "\n".join(lines)
+
+    def collapsed(self) -> list[str]:
+        """The call tree as collapsed stacks, the input `flamegraph.pl` takes.
+
+        Each line is a stack of functions, outermost first, and the
+        microseconds or samples spent in the innermost.
+        """
+        scale = 1 if self._mode == "sample" else 1_000_000
+        stacks = []
+        pending = [(self._root, "<script>")]
+        while pending:
+            node, stack = pending.pop()
+            amount = round(node.own * scale)
+            if amount:
+                stacks.append(f"{stack} {amount}")
+            for function, child in node.children.items():
+                label = f"{function.name.lexeme}:{function.name.line}"
+                pending.append((child, f"{stack};{label}"))
+        return sorted(stacks)
+
+    def _enter(self, declaration: stmt.Function):
+        now = time.perf_counter()
+        self._calls.append([self._calls[-1][0].child(declaration), now, 0.0])
+        totals = self._functions.get(declaration)
+        if totals is None:
+            totals = self._functions[declaration] = _Totals()
+        totals.count += 1
+        self._active[declaration] = self._active.get(declaration, 0) + 1
+        line = self._enter_line(declaration.name.line, now, counted=False)
+        self._calls[-1].append(line)
+
+    def _leave(self, declaration: stmt.Function):
+        now = time.perf_counter()
+        node, start, callees, line = self._calls.pop()
+        self._enter_line(line, now, counted=False)
+        elapsed = now - start
+        own = elapsed - callees
+        node.own += own
+        totals = self._functions[declaration]
+        totals.own += own
+        self._calls[-1][2] += elapsed
+        self._active[declaration] -= 1
+        if not self._active[declaration]:
+            totals.total += elapsed
+
+    def _enter_line(self, line: int, now: float, counted: bool = True) -> int:
+        """Start running `line`, returning the line that was running.
+
+        The time since the clock was last read is charged to that line.
+        """
+        previous = self._line
+        totals = self._lines.get(previous)
+        if totals is None:
+            totals = self._lines[previous] = _Totals()
+        totals.own += now - self._mark
+        if line:
+            totals = self._lines.get(line)
+            if totals is None:
+                totals = self._lines[line] = _Totals()
+            totals.count += counted
+        self._line = line
+        self._mark = now
+        return previous
+
+    def _sample(self, signum: int, frame: typing.Any):
+        functions = []
+        line = 0
+        while frame is not None:
+            code = frame.f_code
+            if code in self._body_codes:
+                declaration = frame.f_locals["declaration"]
+                functions.append(declaration)
+                line = line or declaration.name.line
+            elif not line and code in self._statement_codes:
+                statement = frame.f_locals["statement"]
+                line = self._statement_lines.get(statement)
+                if line is None:
+                    line = self._statement_lines[statement] = _line(statement)
+            frame = frame.f_back
+
+        self._samples += 1
+        node = self._root
+        for declaration in reversed(functions):
+            node = node.child(declaration)
+        node.own += 1
+        for declaration in set(functions):
+            totals = self._functions.get(declaration)
+            if totals is None:
+                totals = self._functions[declaration] = _Totals()
+            totals.total += 1
+        if functions:
+            self._functions[functions[0]].own += 1
+        totals = self._lines.get(line)
+        if totals is None:
+            totals = self._lines[line] = _Totals()
+        totals.own += 1
+
+    def _amount(self, value: float) -> str:
+        if self._mode == "sample":
+            return f"{int(value):10d}"
+        return f"{value * 1000:10.3f}"
+
+    def _count(self, value: int) -> str:
+        return f"{'-':>10}" if self._mode == "sample" else f"{value:10d}"
+
+
+def _codes(engine: tuple[type, ...], name: str) -> set[typing.Any]:
+    """The code of every definition of the method `name` in these classes."""
+    return {cls.__dict__[name].__code__ for cls in engine if name in cls.__dict__}
+
+
+def _line(node: typing.Any) -> int:
+    """The line of the first token in `node`, or else in its first children."""
+    children = []
+    for field in dataclasses.fields(node):
+        value = getattr(node, field.name)
+        if isinstance(value, tokens.Token):
+            return value.line
+        if isinstance(value, list):
+            children.extend(value)
+        else:
+            children.append(value)
+    for child in children:
+        if dataclasses.is_dataclass(child) and not isinstance(child, type):
+            line = _line(child)
+            if line:
+                return line
+    return 0
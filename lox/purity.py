@@ -0,0 +1,209 @@
+import dataclasses
+import typing
+
+import expr
+import interpreter
+import stmt
+
+
+@dataclasses.dataclass(eq=False)
+class _Function:
+    """What the analysis has learned about one function body so far."""
+
+    declaration: stmt.Function
+    pure: bool = True
+    # Globals read, which must never be reassigned.
+    reads: set[str] = dataclasses.field(default_factory=set)
+    # Global functions called by name, which must turn out pure as well.
+    callees: set[str] = dataclasses.field(default_factory=set)
+    # Scopes inside the function entered so far; its parameters are at 0.
+    depth: int = 0
+
+
+class Purity:
+    """Find the functions whose result depends only on their arguments.
+
+    A function is pure if it prints nothing, touches no fields, declares no
+    functions or classes, assigns only its own locals, reads no variable of
+    an enclosing function and no global that is ever reassigned or declared
+    twice, and calls nothing but pure global functions by name. Methods are
+    never pure, as `this` can change between calls, and neither is anything
+    that calls `clock`.
+
+    Calling a pure function again with the same arguments must give the same
+    result, so the engines can memoize it. Errors are not results: a call
+    that fails is simply made again next time.
+    """
+
+    def __init__(self, interpret: interpreter.Interpreter):
+        self._locals: dict[object, tuple[int, int]] = interpret._locals
+        self._functions: list[_Function] = []
+        # The innermost function being analysed, or None at the top level.
+        self._function: _Function | None = None
+        self._reassigned: set[str] = set()
+
+    def analyze(self, statements: list[typing.Any]) -> set[stmt.Function]:
+        declared: dict[str, list[typing.Any]] = {}
+        for statement in statements:
+            if isinstance(statement, (stmt.Var, stmt.Function, stmt.Class)):
+                declared.setdefault(statement.name.lexeme, []).append(statement)
+        self._reassigned = {
+            name for name, declarations in declared.items() if len(declarations) > 1
+        }
+
+        self._statements(statements)
+
+        globals = {
+            name: declarations[0]
+            for name, declarations in declared.items()
+            if isinstance(declarations[0], stmt.Function)
+            and name not in self._reassigned
+        }
+        pure = {
+            function.declaration
+            for function in self._functions
+            if function.pure and not function.reads & self._reassigned
+        }
+        # Drop functions that call an impure one until nothing changes, which
+        # leaves mutually recursive pure functions in place.
+        changed = True
+        while changed:
+            changed = False
+            for function in self._functions:
+                if function.declaration in pure and any(
+                    globals.get(name) not in pure for name in function.callees
+                ):
+                    pure.discard(function.declaration)
+                    changed = True
+        return pure
+
+    def visit_block(self, block: stmt.Block):
+        if self._function is not None:
+            self._function.depth += 1
+        self._statements(block.statements)
+        if self._function is not None:
+            self._function.depth -= 1
+
+    def visit_var(self, var: stmt.Var):
+        if var.initializer is not None:
+            self._analyze(var.initializer)
+
+    def visit_function(self, function: stmt.Function):
+        self._impure()
+        self._body(function, pure=True)
+
+    def visit_class(self, klass: stmt.Class):
+        self._impure()
+        if klass.superclass is not None:
+            self._analyze(klass.superclass)
+        for method in klass.methods:
+            self._body(method, pure=False)
+
+    def visit_expression(self, statement: stmt.Expression):
+        self._analyze(statement.expression)
+
+    def visit_print(self, statement: stmt.Print):
+        self._impure()
+        self._analyze(statement.expression)
+
+    def visit_return(self, statement: stmt.Return):
+        if statement.value is not None:
+            self._analyze(statement.value)
+
+    def visit_if(self, statement: stmt.If):
+        self._analyze(statement.condition)
+        self._analyze(statement.then_branch)
+        if statement.else_branch is not None:
+            self._analyze(statement.else_branch)
+
+    def visit_while(self, statement: stmt.While):
+        self._analyze(statement.condition)
+        self._analyze(statement.body)
+
+    def visit_literal(self, literal: expr.Literal):
+        pass
+
+    def visit_grouping(self, grouping: expr.Grouping):
+        self._analyze(grouping.expression)
+
+    def visit_variable(self, variable: expr.Variable):
+        function = self._function
+        if function is None or self._is_own(variable):
+            return
+        if variable in self._locals:
+            function.pure = False
+        else:
+            function.reads.add(variable.name.lexeme)
+
+    def visit_assign(self, assignment: expr.Assign):
+        if assignment not in self._locals:
+            self._reassigned.add(assignment.name.lexeme)
+        if self._function is not None and not self._is_own(assignment):
+            self._function.pure = False
+        self._analyze(assignment.value)
+
+    def visit_this(self, this: expr.This):
+        self._impure()
+
+    def visit_super(self, super_expr: expr.Super):
+        self._impure()
+
+    def visit_unary(self, unary: expr.Unary):
+        self._analyze(unary.right)
+
+    def visit_binary(self, binary: expr.Binary):
+        self._analyze(binary.left)
+        self._analyze(binary.right)
+
+    def visit_logical(self, logical: expr.Logical):
+        self._analyze(logical.left)
+        self._analyze(logical.right)
+
+    def visit_call(self, call: expr.Call):
+        callee = call.callee
+        if self._function is not None:
+            if isinstance(callee, expr.Variable) and callee not in self._locals:
+                self._function.callees.add(callee.name.lexeme)
+            else:
+                self._impure()
+        self._analyze(callee)
+        for argument in call.arguments:
+            self._analyze(argument)
+
+    def visit_inlined(self, inlined: expr.Inlined):
+        self._analyze(inlined.call)
+
+    def visit_hoisted(self, hoisted: expr.Hoisted):
+        self._analyze(hoisted.expression)
+
+    def visit_get(self, get: expr.Get):
+        self._impure()
+        self._analyze(get.instance)
+
+    def visit_set(self, set_expr: expr.Set):
+        self._impure()
+        self._analyze(set_expr.value)
+        self._analyze(set_expr.instance)
+
+    def _analyze(self, node: typing.Any):
+        node.accept(self)
+
+    def _statements(self, statements: list[typing.Any]):
+        for statement in statements:
+            self._analyze(statement)
+
+    def _body(self, declaration: stmt.Function, pure: bool):
+        enclosing = self._function
+        self._function = _Function(declaration, pure)
+        self._functions.append(self._function)
+        self._statements(declaration.body)
+        self._function = enclosing
+
+    def _impure(self):
+        if self._function is not None:
+            self._function.pure = False
+
+    def _is_own(self, variable: expr.Variable | expr.Assign) -> bool:
+        """Whether a variable is a local of the function being analysed."""
+        resolved = self._locals.get(variable)
+        return resolved is not None and resolved[0] <= self._function.depth
@@ -0,0 +1,139 @@
+import operator
+import typing
+
+import expr
+import tokens
+
+# A site specializes once this many evaluations in a row have had operands of
+# one specializable type.
+QUICKEN_THRESHOLD = 2
+
+Generic = typing.Callable[[expr.Binary, typing.Any, typing.Any], typing.Any]
+
+# The operations a site can run unchecked once both operands are known to have
+# the given type. These match what the generic path computes for those types.
+_SPECIALIZATIONS: dict[type, dict[tokens.TokenType, typing.Callable]] = {
+    float: {
+        tokens.TokenType.PLUS: operator.add,
+        tokens.TokenType.MINUS: operator.sub,
+        tokens.TokenType.STAR: operator.mul,
+        tokens.TokenType.SLASH: operator.truediv,
+        tokens.TokenType.GREATER: operator.gt,
+        tokens.TokenType.GREATER_EQUAL: operator.ge,
+        tokens.TokenType.LESS: operator.lt,
+        tokens.TokenType.LESS_EQUAL: operator.le,
+        tokens.TokenType.EQUAL_EQUAL: operator.eq,
+        tokens.TokenType.BANG_EQUAL: operator.ne,
+    },
+    str: {
+        tokens.TokenType.PLUS: operator.add,
+        tokens.TokenType.EQUAL_EQUAL: operator.eq,
+        tokens.TokenType.BANG_EQUAL: operator.ne,
+    },
+}
+
+
+class BinarySite:
+    """The runtime state of one `expr.Binary` node.
+
+    `evaluate(left, right)` starts out on the generic path, which checks the
+    operands and watches their types. Once a site has seen the same operand
+    type a few times in a row it replaces `evaluate` with a variant that only
+    checks that both operands still have that type. If that guard ever fails
+    the site deoptimizes for good and goes back to the generic path, which
+    reports type errors exactly as before.
+    """
+
+    __slots__ = (
+        "evaluate",
+        "specialized",
+        "deoptimized",
+        "_expression",
+        "_generic",
+        "_operand_type",
+        "_streak",
+    )
+
+    def __init__(self, expression: expr.Binary, generic: Generic):
+        self.evaluate = self._observe
+        self.specialized: type | None = None
+        self.deoptimized = False
+        self._expression = expression
+        self._generic = generic
+        self._operand_type: type | None = None
+        self._streak = 0
+
+    def _observe(self, left: typing.Any, right: typing.Any) -> typing.Any:
+        result = self._generic(self._expression, left, right)
+        operand_type = type(left)
+        if operand_type is not type(right):
+            self._streak = 0
+            return result
+
+        if operand_type is not self._operand_type:
+            self._operand_type = operand_type
+            self._streak = 0
+        self._streak += 1
+        if self._streak >= QUICKEN_THRESHOLD:
+            self._specialize(operand_type)
+        return result
+
+    def _specialize(self, operand_type: type):
+        operation = _SPECIALIZATIONS.get(operand_type, {}).get(
+            self._expression.operator.type
+        )
+        if operation is None:
+            # Nothing faster to offer, so stop watching this site.
+            self._use_generic()
+            return
+
+        deoptimize = self._deoptimize
+
+        def specialized(left, right):
+            if type(left) is operand_type and type(right) is operand_type:
+                return operation(left, right)
+            return deoptimize(left, right)
+
+        self.evaluate = specialized
+        self.specialized = operand_type
+
+    def _deoptimize(self, left: typing.Any, right: typing.Any) -> typing.Any:
+        self._use_generic()
+        self.deoptimized = True
+        return self._generic(self._expression, left, right)
+
+    def _use_generic(self):
+        expression = self._expression
+        generic = self._generic
+        self.evaluate = lambda left, right: generic(expression, left, right)
+
+
+class SiteTable(dict):
+    """Binary sites keyed on their node, created on first use."""
+
+    def __init__(self, generic: Generic):
+        super().__init__()
+        self._generic = generic
+
+    def __missing__(self, expression: expr.Binary) -> BinarySite:
+        site = self[expression] = BinarySite(expression, self._generic)
+        return site
+
+
+def stats(sites: typing.Iterable[BinarySite]) -> dict[str, int]:
+    """Count how many binary sites have specialized and deoptimized so far."""
+    summary = {
+        "binary sites": 0,
+        "binary sites quickened to numbers": 0,
+        "binary sites quickened to strings": 0,
+        "binary sites deoptimized": 0,
+    }
+    for site in sites:
+        summary["binary sites"] += 1
+        if site.deoptimized:
+            summary["binary sites deoptimized"] += 1
+        elif site.specialized is float:
+            summary["binary sites quickened to numbers"] += 1
+        elif site.specialized is str:
+            summary["binary sites quickened to strings"] += 1
+    return summary
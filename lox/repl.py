@@ -0,0 +1,94 @@
+import sys
+import typing
+
+import errors
+from inliner import Inliner
+from loop_optimizer import LoopOptimizer
+from optimizer import Optimizer
+from parser import Parser
+from resolver import Resolver
+from scanner import Scanner, scan_entry
+
+
+class Session:
+    """An interactive session, in which each entry builds on the ones before.
+
+    One resolver and one inliner serve the whole session, so functions
+    entered earlier are inlined into later entries, and only the new entry
+    is scanned, parsed, resolved and optimized. An entry runs once its
+    strings and brackets are closed, so a declaration can span several
+    lines. Each statement is released once it has run, leaving the engine
+    holding only the functions and classes declared so far.
+
+    A later entry can declare a function that reassigns any global, even one
+    read by a loop in an earlier function, so the loop optimizer never hoists
+    a global out of a loop that makes calls.
+    """
+
+    def __init__(
+        self,
+        interpret: typing.Any,
+        optimize: bool = True,
+        hash_cons: bool = False,
+        report_inlining: bool = False,
+    ):
+        self._interpreter = interpret
+        self._optimize = optimize
+        self._hash_cons = hash_cons
+        self._report_inlining = report_inlining
+        self._resolver = Resolver(interpret)
+        self._inliner = Inliner(interpret)
+        self._loops = LoopOptimizer(interpret, whole_program=False)
+        # Lines of an entry that still has a string or bracket open.
+        self._pending: list[str] = []
+
+    @property
+    def continuing(self) -> bool:
+        """Whether the next line continues an unfinished entry."""
+        return bool(self._pending)
+
+    def enter(self, line: str) -> bool:
+        """Add a line of input, and run the entry if it is now complete.
+
+        Returns whether anything ran. Errors are reported, and do not carry
+        over to the next entry.
+        """
+        if not self._pending and not line.strip():
+            return False
+        self._pending.append(line)
+        tokens = scan_entry("\n".join(self._pending))
+        if tokens is None:
+            return False
+        self._pending.clear()
+        return self._run(tokens)
+
+    def finish(self) -> bool:
+        """Run an entry left unfinished when the input ended, reporting why."""
+        if not self._pending:
+            return False
+        tokens = Scanner("\n".join(self._pending)).scan_tokens()
+        self._pending.clear()
+        return self._run(tokens)
+
+    def _run(self, tokens: typing.Any) -> bool:
+        try:
+            statements = Parser(tokens, self._hash_cons).parse()
+            if errors.is_error():
+                return False
+            self._resolver._resolve(statements)
+            if errors.is_error():
+                return False
+            if self._optimize:
+                statements = Optimizer(self._interpreter).optimize(statements)
+                statements = self._loops.optimize(statements)
+                statements = self._inliner.inline(statements)
+                if self._report_inlining:
+                    for line, message in self._inliner.report:
+                        print(f"[line {line}] {message}", file=sys.stderr)
+                self._inliner.report.clear()
+            self._interpreter.interpret(statements)
+            for statement in statements:
+                self._interpreter.release(statement)
+            return True
+        finally:
+            errors.reset()
@@ -11,7 +11,8 @@ import tokens
 class Resolver:
     def __init__(self, interpret: interpreter.Interpreter):
         self._interpreter = interpret
-        self._scopes: list[dict[str, bool]] = []
+        # Each scope maps a name to its slot and whether it is defined yet.
+        self._scopes: list[dict[str, tuple[int, bool]]] = []
         self._current_function = FunctionType.NONE
         self._current_class = ClassType.NONE
 
@@ -32,7 +33,8 @@ class Resolver:
     def visit_variable(self, variable: expr.Variable):
         if (
             len(self._scopes) != 0
-            and self._scopes[-1].get(variable.name.lexeme) == False
+            and variable.name.lexeme in self._scopes[-1]
+            and not self._scopes[-1][variable.name.lexeme][1]
         ):
             self._error(
                 variable.name, "Can't read local variable in its own initializer."
@@ -95,17 +97,13 @@ class Resolver:
         if klass.superclass is not None:
             self._begin_scope()
             scope = self._scopes[-1]
-            scope["super"] = True
-        self._begin_scope()
-        scope = self._scopes[-1]
-        scope["this"] = True
+            scope["super"] = (0, True)
         for method in klass.methods:
             declaration = FunctionType.METHOD
             if method.name.lexeme == "init":
                 declaration = FunctionType.INITIALIZER
             self._resolve_function(method, declaration)
 
-        self._end_scope()
         if klass.superclass is not None:
             self._end_scope()
         self._current_class = enclosing_class
@@ -165,13 +163,19 @@ class Resolver:
     def _resolve_local(self, expression: object, name: tokens.Token):
         for i, scope in reversed(list(enumerate(self._scopes))):
             if name.lexeme in scope:
-                self._interpreter.resolve(expression, len(self._scopes) - 1 - i)
+                slot = scope[name.lexeme][0]
+                self._interpreter.resolve(
+                    expression, len(self._scopes) - 1 - i, slot
+                )
                 return
 
     def _resolve_function(self, function: stmt.Function, type: FunctionType):
         enclosing_function = self._current_function
         self._current_function = type
         self._begin_scope()
+        if type in (FunctionType.METHOD, FunctionType.INITIALIZER):
+            # A method's frame holds its instance in slot 0, then the parameters.
+            self._scopes[-1]["this"] = (0, True)
         for param in function.params:
             self._declare(param)
             self._define(param)
@@ -191,16 +195,19 @@ class Resolver:
             return
 
         scope = self._scopes[-1]
+        slot = len(scope)
         if name.lexeme in scope:
             self._error(name, "Already a variable with this name in scope.")
-        scope[name.lexeme] = False
+            slot = scope[name.lexeme][0]
+        scope[name.lexeme] = (slot, False)
 
     def _define(self, name: tokens.Token):
         if len(self._scopes) == 0:
             return
 
         scope = self._scopes[-1]
-        scope[name.lexeme] = True
+        slot, _ = scope[name.lexeme]
+        scope[name.lexeme] = (slot, True)
 
     def _error(self, token: tokens.Token, message: str):
         if token.type == tokens.TokenType.EOF:
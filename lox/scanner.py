@@ -1,22 +1,307 @@
+import re
+import typing
+
 import errors
-from tokens import Token, TokenType
+from tokens import TokenBuffer, TokenType
+
+KEYWORDS = {
+    "and": TokenType.AND,
+    "class": TokenType.CLASS,
+    "else": TokenType.ELSE,
+    "false": TokenType.FALSE,
+    "for": TokenType.FOR,
+    "fun": TokenType.FUN,
+    "if": TokenType.IF,
+    "nil": TokenType.NIL,
+    "or": TokenType.OR,
+    "print": TokenType.PRINT,
+    "return": TokenType.RETURN,
+    "super": TokenType.SUPER,
+    "this": TokenType.THIS,
+    "true": TokenType.TRUE,
+    "var": TokenType.VAR,
+    "while": TokenType.WHILE,
+}
+
+_OPERATORS = {
+    "(": TokenType.LEFT_PARENTHESIS,
+    ")": TokenType.RIGHT_PARENTHESIS,
+    "{": TokenType.LEFT_BRACE,
+    "}": TokenType.RIGHT_BRACE,
+    ",": TokenType.COMMA,
+    ".": TokenType.DOT,
+    "-": TokenType.MINUS,
+    "+": TokenType.PLUS,
+    ";": TokenType.SEMICOLON,
+    "*": TokenType.STAR,
+    "/": TokenType.SLASH,
+    "!": TokenType.BANG,
+    "!=": TokenType.BANG_EQUAL,
+    "=": TokenType.EQUAL,
+    "==": TokenType.EQUAL_EQUAL,
+    "<": TokenType.LESS,
+    "<=": TokenType.LESS_EQUAL,
+    ">": TokenType.GREATER,
+    ">=": TokenType.GREATER_EQUAL,
+}
+
+# One token, after any spaces on its line. Which group matched says what kind
+# of token it is. Identifiers and numbers are matched in ASCII here; the rare
+# ones with other letters or digits are finished off character by character.
+_TOKEN = re.compile(
+    r"""
+    [ \r\t]*
+    (?:
+        (?P<newline>\n)
+      | (?P<identifier>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<number>[0-9]+(?:\.[0-9]+)?)
+      | (?P<comment>//[^\n]*)
+      | (?P<operator>[!=<>]=?|[(){},.\-+;*/])
+      | (?P<string>"[^"]*")
+      | (?P<unterminated>"[^"]*)
+      | (?P<other>.)
+      | (?P<end>\Z)
+    )
+    """,
+    re.VERBOSE | re.DOTALL,
+)
 
 
 class Scanner:
+    """Split source code into tokens, one regular expression match each.
+
+    Produces the same tokens, lines and errors as `CharacterScanner`.
+    """
+
+    def __init__(self, source: str):
+        """Create a new scanner"""
+        self._source = source
+        self._tokens = TokenBuffer(source)
+        self._line = 1
+
+    def scan_tokens(self) -> TokenBuffer:
+        length = len(self._source)
+        self._scan(0, length, True)
+        self._tokens.append(TokenType.EOF, length, length, self._line)
+        return self._tokens
+
+    def _scan(self, position: int, length: int, final: bool) -> int:
+        """Scan the source from `position` to `length`, returning where it ended.
+
+        Unless this is the `final` part of the source, a string still open at
+        `length` may be closed by text yet to come: scanning stops before it.
+        """
+        source = self._source
+        line = self._line
+        match = _TOKEN.match
+        # The buffer's columns are filled directly, as this is the hot loop.
+        add_type = self._tokens.types.append
+        add_line = self._tokens.lines.append
+        add_start = self._tokens.starts.append
+        add_end = self._tokens.ends.append
+        keywords = KEYWORDS
+        operators = _OPERATORS
+        identifier = TokenType.IDENTIFIER
+        while position < length:
+            token = match(source, position, length)
+            kind = token.lastgroup
+            position = token.end()
+            if kind == "identifier":
+                text = token[kind]
+                start = position - len(text)
+                if position < length and source[position] > "\x7f":
+                    position = _identifier_end(source, position)
+                    text = source[start:position]
+                type = keywords.get(text, identifier)
+            elif kind == "operator":
+                text = token[kind]
+                start = position - len(text)
+                type = operators[text]
+            elif kind == "newline":
+                line += 1
+                continue
+            elif kind == "number":
+                start = token.start(kind)
+                if position < length and (
+                    source[position] > "\x7f"
+                    or source[position] == "."
+                    and source[position + 1 : position + 2] > "\x7f"
+                ):
+                    position = _number_end(source, start)
+                type = TokenType.NUMBER
+            elif kind == "string":
+                start = token.start(kind)
+                line += source.count("\n", start, position)
+                type = TokenType.STRING
+            elif kind == "unterminated":
+                if not final:
+                    position = token.start(kind)
+                    break
+                line += token[kind].count("\n")
+                errors.report(line, "", "Unterminated string")
+                continue
+            elif kind == "other":
+                character = token[kind]
+                start = token.start(kind)
+                if character.isdigit():
+                    position = _number_end(source, start)
+                    type = TokenType.NUMBER
+                elif character.isalpha():
+                    position = _identifier_end(source, position)
+                    type = identifier
+                else:
+                    errors.report(line, "", f"Failed to scan token: {character}")
+                    continue
+            else:
+                # A comment, or the spaces at the end of the source.
+                continue
+            add_type(type)
+            add_line(line)
+            add_start(start)
+            add_end(position)
+
+        self._line = line
+        return position
+
+
+def scan_declarations(chunks: typing.Iterable[str]) -> typing.Iterator[TokenBuffer]:
+    """Scan source as it is read, yielding buffers of whole top-level declarations.
+
+    Each buffer ends with an EOF token, so it parses on its own. Until the
+    source runs out only whole lines are scanned, and the tokens after the
+    last whole declaration are carried over to the next buffer. Text is only
+    joined onto a declaration still being read once there is as much again,
+    so that a long one costs time in proportion to its length.
+    """
+    scanner = Scanner("")
+    scanned = 0
+    waiting: list[str] = []
+    waiting_size = 0
+    for chunk in chunks:
+        waiting.append(chunk)
+        waiting_size += len(chunk)
+        if waiting_size < len(scanner._source):
+            continue
+        scanner._source += "".join(waiting)
+        scanner._tokens.source = scanner._source
+        waiting.clear()
+        waiting_size = 0
+
+        lines_end = scanner._source.rfind("\n", scanned) + 1
+        if lines_end == 0:
+            continue
+        scanned = scanner._scan(scanned, lines_end, False)
+        index = _declarations_end(scanner._tokens)
+        if index:
+            held = len(scanner._source)
+            tail = scanner._tokens.split(index, scanned)
+            yield scanner._tokens
+            scanner._source = tail.source
+            scanner._tokens = tail
+            scanned -= held - len(tail.source)
+
+    scanner._source += "".join(waiting)
+    scanner._tokens.source = scanner._source
+    length = len(scanner._source)
+    scanner._scan(scanned, length, True)
+    scanner._tokens.append(TokenType.EOF, length, length, scanner._line)
+    yield scanner._tokens
+
+
+def scan_entry(source: str) -> TokenBuffer | None:
+    """Scan what was typed at a prompt, or None if it needs more lines.
+
+    It does while a string or a bracket is still open. Source with a
+    scanning error is never held back, so that the error is reported once.
+    """
+    scanner = Scanner(source)
+    length = len(source)
+    scanned = scanner._scan(0, length, False)
+    if not errors.is_error() and (
+        scanned < length or _open_brackets(scanner._tokens) > 0
+    ):
+        return None
+    scanner._scan(scanned, length, True)
+    scanner._tokens.append(TokenType.EOF, length, length, scanner._line)
+    return scanner._tokens
+
+
+def _open_brackets(tokens: TokenBuffer) -> int:
+    depth = 0
+    for type in tokens.types:
+        if type == TokenType.LEFT_PARENTHESIS or type == TokenType.LEFT_BRACE:
+            depth += 1
+        elif type == TokenType.RIGHT_PARENTHESIS or type == TokenType.RIGHT_BRACE:
+            depth = max(depth - 1, 0)
+    return depth
+
+
+def _declarations_end(tokens: TokenBuffer) -> int:
+    """How many tokens from the start make up whole top-level declarations.
+
+    A declaration ends at a `;` or `}` outside any brackets, unless an `else`
+    follows it, so the last token scanned is never known to end one.
+    """
+    types = tokens.types
+    end = 0
+    depth = 0
+    for index in range(len(types) - 1):
+        type = types[index]
+        if type == TokenType.LEFT_PARENTHESIS or type == TokenType.LEFT_BRACE:
+            depth += 1
+            continue
+        if type == TokenType.RIGHT_PARENTHESIS or type == TokenType.RIGHT_BRACE:
+            # A stray closing bracket is an error the parser reports.
+            depth = max(depth - 1, 0)
+        if (
+            depth == 0
+            and (type == TokenType.SEMICOLON or type == TokenType.RIGHT_BRACE)
+            and types[index + 1] != TokenType.ELSE
+        ):
+            end = index + 1
+    return end
+
+
+def _identifier_end(source: str, end: int) -> int:
+    while end < len(source) and (
+        source[end].isalpha() or source[end] == "_" or source[end].isdigit()
+    ):
+        end += 1
+    return end
+
+
+def _number_end(source: str, end: int) -> int:
+    while end < len(source) and source[end].isdigit():
+        end += 1
+    if source[end : end + 1] == "." and source[end + 1 : end + 2].isdigit():
+        end += 1
+        while end < len(source) and source[end].isdigit():
+            end += 1
+    return end
+
+
+class CharacterScanner:
+    """The book's scanner, which reads the source one character at a time.
+
+    `Scanner` is faster and is what the interpreter uses. This one is the
+    reference it is checked against; see `benchmarks/scanner_throughput.py`.
+    """
+
     def __init__(self, source: str):
         """Create a new scanner"""
         self._source = source
-        self._tokens: list[Token] = []
+        self._tokens = TokenBuffer(source)
         self._current = 0
         self._start = 0
         self._line = 1
 
-    def scan_tokens(self) -> list[Token]:
+    def scan_tokens(self) -> TokenBuffer:
         while self._current < len(self._source):
             self._start = self._current
             self._scan_token()
 
-        self._tokens.append(Token(TokenType.EOF, "", None, self._line))
+        end = len(self._source)
+        self._tokens.append(TokenType.EOF, end, end, self._line)
 
         return self._tokens
 
@@ -93,9 +378,8 @@ class Scanner:
         self._current += 1
         return character
 
-    def _add_token(self, type: TokenType, literal: object = None):
-        text = self._source[self._start : self._current]
-        self._tokens.append(Token(type, text, literal, self._line))
+    def _add_token(self, type: TokenType):
+        self._tokens.append(type, self._start, self._current, self._line)
 
     def _match(self, expected: str) -> bool:
         if self._current >= len(self._source):
@@ -119,11 +403,11 @@ class Scanner:
 
         if self._current >= len(self._source):
             errors.report(self._line, "", "Unterminated string")
+            return
 
         # Advance past the closing quote.
         self._advance()
-        value = self._source[self._start + 1 : self._current - 1]
-        self._add_token(TokenType.STRING, value)
+        self._add_token(TokenType.STRING)
 
     def _is_digit(self, character: str) -> bool:
         return character.isdigit()
@@ -137,9 +421,7 @@ class Scanner:
             while self._is_digit(self._peek()):
                 self._advance()
 
-        self._add_token(
-            TokenType.NUMBER, float(self._source[self._start : self._current])
-        )
+        self._add_token(TokenType.NUMBER)
 
     def _peek_next(self) -> str:
         if self._current + 1 >= len(self._source):
@@ -159,21 +441,4 @@ class Scanner:
             type = TokenType.IDENTIFIER
         self._add_token(type)
 
-    keywords = {
-        "and": TokenType.AND,
-        "class": TokenType.CLASS,
-        "else": TokenType.ELSE,
-        "false": TokenType.FALSE,
-        "for": TokenType.FOR,
-        "fun": TokenType.FUN,
-        "if": TokenType.IF,
-        "nil": TokenType.NIL,
-        "or": TokenType.OR,
-        "print": TokenType.PRINT,
-        "return": TokenType.RETURN,
-        "super": TokenType.SUPER,
-        "this": TokenType.THIS,
-        "true": TokenType.TRUE,
-        "var": TokenType.VAR,
-        "while": TokenType.WHILE,
-    }
+    keywords = KEYWORDS
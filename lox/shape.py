@@ -0,0 +1,41 @@
+import loxclass
+import loxfunction
+
+
+class Shape:
+    """The field layout shared by instances of a class.
+
+    Each class starts its instances on an empty root shape. Adding a field
+    moves an instance along a transition to the shape with that field
+    appended, so instances whose fields were added in the same order, usually
+    by the same `init`, end up sharing one shape and keep their values in a
+    plain list indexed by `slots`.
+
+    Shapes never change once created, which lets the inline caches key on them.
+    """
+
+    __slots__ = ("klass", "slots", "_transitions")
+
+    def __init__(self, klass: loxclass.LoxClass, slots: dict[str, int] | None = None):
+        self.klass = klass
+        self.slots: dict[str, int] = slots if slots is not None else {}
+        self._transitions: dict[str, Shape] = {}
+
+    def lookup(self, name: str) -> tuple[int | None, loxfunction.LoxFunction | None]:
+        """Find the field slot, or failing that the method, called `name`."""
+        slot = self.slots.get(name)
+        if slot is not None:
+            return slot, None
+        return None, self.klass.find_method(name)
+
+    def transition(self, name: str) -> tuple[int, Shape]:
+        """Return the slot for `name` and the shape an instance has once set."""
+        slot = self.slots.get(name)
+        if slot is not None:
+            return slot, self
+
+        shape = self._transitions.get(name)
+        if shape is None:
+            shape = Shape(self.klass, {**self.slots, name: len(self.slots)})
+            self._transitions[name] = shape
+        return shape.slots[name], shape
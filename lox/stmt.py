@@ -4,7 +4,7 @@ import typing
 import tokens
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class Block:
     statements: list[object]
 
@@ -12,7 +12,7 @@ class Block:
         return visitor.visit_block(self)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class Class:
     name: tokens.Token
     superclass: typing.Any
@@ -22,7 +22,7 @@ class Class:
         return visitor.visit_class(self)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class Expression:
     expression: object
 
@@ -30,7 +30,7 @@ class Expression:
         return visitor.visit_expression(self)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class Function:
     name: tokens.Token
     params: list[tokens.Token]
@@ -40,7 +40,7 @@ class Function:
         return visitor.visit_function(self)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class If:
     condition: object
     then_branch: object
@@ -50,7 +50,7 @@ class If:
         return visitor.visit_if(self)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class Print:
     expression: object
 
@@ -58,7 +58,7 @@ class Print:
         return visitor.visit_print(self)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class Return:
     keyword: tokens.Token
     value: object
@@ -67,7 +67,7 @@ class Return:
         return visitor.visit_return(self)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class Var:
     name: tokens.Token
     initializer: typing.Any
@@ -76,7 +76,7 @@ class Var:
         return visitor.visit_var(self)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, eq=False, slots=True)
 class While:
     condition: typing.Any
     body: typing.Any
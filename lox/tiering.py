@@ -0,0 +1,235 @@
+import dataclasses
+import os
+import sys
+import typing
+
+import completion
+import environment
+import errors
+import interpreter
+import loxclass
+import loxfunction
+import loxinstance
+import stmt
+import transpiler
+
+# A function is translated to Python once its calls and loop iterations add
+# up to this. Translating costs about as much as interpreting a few hundred
+# calls, so code that runs less than this is better left as it is.
+TIER_THRESHOLD = 1000
+
+# Set this environment variable to have each translation printed to stderr.
+DUMP_VARIABLE = "LOX_DUMP_PYTHON"
+
+
+@dataclasses.dataclass(eq=False)
+class Profile:
+    """How much one function declaration has run, and its translation once hot.
+
+    Every closure created from the declaration shares its profile.
+    """
+
+    declaration: stmt.Function
+    calls: int = 0
+    # Loop iterations run directly in the function's body.
+    backedges: int = 0
+    # The translated body, which takes over from the interpreter.
+    code: typing.Callable[..., completion.Return | None] | None = None
+    # Why the function could not be translated, once it was hot.
+    unsupported: str | None = None
+
+
+class ProfileTable(dict):
+    """The profile of each function declaration, created on first use."""
+
+    def __missing__(self, declaration: stmt.Function) -> Profile:
+        profile = self[declaration] = Profile(declaration)
+        return profile
+
+
+def tier_up(
+    interpret: interpreter.Interpreter, profile: Profile, has_this: bool
+) -> typing.Callable[..., completion.Return | None] | None:
+    """Translate a hot function to Python and compile it.
+
+    Returns the compiled body, or None if the function uses something the
+    transpiler does not handle, in which case it stays interpreted for good.
+    Functions it declares are left to tier up on their own.
+    `has_this` says whether the function is a method, with its instance in
+    slot 0.
+    """
+    declaration = profile.declaration
+    translator = transpiler.Transpiler(interpret._locals)
+    try:
+        source = translator.function(declaration, has_this)
+    except transpiler.Unsupported as e:
+        profile.unsupported = str(e)
+        return None
+
+    if os.environ.get(DUMP_VARIABLE):
+        print(
+            f"# {declaration.name.lexeme}, line {declaration.name.line}, after "
+            f"{profile.calls} calls and {profile.backedges} loop iterations",
+            file=sys.stderr,
+        )
+        print(source, file=sys.stderr)
+
+    scope = {**namespace(interpret), **translator.constants}
+    exec(compile(source, f"<lox {declaration.name.lexeme}>", "exec"), scope)
+    profile.code = scope[f"lox_{declaration.name.lexeme}"]
+    return profile.code
+
+
+def install(
+    interpret: interpreter.Interpreter,
+    declaration: stmt.Function,
+    code: typing.Callable[..., completion.Return | None],
+):
+    """Run `code` for every call of `declaration`, from the first one on."""
+    interpret._profiles[declaration].code = code
+
+
+def namespace(interpret: interpreter.Interpreter) -> dict[str, typing.Any]:
+    """The helpers that translated code calls, working on `interpret`.
+
+    Each does what the interpreter does for the same node, down to the
+    order operands are checked in and the errors reported.
+    """
+    globals = interpret.globals.values
+    caches = interpret._inline_caches
+
+    def undefined(name):
+        raise errors.RuntimeError(name, f"Undefined variable '{name.lexeme}'.")
+
+    def set_global(name, value):
+        if name.lexeme not in globals:
+            undefined(name)
+        globals[name.lexeme] = value
+        return value
+
+    def set_slot(values, slot, value):
+        values[slot] = value
+        return value
+
+    def negate(operator, value):
+        interpret._check_number_operands(operator, value)
+        return -value
+
+    def get(node, instance):
+        if isinstance(instance, loxinstance.LoxInstance):
+            return instance.get(node.name, caches[node])
+        raise errors.RuntimeError(node.name, "Only instances have properties")
+
+    def check_set(node, instance):
+        if isinstance(instance, loxinstance.LoxInstance):
+            return instance
+        raise errors.RuntimeError(node.name, "Only instances have fields.")
+
+    def set(node, instance, value):
+        instance.set(node.name, value, caches[node])
+        return value
+
+    def method(node, instance):
+        """Look up `instance.name` for a call: (method, instance) or (None, value)."""
+        if not isinstance(instance, loxinstance.LoxInstance):
+            raise errors.RuntimeError(node.name, "Only instances have properties")
+        cache = caches[node]
+        slot, found = cache.lookup(instance._shape)
+        if slot is None and found is not None:
+            return found, instance
+        return None, instance.get(node.name, cache)
+
+    def super_method(node, superclass, instance):
+        """Look up `super.name` for a call: (method, instance)."""
+        method = caches[node].lookup(superclass)
+        if not method:
+            raise errors.RuntimeError(
+                node.method, f"Undefined property '{node.method.lexeme}'."
+            )
+        return method, instance
+
+    def bind(looked):
+        method, instance = looked
+        return method.bind(instance)
+
+    def function(declaration, env):
+        memo = interpret._memos.get(declaration)
+        if memo is None:
+            return loxfunction.LoxFunction(declaration, env, False)
+        return loxfunction.MemoizedFunction(declaration, env, memo)
+
+    def klass(node, env, superclass):
+        if node.superclass is not None:
+            if not isinstance(superclass, loxclass.LoxClass):
+                raise errors.RuntimeError(
+                    node.superclass.name, "Superclass must be a class."
+                )
+            env = environment.Environment(env, [superclass])
+        methods = {
+            method.name.lexeme: loxfunction.LoxFunction(
+                method, env, method.name.lexeme == "init"
+            )
+            for method in node.methods
+        }
+        return loxclass.LoxClass(node.name.lexeme, superclass, methods)
+
+    def call_method(paren, looked, arguments):
+        found, receiver = looked
+        if found is None:
+            return interpret._call_value(paren, receiver, arguments)
+        interpret._check_arity(paren, found, arguments)
+        return interpret._invoke(paren, found, receiver, arguments)
+
+    def tail(paren, callee, arguments):
+        interpret._check_callable(paren, callee, arguments)
+        return completion.TailCall(callee, None, arguments)
+
+    def tail_method(paren, looked, arguments):
+        found, receiver = looked
+        if found is None:
+            return tail(paren, receiver, arguments)
+        interpret._check_arity(paren, found, arguments)
+        return completion.TailCall(found, receiver, arguments)
+
+    return {
+        "_Return": completion.Return,
+        "_BoundMethod": loxfunction.BoundMethod,
+        "_Environment": environment.Environment,
+        "_genv": interpret.globals,
+        "_globals": globals,
+        "_function": function,
+        "_class": klass,
+        "_undefined": undefined,
+        "_set_global": set_global,
+        "_set_slot": set_slot,
+        "_negate": negate,
+        "_binary": interpret._binary,
+        "_stringify": interpret._stringify,
+        "_get": get,
+        "_check_set": check_set,
+        "_set": set,
+        "_method": method,
+        "_super_method": super_method,
+        "_bind": bind,
+        "_call_method": call_method,
+        "_call": interpret._call_value,
+        "_tail": tail,
+        "_tail_method": tail_method,
+    }
+
+
+def stats(profiles: typing.Iterable[Profile]) -> dict[str, typing.Any]:
+    """Count the functions translated, and say why hot ones were not."""
+    summary: dict[str, typing.Any] = {
+        "tiered functions": 0,
+        "untiered hot functions": 0,
+    }
+    reasons = {}
+    for profile in profiles:
+        if profile.code is not None:
+            summary["tiered functions"] += 1
+        elif profile.unsupported is not None:
+            summary["untiered hot functions"] += 1
+            name = profile.declaration.name.lexeme
+            reasons[f"not tiered {name}"] = profile.unsupported
+    return {**summary, **reasons}
@@ -1,7 +1,11 @@
+import array
 import enum
+import sys
 
 
 class Token:
+    __slots__ = ("type", "lexeme", "literal", "line")
+
     def __init__(self, type: TokenType, lexeme: str, literal, line: int):
         self.type = type
         self.lexeme = lexeme
@@ -12,7 +16,7 @@ class Token:
         return f"{self.type} {self.lexeme} {self.literal}"
 
 
-class TokenType(enum.Enum):
+class TokenType(enum.IntEnum):
     # Single characters
     LEFT_PARENTHESIS = 1
     RIGHT_PARENTHESIS = 2
@@ -63,3 +67,71 @@ class TokenType(enum.Enum):
 
     def __str__(self) -> str:
         return f"{self.name}"
+
+
+# Token types by their codes in a `TokenBuffer`.
+_TYPES: list[TokenType | None] = [None] * (max(TokenType) + 1)
+for _type in TokenType:
+    _TYPES[_type] = _type
+
+
+class TokenBuffer:
+    """The tokens of one source, stored column by column.
+
+    A token is its index: its type code, line and where its lexeme starts and
+    ends in the source are kept in typed arrays, so scanning allocates no
+    object per token. Indexing creates a `Token`, for the parser to put in the
+    AST; it does so only for tokens the AST keeps, such as names, operators
+    and literals, never for punctuation.
+
+    Lexemes other than strings and numbers are interned, so variable and
+    property names compare by identity in the dictionaries that hold them.
+    """
+
+    __slots__ = ("source", "types", "lines", "starts", "ends")
+
+    def __init__(self, source: str):
+        self.source = source
+        self.types = array.array("B")
+        self.lines = array.array("I")
+        self.starts = array.array("I")
+        self.ends = array.array("I")
+
+    def append(self, type: TokenType, start: int, end: int, line: int):
+        self.types.append(type)
+        self.lines.append(line)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def split(self, index: int, end: int) -> TokenBuffer:
+        """Move the tokens from `index` on to a new buffer, and end this one there.
+
+        The new buffer's source starts at its first token, or at `end` when it
+        has none, so that scanning can carry on into it. This buffer keeps its
+        source and gets an EOF token after the tokens it keeps.
+        """
+        shift = self.starts[index] if index < len(self.types) else end
+        tail = TokenBuffer(self.source[shift:])
+        tail.types = self.types[index:]
+        tail.lines = self.lines[index:]
+        tail.starts = array.array("I", [start - shift for start in self.starts[index:]])
+        tail.ends = array.array("I", [stop - shift for stop in self.ends[index:]])
+        del self.types[index:], self.lines[index:], self.starts[index:]
+        del self.ends[index:]
+        self.append(TokenType.EOF, shift, shift, self.lines[index - 1])
+        return tail
+
+    def __getitem__(self, index: int) -> Token:
+        type = _TYPES[self.types[index]]
+        lexeme = self.source[self.starts[index] : self.ends[index]]
+        literal = None
+        if type is TokenType.NUMBER:
+            literal = float(lexeme)
+        elif type is TokenType.STRING:
+            literal = lexeme[1:-1]
+        else:
+            lexeme = sys.intern(lexeme)
+        return Token(type, lexeme, literal, self.lines[index])
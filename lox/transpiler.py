@@ -0,0 +1,449 @@
+import math
+import typing
+
+import expr
+import stmt
+import tokens
+
+_OPERATORS = {
+    tokens.TokenType.PLUS: "+",
+    tokens.TokenType.MINUS: "-",
+    tokens.TokenType.STAR: "*",
+    tokens.TokenType.SLASH: "/",
+    tokens.TokenType.GREATER: ">",
+    tokens.TokenType.GREATER_EQUAL: ">=",
+    tokens.TokenType.LESS: "<",
+    tokens.TokenType.LESS_EQUAL: "<=",
+}
+
+# Operators whose result is always a boolean, so it can be tested directly.
+_BOOLEAN_OPERATORS = {
+    tokens.TokenType.GREATER,
+    tokens.TokenType.GREATER_EQUAL,
+    tokens.TokenType.LESS,
+    tokens.TokenType.LESS_EQUAL,
+    tokens.TokenType.EQUAL_EQUAL,
+    tokens.TokenType.BANG_EQUAL,
+}
+
+
+class Unsupported(Exception):
+    """A construct that the transpiler has no translation for."""
+
+
+class Transpiler:
+    """Translate resolved Lox functions and scripts into Python source.
+
+    A function's locals become Python locals unless it declares functions or
+    classes, which could capture them. Such a function is boxed instead: its
+    scopes are real environments, as in the interpreter, and its locals are
+    read and written through their `values` lists. Variables of enclosing
+    functions are read through the closure's environments, and globals from
+    the global dictionary.
+
+    Arithmetic and comparisons run inline when both operands are numbers and
+    otherwise call `_binary`, the interpreter's own operator, which handles
+    strings and reports errors as usual. Calls, fields, declarations and
+    printing go through the helpers that `tiering.namespace` defines.
+    Objects the code needs, such as tokens for error messages, are
+    `constants` named `k0`, `k1` and so on.
+
+    A translated function takes the frame's environment and returns a
+    `completion.Return` or None, as `Interpreter._execute_block` does. The
+    functions and methods that translated code declares are collected in
+    `declarations` but not translated themselves.
+    """
+
+    def __init__(self, resolved: dict[object, tuple[int, int]]):
+        self._resolved = resolved
+        self.constants: dict[str, typing.Any] = {}
+        self._constant_names: dict[int, str] = {}
+        # Each declared function, and whether it is a method.
+        self.declarations: list[tuple[stmt.Function, bool]] = []
+        self._names = 0
+        self._start(False)
+
+    def _start(self, boxed: bool):
+        self._boxed = boxed
+        self._lines: list[str] = []
+        self._indent = 1
+        # How to read the locals in each scope by slot, innermost last.
+        self._scopes: list[list[str]] = []
+        # Closure environments read, by distance past the function's own scope.
+        self._outer: set[int] = set()
+
+    def function(
+        self, declaration: stmt.Function, has_this: bool, name: str | None = None
+    ) -> str:
+        """Return the source of a Python function, named `lox_<name>` by default."""
+        self._start(_declares(declaration.body))
+        params = [param.lexeme for param in declaration.params]
+        if has_this:
+            params.insert(0, "this")
+        if self._boxed:
+            scope = [f"_s0[{index}]" for index in range(len(params))]
+        else:
+            scope = [self._name(param) for param in params]
+        self._scopes.append(scope)
+        self._statements(declaration.body)
+
+        lines = [f"def {name or f'lox_{declaration.name.lexeme}'}(_env):"]
+        if self._boxed:
+            lines.append("    _e0 = _env")
+            lines.append("    _s0 = _env.values")
+        elif params:
+            lines.append("    _values = _env.values")
+            for index in range(len(params)):
+                lines.append(f"    {scope[index]} = _values[{index}]")
+        for distance in sorted(self._outer):
+            ancestor = f"_env._enclosing._ancestor({distance})"
+            lines.append(f"    _outer{distance} = {ancestor}.values")
+        return _source(lines, self._lines)
+
+    def script(self, statements: list[typing.Any], name: str) -> str:
+        """Return the source of a Python function running a whole program."""
+        self._start(any(_declares(_children(node)) for node in statements))
+        self._statements(statements)
+        return _source([f"def {name}():"], self._lines)
+
+    def _statements(self, statements: list[typing.Any]):
+        for statement in statements:
+            self._statement(statement)
+
+    def _statement(self, node: typing.Any):
+        match node:
+            case stmt.Expression():
+                self._emit(self._expression(node.expression))
+            case stmt.Print():
+                value = self._expression(node.expression)
+                self._emit(f"print(_stringify({value}))")
+            case stmt.Var():
+                value = "None"
+                if node.initializer is not None:
+                    value = self._expression(node.initializer)
+                self._declare(node.name.lexeme, value)
+            case stmt.Function():
+                self.declarations.append((node, False))
+                function = f"_function({self._constant(node)}, {self._env()})"
+                self._declare(node.name.lexeme, function)
+            case stmt.Class():
+                superclass = "None"
+                if node.superclass is not None:
+                    superclass = self._expression(node.superclass)
+                for method in node.methods:
+                    self.declarations.append((method, True))
+                    self._constant(method)
+                klass = f"_class({self._constant(node)}, {self._env()}, {superclass})"
+                self._declare(node.name.lexeme, klass)
+            case stmt.Block():
+                self._scopes.append([])
+                if self._boxed:
+                    index = len(self._scopes) - 1
+                    enclosing = f"_e{index - 1}" if index else "_genv"
+                    self._emit(f"_e{index} = _Environment({enclosing})")
+                    self._emit(f"_s{index} = _e{index}.values")
+                self._statements(node.statements)
+                self._scopes.pop()
+            case stmt.If():
+                self._emit(f"if {self._condition(node.condition)}:")
+                self._suite(node.then_branch)
+                if node.else_branch is not None:
+                    self._emit("else:")
+                    self._suite(node.else_branch)
+            case stmt.While():
+                self._emit(f"while {self._condition(node.condition)}:")
+                self._suite(node.body)
+            case stmt.Return():
+                if node.value is None:
+                    value = "None"
+                elif type(node.value) is expr.Call:
+                    value = self._tail_call(node.value)
+                else:
+                    value = self._expression(node.value)
+                self._emit(f"return _Return({value})")
+            case _:
+                raise Unsupported(f"it uses {type(node).__name__.lower()}")
+
+    def _declare(self, lexeme: str, value: str):
+        """Define a variable in the innermost scope, or a global outside any."""
+        if not self._scopes:
+            self._emit(f"_globals[{lexeme!r}] = {value}")
+            return
+        scope = self._scopes[-1]
+        if self._boxed:
+            index = len(self._scopes) - 1
+            scope.append(f"_s{index}[{len(scope)}]")
+            self._emit(f"_s{index}.append({value})")
+            return
+        name = self._name(lexeme)
+        scope.append(name)
+        self._emit(f"{name} = {value}")
+
+    def _env(self) -> str:
+        """The environment of the innermost scope, for closures to capture."""
+        if not self._scopes:
+            return "_genv"
+        return f"_e{len(self._scopes) - 1}"
+
+    def _suite(self, node: typing.Any):
+        self._indent += 1
+        start = len(self._lines)
+        self._statement(node)
+        if len(self._lines) == start:
+            self._emit("pass")
+        self._indent -= 1
+
+    def _condition(self, node: typing.Any) -> str:
+        """Translate an expression tested for truth into a Python boolean."""
+        if isinstance(node, expr.Binary) and node.operator.type in _BOOLEAN_OPERATORS:
+            return self._expression(node)
+        if isinstance(node, expr.Unary) and node.operator.type == tokens.TokenType.BANG:
+            return self._expression(node)
+        value = self._temporary()
+        expression = self._expression(node)
+        return f"(({value} := {expression}) is not None and {value} is not False)"
+
+    def _expression(self, node: typing.Any) -> str:
+        match node:
+            case expr.Literal():
+                return self._literal(node.value)
+            case expr.Grouping():
+                return self._expression(node.expression)
+            case expr.Variable():
+                return self._read(node, node.name)
+            case expr.This():
+                return self._read(node, node.keyword)
+            case expr.Assign():
+                return self._assign(node)
+            case expr.Unary():
+                return self._unary(node)
+            case expr.Binary():
+                return self._binary(node)
+            case expr.Logical():
+                return self._logical(node)
+            case expr.Call():
+                return self._call(node)
+            case expr.Inlined():
+                # The original call is always correct, and cheap once compiled.
+                return self._call(node.call)
+            case expr.Hoisted():
+                return self._hoisted(node)
+            case expr.Get():
+                instance = self._expression(node.instance)
+                return f"_get({self._constant(node)}, {instance})"
+            case expr.Super():
+                return f"_bind({self._super(node)})"
+            case expr.Set():
+                instance = self._expression(node.instance)
+                value = self._expression(node.value)
+                name = self._constant(node)
+                return f"_set({name}, _check_set({name}, {instance}), {value})"
+        raise Unsupported(f"it uses {type(node).__name__.lower()}")
+
+    def _literal(self, value: typing.Any) -> str:
+        if type(value) is float and not math.isfinite(value):
+            return self._constant(value)
+        return repr(value)
+
+    def _read(self, node: typing.Any, name: tokens.Token) -> str:
+        resolved = self._resolved.get(node)
+        if resolved is None:
+            lexeme = repr(name.lexeme)
+            return (
+                f"(_globals[{lexeme}] if {lexeme} in _globals "
+                f"else _undefined({self._constant(name)}))"
+            )
+        return self._local(*resolved)
+
+    def _local(self, distance: int, slot: int) -> str:
+        if distance < len(self._scopes):
+            return self._scopes[-1 - distance][slot]
+        outer = distance - len(self._scopes)
+        self._outer.add(outer)
+        return f"_outer{outer}[{slot}]"
+
+    def _assign(self, node: expr.Assign) -> str:
+        value = self._expression(node.value)
+        resolved = self._resolved.get(node)
+        if resolved is None:
+            return f"_set_global({self._constant(node.name)}, {value})"
+        return self._store(*resolved, value)
+
+    def _store(self, distance: int, slot: int, value: str) -> str:
+        if distance >= len(self._scopes):
+            outer = distance - len(self._scopes)
+            self._outer.add(outer)
+            return f"_set_slot(_outer{outer}, {slot}, {value})"
+        if self._boxed:
+            index = len(self._scopes) - 1 - distance
+            return f"_set_slot(_s{index}, {slot}, {value})"
+        return f"({self._local(distance, slot)} := {value})"
+
+    def _unary(self, node: expr.Unary) -> str:
+        right = self._expression(node.right)
+        value = self._temporary()
+        if node.operator.type == tokens.TokenType.BANG:
+            return f"(({value} := {right}) is None or {value} is False)"
+        operator = self._constant(node.operator)
+        return (
+            f"(-{value} if type({value} := {right}) is float "
+            f"else _negate({operator}, {value}))"
+        )
+
+    def _binary(self, node: expr.Binary) -> str:
+        left = self._expression(node.left)
+        right = self._expression(node.right)
+        match node.operator.type:
+            case tokens.TokenType.EQUAL_EQUAL:
+                return f"({left} == {right})"
+            case tokens.TokenType.BANG_EQUAL:
+                return f"({left} != {right})"
+
+        symbol = _OPERATORS[node.operator.type]
+        fallback = self._constant(node)
+        if _is_other_literal(node.left) or _is_other_literal(node.right):
+            # A string can never take the fast path.
+            return f"_binary({fallback}, {left}, {right})"
+        # A number literal needs no check of its own.
+        if _is_number(node.right):
+            a = self._temporary()
+            return (
+                f"({a} {symbol} {right} if type({a} := {left}) is float "
+                f"else _binary({fallback}, {a}, {right}))"
+            )
+        if _is_number(node.left):
+            b = self._temporary()
+            return (
+                f"({left} {symbol} {b} if type({b} := {right}) is float "
+                f"else _binary({fallback}, {left}, {b}))"
+            )
+        a = self._temporary()
+        b = self._temporary()
+        return (
+            f"({a} {symbol} {b} "
+            f"if type({a} := {left}) is type({b} := {right}) is float "
+            f"else _binary({fallback}, {a}, {b}))"
+        )
+
+    def _logical(self, node: expr.Logical) -> str:
+        left = self._expression(node.left)
+        right = self._expression(node.right)
+        value = self._temporary()
+        truthy = f"({value} := {left}) is not None and {value} is not False"
+        if node.operator.type == tokens.TokenType.OR:
+            return f"({value} if {truthy} else {right})"
+        return f"({right} if {truthy} else {value})"
+
+    def _call(self, node: expr.Call) -> str:
+        paren = self._constant(node.paren)
+        match node.callee:
+            case expr.Get() as get:
+                method = self._method(get)
+                arguments = self._arguments(node)
+                return f"_call_method({paren}, {method}, [{arguments}])"
+            case expr.Super() as super_expr:
+                method = self._super(super_expr)
+                arguments = self._arguments(node)
+                return f"_call_method({paren}, {method}, [{arguments}])"
+        callee = self._expression(node.callee)
+        return f"_call({paren}, {callee}, [{self._arguments(node)}])"
+
+    def _tail_call(self, node: expr.Call) -> str:
+        """Translate the call in `return f(...)`, which the caller makes."""
+        paren = self._constant(node.paren)
+        match node.callee:
+            case expr.Get() as get:
+                method = self._method(get)
+                arguments = self._arguments(node)
+                return f"_tail_method({paren}, {method}, [{arguments}])"
+            case expr.Super() as super_expr:
+                method = self._super(super_expr)
+                arguments = self._arguments(node)
+                return f"_tail_method({paren}, {method}, [{arguments}])"
+        callee = self._expression(node.callee)
+        return f"_tail({paren}, {callee}, [{self._arguments(node)}])"
+
+    def _method(self, get: expr.Get) -> str:
+        return f"_method({self._constant(get)}, {self._expression(get.instance)})"
+
+    def _super(self, node: expr.Super) -> str:
+        # The superclass is in the scope around the class's methods, and
+        # `this` in slot 0 of the method's own.
+        distance, slot = self._resolved[node]
+        superclass = self._local(distance, slot)
+        instance = self._local(distance - 1, 0)
+        return f"_super_method({self._constant(node)}, {superclass}, {instance})"
+
+    def _arguments(self, node: expr.Call) -> str:
+        return ", ".join(self._expression(argument) for argument in node.arguments)
+
+    def _hoisted(self, node: expr.Hoisted) -> str:
+        distance, slot = self._resolved[node.variable]
+        expression = self._expression(node.expression)
+        if distance >= len(self._scopes):
+            return expression
+        local = self._local(distance, slot)
+        value = self._temporary()
+        store = self._store(distance, slot, value)
+        # As in the interpreter: worked out on first use, bound methods never kept.
+        return (
+            f"({value} if ({value} := {local}) is not None "
+            f"else ({value} if type({value} := {expression}) is _BoundMethod "
+            f"else {store}))"
+        )
+
+    def _emit(self, line: str):
+        self._lines.append("    " * self._indent + line)
+
+    def _name(self, lexeme: str) -> str:
+        """Give a Lox local a Python name that nothing else in the function has."""
+        name = "".join(char if char.isalnum() else "_" for char in lexeme)
+        self._names += 1
+        return f"{name}_{self._names}"
+
+    def _temporary(self) -> str:
+        self._names += 1
+        return f"t{self._names}"
+
+    def _constant(self, value: typing.Any) -> str:
+        name = self._constant_names.get(id(value))
+        if name is None:
+            name = f"k{len(self.constants)}"
+            self._constant_names[id(value)] = name
+            self.constants[name] = value
+        return name
+
+
+def _is_number(node: typing.Any) -> bool:
+    return isinstance(node, expr.Literal) and type(node.value) is float
+
+
+def _is_other_literal(node: typing.Any) -> bool:
+    return isinstance(node, expr.Literal) and type(node.value) is not float
+
+
+def _source(header: list[str], body: list[str]) -> str:
+    lines = header + body
+    if not body:
+        lines.append("    pass")
+    return "\n".join(lines) + "\n"
+
+
+def _children(node: typing.Any) -> list[typing.Any]:
+    """The statements directly nested in a statement, in their own scopes."""
+    match node:
+        case stmt.Block():
+            return node.statements
+        case stmt.If():
+            return [node.then_branch, node.else_branch]
+        case stmt.While():
+            return [node.body]
+    return []
+
+
+def _declares(statements: list[typing.Any]) -> bool:
+    """Whether a function or class is declared in these statements' scopes."""
+    return any(
+        isinstance(node, (stmt.Function, stmt.Class)) or _declares(_children(node))
+        for node in statements
+    )
@@ -0,0 +1,516 @@
+import typing
+
+import compiler
+import errors
+import inline_cache
+import interpreter
+import loxclass
+import loxinstance
+import natives
+import optimizer
+import tokens
+from compiler import OpCode
+
+# Plain integers compare faster than enum members in the dispatch loop.
+_CONSTANT = OpCode.CONSTANT.value
+_NIL = OpCode.NIL.value
+_TRUE = OpCode.TRUE.value
+_FALSE = OpCode.FALSE.value
+_POP = OpCode.POP.value
+_GET_LOCAL = OpCode.GET_LOCAL.value
+_SET_LOCAL = OpCode.SET_LOCAL.value
+_GET_GLOBAL = OpCode.GET_GLOBAL.value
+_DEFINE_GLOBAL = OpCode.DEFINE_GLOBAL.value
+_SET_GLOBAL = OpCode.SET_GLOBAL.value
+_GET_UPVALUE = OpCode.GET_UPVALUE.value
+_SET_UPVALUE = OpCode.SET_UPVALUE.value
+_GET_PROPERTY = OpCode.GET_PROPERTY.value
+_SET_PROPERTY = OpCode.SET_PROPERTY.value
+_GET_SUPER = OpCode.GET_SUPER.value
+_EQUAL = OpCode.EQUAL.value
+_NOT_EQUAL = OpCode.NOT_EQUAL.value
+_GREATER = OpCode.GREATER.value
+_GREATER_EQUAL = OpCode.GREATER_EQUAL.value
+_LESS = OpCode.LESS.value
+_LESS_EQUAL = OpCode.LESS_EQUAL.value
+_ADD = OpCode.ADD.value
+_SUBTRACT = OpCode.SUBTRACT.value
+_MULTIPLY = OpCode.MULTIPLY.value
+_DIVIDE = OpCode.DIVIDE.value
+_NOT = OpCode.NOT.value
+_NEGATE = OpCode.NEGATE.value
+_PRINT = OpCode.PRINT.value
+_JUMP = OpCode.JUMP.value
+_JUMP_IF_FALSE = OpCode.JUMP_IF_FALSE.value
+_LOOP = OpCode.LOOP.value
+_CALL = OpCode.CALL.value
+_LOAD_METHOD = OpCode.LOAD_METHOD.value
+_LOAD_SUPER_METHOD = OpCode.LOAD_SUPER_METHOD.value
+_CALL_METHOD = OpCode.CALL_METHOD.value
+_CLOSURE = OpCode.CLOSURE.value
+_CLOSE_UPVALUE = OpCode.CLOSE_UPVALUE.value
+_RETURN = OpCode.RETURN.value
+_CLASS = OpCode.CLASS.value
+
+
+class Upvalue:
+    """A variable captured by a closure.
+
+    While open it points into the VM stack; closing it swaps in a private
+    one-element list, so reads and writes never need to branch.
+    """
+
+    __slots__ = ("cells", "index")
+
+    def __init__(self, cells: list[typing.Any], index: int):
+        self.cells = cells
+        self.index = index
+
+    def close(self):
+        self.cells = [self.cells[self.index]]
+        self.index = 0
+
+
+class Closure:
+    __slots__ = ("function", "upvalues")
+
+    def __init__(self, function: compiler.FunctionProto, upvalues: list[Upvalue]):
+        self.function = function
+        self.upvalues = upvalues
+
+    def arity(self) -> int:
+        return self.function.arity
+
+    def bind(self, instance: loxinstance.LoxInstance) -> BoundMethod:
+        return BoundMethod(instance, self)
+
+    def __str__(self) -> str:
+        return str(self.function)
+
+
+class BoundMethod:
+    __slots__ = ("receiver", "method")
+
+    def __init__(self, receiver: loxinstance.LoxInstance, method: Closure):
+        self.receiver = receiver
+        self.method = method
+
+    def arity(self) -> int:
+        return self.method.function.arity
+
+    def __str__(self) -> str:
+        return str(self.method)
+
+
+class _CallFrame:
+    __slots__ = ("closure", "ip", "base", "result")
+
+    def __init__(self, closure: Closure, base: int, result: int):
+        self.closure = closure
+        self.ip = 0
+        # Stack index of slot zero, and where the return value is stored.
+        self.base = base
+        self.result = result
+
+
+# Marks a LOAD_METHOD that found a plain value rather than a method.
+_NO_RECEIVER = object()
+
+
+class VM:
+    """Execute compiled bytecode on a value stack.
+
+    Exposes the same `resolve`/`interpret` interface as the tree walker so
+    that the resolver and the REPL drive it unchanged.
+    """
+
+    def __init__(self, max_depth: int = interpreter.MAX_CALL_DEPTH):
+        self.globals: dict[str, typing.Any] = {"clock": natives.Clock()}
+        self._locals: dict[object, tuple[int, int]] = {}
+        self._stack: list[typing.Any] = []
+        self._frames: list[_CallFrame] = []
+        self._max_depth = max_depth
+        self._open_upvalues: dict[int, Upvalue] = {}
+        self._inline_caches: list[inline_cache.InlineCache] = []
+
+    def resolve(self, expression: object, depth: int, slot: int):
+        self._locals[expression] = (depth, slot)
+
+    def release(self, statement: typing.Any):
+        """Forget the resolutions in a top-level statement that has run.
+
+        Its functions are compiled along with it, so none are kept. The inline
+        caches stay, as the compiled code refers to them by index.
+        """
+        for node in optimizer.walk([statement]):
+            self._locals.pop(node, None)
+
+    def compile(self, statements: list[typing.Any]) -> compiler.FunctionProto:
+        return compiler.Compiler(self._locals, self._inline_caches).compile(
+            statements
+        )
+
+    def stats(self) -> dict[str, int]:
+        return inline_cache.stats(self._inline_caches)
+
+    def interpret(self, statements: list[typing.Any]):
+        script = Closure(self.compile(statements), [])
+        self._stack.append(script)
+        self._frames.append(_CallFrame(script, 0, 0))
+        try:
+            self._run()
+        except errors.RuntimeError as e:
+            errors.runtime_error(e)
+            self._stack.clear()
+            self._frames.clear()
+            self._open_upvalues.clear()
+
+    def _run(self):
+        stack = self._stack
+        frames = self._frames
+        max_depth = self._max_depth
+        globals = self.globals
+        stringify = interpreter.stringify
+
+        frame = frames[-1]
+        chunk = frame.closure.function.chunk
+        code = chunk.code
+        constants = chunk.constants
+        upvalues = frame.closure.upvalues
+        base = frame.base
+        ip = frame.ip
+
+        while True:
+            op = code[ip]
+            ip += 1
+
+            if op == _GET_LOCAL:
+                stack.append(stack[base + code[ip]])
+                ip += 1
+            elif op == _CONSTANT:
+                stack.append(constants[code[ip]])
+                ip += 1
+            elif op == _POP:
+                stack.pop()
+            elif op == _GET_GLOBAL:
+                name = constants[code[ip]]
+                ip += 1
+                try:
+                    stack.append(globals[name])
+                except KeyError:
+                    raise errors.RuntimeError(
+                        chunk.tokens[ip - 1], f"Undefined variable '{name}'."
+                    )
+            elif op == _SET_LOCAL:
+                stack[base + code[ip]] = stack[-1]
+                ip += 1
+            elif op == _JUMP_IF_FALSE:
+                value = stack[-1]
+                if value is None or value is False:
+                    ip += code[ip] + 1
+                else:
+                    ip += 1
+            elif op == _JUMP:
+                ip += code[ip] + 1
+            elif op == _LOOP:
+                ip -= code[ip] - 1
+            elif op == _ADD:
+                b = stack.pop()
+                a = stack[-1]
+                if (type(a) is float and type(b) is float) or (
+                    type(a) is str and type(b) is str
+                ):
+                    stack[-1] = a + b
+                else:
+                    raise errors.RuntimeError(
+                        chunk.tokens[ip - 1],
+                        "Operands must be two numbers or two strings.",
+                    )
+            elif op == _SUBTRACT:
+                b = stack.pop()
+                a = stack[-1]
+                if type(a) is not float or type(b) is not float:
+                    raise self._number_error(chunk, ip)
+                stack[-1] = a - b
+            elif op == _LESS:
+                b = stack.pop()
+                a = stack[-1]
+                if type(a) is not float or type(b) is not float:
+                    raise self._number_error(chunk, ip)
+                stack[-1] = a < b
+            elif op == _CALL or op == _CALL_METHOD:
+                argc = code[ip]
+                ip += 1
+                callee = stack[-1 - argc]
+                result = len(stack) - 1 - argc
+                if op == _CALL_METHOD:
+                    if callee is _NO_RECEIVER:
+                        del stack[-1 - argc]
+                        callee = stack[-1 - argc]
+                        result -= 1
+                    else:
+                        callee = stack[-2 - argc]
+                        result -= 1
+                if type(callee) is not Closure:
+                    callee = self._call_value(callee, argc, chunk.tokens[ip - 1])
+                    if callee is None:
+                        continue
+
+                if argc != callee.function.arity:
+                    raise errors.RuntimeError(
+                        chunk.tokens[ip - 1],
+                        f"Expected {callee.function.arity} arguments but got {argc}.",
+                    )
+                if code[ip] == _RETURN:
+                    # `return f(...)` compiles to the call followed by RETURN,
+                    # so the callee can take over this frame. Its slots move
+                    # down to where this frame's result goes.
+                    if self._open_upvalues:
+                        self._close_upvalues(base)
+                    start = frame.result
+                    offset = len(stack) - 1 - argc - result
+                    stack[start:] = stack[result:]
+                    frame = frames[-1] = _CallFrame(callee, start + offset, start)
+                else:
+                    if len(frames) == max_depth:
+                        raise errors.RuntimeError(
+                            chunk.tokens[ip - 1], "Stack overflow."
+                        )
+
+                    frame.ip = ip
+                    frame = _CallFrame(callee, len(stack) - 1 - argc, result)
+                    frames.append(frame)
+                chunk = callee.function.chunk
+                code = chunk.code
+                constants = chunk.constants
+                upvalues = callee.upvalues
+                base = frame.base
+                ip = 0
+            elif op == _RETURN:
+                value = stack.pop()
+                if self._open_upvalues:
+                    self._close_upvalues(base)
+                frames.pop()
+                del stack[frame.result :]
+                if not frames:
+                    return
+                stack.append(value)
+
+                frame = frames[-1]
+                chunk = frame.closure.function.chunk
+                code = chunk.code
+                constants = chunk.constants
+                upvalues = frame.closure.upvalues
+                base = frame.base
+                ip = frame.ip
+            elif op == _GET_UPVALUE:
+                upvalue = upvalues[code[ip]]
+                ip += 1
+                stack.append(upvalue.cells[upvalue.index])
+            elif op == _SET_UPVALUE:
+                upvalue = upvalues[code[ip]]
+                ip += 1
+                upvalue.cells[upvalue.index] = stack[-1]
+            elif op == _NIL:
+                stack.append(None)
+            elif op == _TRUE:
+                stack.append(True)
+            elif op == _FALSE:
+                stack.append(False)
+            elif op == _SET_GLOBAL:
+                name = constants[code[ip]]
+                ip += 1
+                if name not in globals:
+                    raise errors.RuntimeError(
+                        chunk.tokens[ip - 1], f"Undefined variable '{name}'."
+                    )
+                globals[name] = stack[-1]
+            elif op == _DEFINE_GLOBAL:
+                globals[constants[code[ip]]] = stack.pop()
+                ip += 1
+            elif op == _GET_PROPERTY:
+                instance = stack[-1]
+                ip += 1
+                if not isinstance(instance, loxinstance.LoxInstance):
+                    raise errors.RuntimeError(
+                        chunk.tokens[ip - 1], "Only instances have properties"
+                    )
+                stack[-1] = instance.get(
+                    chunk.tokens[ip - 1], constants[code[ip - 1]]
+                )
+            elif op == _SET_PROPERTY:
+                value = stack.pop()
+                instance = stack[-1]
+                ip += 1
+                if not isinstance(instance, loxinstance.LoxInstance):
+                    raise errors.RuntimeError(
+                        chunk.tokens[ip - 1], "Only instances have fields."
+                    )
+                instance.set(chunk.tokens[ip - 1], value, constants[code[ip - 1]])
+                stack[-1] = value
+            elif op == _LOAD_METHOD:
+                instance = stack[-1]
+                cache = constants[code[ip]]
+                ip += 1
+                if not isinstance(instance, loxinstance.LoxInstance):
+                    raise errors.RuntimeError(
+                        chunk.tokens[ip - 1], "Only instances have properties"
+                    )
+                slot, method = cache.lookup(instance._shape)
+                if slot is not None:
+                    stack[-1] = instance._values[slot]
+                    stack.append(_NO_RECEIVER)
+                    continue
+                if method is None:
+                    # Let the instance report the error exactly as usual.
+                    instance.get(chunk.tokens[ip - 1])
+                stack[-1] = method
+                stack.append(instance)
+            elif op == _LOAD_SUPER_METHOD:
+                superclass = stack.pop()
+                cache = constants[code[ip]]
+                ip += 1
+                method = cache.lookup(superclass)
+                if method is None:
+                    raise errors.RuntimeError(
+                        chunk.tokens[ip - 1], f"Undefined property '{cache.name}'."
+                    )
+                stack.append(stack[-1])
+                stack[-2] = method
+            elif op == _GET_SUPER:
+                superclass = stack.pop()
+                cache = constants[code[ip]]
+                ip += 1
+                method = cache.lookup(superclass)
+                if method is None:
+                    raise errors.RuntimeError(
+                        chunk.tokens[ip - 1], f"Undefined property '{cache.name}'."
+                    )
+                stack[-1] = BoundMethod(stack[-1], method)
+            elif op == _EQUAL:
+                b = stack.pop()
+                stack[-1] = stack[-1] == b
+            elif op == _NOT_EQUAL:
+                b = stack.pop()
+                stack[-1] = stack[-1] != b
+            elif op == _GREATER:
+                b = stack.pop()
+                a = stack[-1]
+                if type(a) is not float or type(b) is not float:
+                    raise self._number_error(chunk, ip)
+                stack[-1] = a > b
+            elif op == _GREATER_EQUAL:
+                b = stack.pop()
+                a = stack[-1]
+                if type(a) is not float or type(b) is not float:
+                    raise self._number_error(chunk, ip)
+                stack[-1] = a >= b
+            elif op == _LESS_EQUAL:
+                b = stack.pop()
+                a = stack[-1]
+                if type(a) is not float or type(b) is not float:
+                    raise self._number_error(chunk, ip)
+                stack[-1] = a <= b
+            elif op == _MULTIPLY:
+                b = stack.pop()
+                a = stack[-1]
+                if type(a) is not float or type(b) is not float:
+                    raise self._number_error(chunk, ip)
+                stack[-1] = a * b
+            elif op == _DIVIDE:
+                b = stack.pop()
+                a = stack[-1]
+                if type(a) is not float or type(b) is not float:
+                    raise self._number_error(chunk, ip)
+                stack[-1] = a / b
+            elif op == _NOT:
+                value = stack[-1]
+                stack[-1] = value is None or value is False
+            elif op == _NEGATE:
+                value = stack[-1]
+                if type(value) is not float:
+                    raise self._number_error(chunk, ip)
+                stack[-1] = -value
+            elif op == _PRINT:
+                print(stringify(stack.pop()))
+            elif op == _CLOSURE:
+                function = constants[code[ip]]
+                ip += 1
+                captured = []
+                for _ in range(function.upvalue_count):
+                    is_local = code[ip]
+                    index = code[ip + 1]
+                    ip += 2
+                    if is_local:
+                        captured.append(self._capture_upvalue(base + index))
+                    else:
+                        captured.append(upvalues[index])
+                stack.append(Closure(function, captured))
+            elif op == _CLOSE_UPVALUE:
+                self._close_upvalues(len(stack) - 1)
+                stack.pop()
+            elif op == _CLASS:
+                proto = constants[code[ip]]
+                ip += 1
+                methods = {}
+                for name in reversed(proto.methods):
+                    methods[name] = stack.pop()
+                superclass = None
+                if proto.has_superclass:
+                    superclass = stack.pop()
+                    if not isinstance(superclass, loxclass.LoxClass):
+                        raise errors.RuntimeError(
+                            chunk.tokens[ip - 1], "Superclass must be a class."
+                        )
+                stack.append(loxclass.LoxClass(proto.name, superclass, methods))
+            else:
+                raise AssertionError(f"Unknown opcode {op}")
+
+    def _call_value(
+        self, callee: typing.Any, argc: int, paren: tokens.Token
+    ) -> Closure | None:
+        """Prepare a call to anything but a plain closure.
+
+        Returns the closure that should get a new frame, or None when the call
+        has already completed and its result has been pushed.
+        """
+        slot = len(self._stack) - 1 - argc
+        if isinstance(callee, BoundMethod):
+            self._stack[slot] = callee.receiver
+            return callee.method
+
+        if isinstance(callee, loxclass.LoxClass):
+            self._stack[slot] = loxinstance.LoxInstance(callee)
+            if callee._initializer is not None:
+                return callee._initializer
+            if argc != 0:
+                raise errors.RuntimeError(
+                    paren, f"Expected 0 arguments but got {argc}."
+                )
+            return None
+
+        if not callable(getattr(callee, "call", None)):
+            raise errors.RuntimeError(paren, "Can only call functions and classes.")
+        if argc != callee.arity():
+            raise errors.RuntimeError(
+                paren, f"Expected {callee.arity()} arguments but got {argc}."
+            )
+
+        arguments = self._stack[slot + 1 :]
+        del self._stack[slot:]
+        self._stack.append(callee.call(self, arguments))
+        return None
+
+    def _capture_upvalue(self, index: int) -> Upvalue:
+        upvalue = self._open_upvalues.get(index)
+        if upvalue is None:
+            upvalue = Upvalue(self._stack, index)
+            self._open_upvalues[index] = upvalue
+        return upvalue
+
+    def _close_upvalues(self, last: int):
+        for index in [index for index in self._open_upvalues if index >= last]:
+            self._open_upvalues.pop(index).close()
+
+    def _number_error(self, chunk: compiler.Chunk, ip: int) -> errors.RuntimeError:
+        return errors.RuntimeError(chunk.tokens[ip - 1], "Operands must be numbers.")